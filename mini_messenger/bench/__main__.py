@@ -0,0 +1,4 @@
+# python -m mini_messenger.bench — нагрузочный прогон (см. load.py)
+from mini_messenger.bench.load import main
+
+main()
@@ -0,0 +1,119 @@
+"""Кластерный прогон: несколько MiniServer в одном процессе с общим Redis.
+
+Создатель группы подключается к первому узлу, остальные участники
+равномерно распределены по всем узлам (WebSocket). Сообщения
+отправляются с первого узла; для каждого узла печатается задержка
+доставки (p50/p99/max) и счётчики маршрутизатора.
+
+    python -m mini_messenger.bench.cluster --url redis://localhost:6379/15 --nodes 3
+    python -m mini_messenger.bench.cluster --fake   # нужен пакет fakeredis
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import websockets
+
+from mini_messenger.server.server import MiniServer
+
+CHAT_ID = 4242
+
+
+def _use_fakeredis():
+    # все узлы получают клиентов одного FakeServer вместо redis-server
+    import fakeredis
+    import redis.asyncio
+
+    server = fakeredis.FakeServer()
+
+    def from_url(url, **kwargs):
+        return fakeredis.FakeAsyncRedis(server=server, **kwargs)
+    redis.asyncio.from_url = from_url
+
+
+def _percentile(samples: list, p: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+async def _receiver(ws, node: int, latencies: dict, expected: int, done: asyncio.Event):
+    async for raw in ws:
+        msg = json.loads(raw)
+        sent_at = float(msg['text'].split()[1])
+        samples = latencies.setdefault(node, [])
+        samples.append(time.perf_counter() - sent_at)
+        if sum(len(s) for s in latencies.values()) >= expected:
+            done.set()
+
+
+async def _run(args):
+    servers = []
+    for i in range(args.nodes):
+        server = MiniServer(host='127.0.0.1', port=args.port + i, ws_port=args.ws_port + i,
+                            redis_url=args.url)
+        servers.append(server)
+        asyncio.create_task(server.start())
+    await asyncio.sleep(0.5)
+
+    sender = await websockets.connect(f"ws://127.0.0.1:{args.ws_port}")
+    await sender.send(json.dumps({'action': 'create', 'chat_id': CHAT_ID, 'name': 'bench'}))
+    await asyncio.sleep(0.2)
+
+    members = []
+    for i in range(args.members):
+        node = i % args.nodes
+        ws = await websockets.connect(f"ws://127.0.0.1:{args.ws_port + node}")
+        await ws.send(json.dumps({'action': 'join', 'chat_id': CHAT_ID}))
+        members.append((node, ws))
+    # подписки узлов применяются асинхронно
+    await asyncio.sleep(0.5)
+
+    latencies = {}
+    done = asyncio.Event()
+    expected = args.messages * args.members
+    tasks = [asyncio.create_task(_receiver(ws, node, latencies, expected, done))
+             for node, ws in members]
+    start = time.perf_counter()
+    for i in range(args.messages):
+        await sender.send(json.dumps({'chat_id': CHAT_ID, 'text': f"{i} {time.perf_counter()}"}))
+        await asyncio.sleep(1 / args.rate)
+    try:
+        await asyncio.wait_for(done.wait(), timeout=10)
+    except asyncio.TimeoutError:
+        print("! не все сообщения доставлены")
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.nodes} nodes, {args.members} members, {args.messages} messages "
+          f"at {args.rate}/s, {elapsed:.1f} s")
+    for node in range(args.nodes):
+        samples = sorted(s * 1000 for s in latencies.get(node, []))
+        if not samples:
+            print(f"  node {node}: нет доставок")
+            continue
+        kind = 'local' if node == 0 else 'cross-node'
+        print(f"  node {node} ({kind:>10}): {len(samples):6} delivered  "
+              f"p50 {_percentile(samples, 0.5):7.2f} ms  p99 {_percentile(samples, 0.99):7.2f} ms  "
+              f"max {samples[-1]:7.2f} ms  router {servers[node].router.stats()}")
+
+    for task in tasks:
+        task.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='redis://localhost:6379/15')
+    parser.add_argument('--fake', action='store_true', help='fakeredis вместо redis-server')
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--members', type=int, default=30)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--rate', type=float, default=200.0, help='сообщений в секунду')
+    parser.add_argument('--port', type=int, default=19100)
+    parser.add_argument('--ws-port', type=int, default=19200)
+    args = parser.parse_args()
+    if args.fake:
+        _use_fakeredis()
+    asyncio.run(_run(args))
+
+
+if __name__ == '__main__':
+    main()
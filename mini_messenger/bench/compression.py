@@ -0,0 +1,103 @@
+"""Бенчмарк стратегий сжатия payload на корпусе сообщений чата.
+
+Для каждой стратегии печатает суммарный размер после сжатия (ratio =
+сжатые / исходные байты), долю сообщений, ставших длиннее, и время
+сжатия и распаковки в мкс на сообщение (CPU одного потока):
+
+* legacy — прежний Packet: zlib level 1 для всего длиннее 64 байт;
+* adaptive — Compressor без словаря (только deflate, уровень по размеру);
+* dict — Compressor со встроенным словарём CHAT_DICTIONARY;
+* trained — Compressor со словарём, обученным train_dictionary() на
+  чётных строках корпуса (все стратегии меряются на нечётных).
+
+Корпус — mini_messenger/bench/chat_corpus.txt (по сообщению в строке),
+свой можно передать в ``--corpus``.
+
+    python -m mini_messenger.bench.compression --repeat 200
+"""
+import argparse
+import os
+import time
+import zlib
+
+from mini_messenger.protocol.compression import Compressor, train_dictionary
+from mini_messenger.protocol.types import PacketFlag
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'chat_corpus.txt')
+
+
+class _Legacy:
+    # Packet до адаптивного сжатия
+    def compress(self, flags: int, payload: bytes) -> tuple:
+        if len(payload) > 64:
+            return flags | PacketFlag.COMPRESSED, zlib.compress(payload, level=1)
+        return flags, payload
+
+    def decompress(self, flags: int, payload: bytes) -> bytes:
+        return zlib.decompress(payload)
+
+
+def _measure(name: str, codec, messages: list, repeat: int):
+    packed = [codec.compress(0, m) for m in messages]
+    for (flags, out), original in zip(packed, messages):
+        if flags & PacketFlag.COMPRESSED:
+            assert codec.decompress(flags, out) == original
+
+    start = time.process_time()
+    for _ in range(repeat):
+        for m in messages:
+            codec.compress(0, m)
+    compress_us = (time.process_time() - start) / (repeat * len(messages)) * 1e6
+
+    compressed = [(f, out) for f, out in packed if f & PacketFlag.COMPRESSED]
+    start = time.process_time()
+    for _ in range(repeat):
+        for flags, out in compressed:
+            codec.decompress(flags, out)
+    decompress_us = (time.process_time() - start) / (repeat * len(messages)) * 1e6
+
+    raw = sum(len(m) for m in messages)
+    out = sum(len(p) for _, p in packed)
+    grown = sum(len(p) > len(m) for (_, p), m in zip(packed, messages))
+    print(f"  {name:<9} {out:8} / {raw} байт  ratio {out / raw:5.3f}  "
+          f"длиннее исходного {grown / len(messages):6.1%}  "
+          f"сжатие {compress_us:6.2f} мкс  распаковка {decompress_us:6.2f} мкс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', default=CORPUS)
+    parser.add_argument('--repeat', type=int, default=100, help='проходов по корпусу при замере')
+    parser.add_argument('--dict-size', type=int, default=2048)
+    parser.add_argument('--large', type=int, default=256 * 1024,
+                        help='размер склеенного «большого» сообщения (0 — без него)')
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding='utf-8') as f:
+        lines = [line.rstrip('\n') for line in f if line.strip()]
+    train, test = lines[0::2], lines[1::2]
+    messages = [line.encode('utf-8') for line in test]
+    trained = train_dictionary(train, args.dict_size)
+
+    strategies = (
+        ('legacy', _Legacy()),
+        ('adaptive', Compressor(codecs=(Compressor.DEFLATE,))),
+        ('dict', Compressor()),
+        ('trained', Compressor(dictionary=trained)),
+    )
+    sizes = sorted(len(m) for m in messages)
+    print(f"{len(messages)} сообщений (медиана {sizes[len(sizes) // 2]} байт, "
+          f"макс {sizes[-1]}), обученный словарь {len(trained)} байт")
+    for name, codec in strategies:
+        _measure(name, codec, messages, args.repeat)
+
+    if args.large:
+        blob = '\n'.join(lines).encode('utf-8')
+        large = [(blob * (args.large // len(blob) + 1))[:args.large]]
+        print(f"одно сообщение {args.large} байт (вставленная переписка):")
+        for name, codec in strategies:
+            _measure(name, codec, large, max(1, args.repeat // 10))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Микробенчмарк E2EE: ECDH и шифр на каждое сообщение против SessionCache.
+
+Однопоточно (одно ядро) расшифровывает ``--messages`` сообщений от
+``--peers`` собеседников по кругу, как сервер в _handle_frame, и
+шифрует их, как клиент в encrypt_for_chat. legacy — прежний путь
+(derive_shared_secret + новый ChaCha20Poly1305 на сообщение), cached —
+SessionCache на сервере и готовый шифр чата в Session.
+
+    python -m mini_messenger.bench.e2ee --messages 200000 --peers 100
+"""
+import argparse
+import os
+import time
+
+from mini_messenger.client.session import Session
+from mini_messenger.crypto.e2ee import E2EE
+from mini_messenger.crypto.keys import KeyManager
+from mini_messenger.crypto.sessions import SessionCache
+from mini_messenger.protocol.types import ChatType
+
+
+def _setup(args):
+    # пары (ключ сервера для пользователя, клиентская сессия с чатом chat_id == i)
+    peers = []
+    for i in range(args.peers):
+        server_private, server_public = KeyManager.generate_keypair()
+        session = Session()
+        session.chat_list[i] = {'name': f"p{i}", 'type': ChatType.PRIVATE}
+        session.init_e2ee(i, server_public)
+        peers.append((server_private, session))
+    plaintext = os.urandom(args.size)
+    packets = [E2EE.encrypt(plaintext, session.keys[i]) for i, (_, session) in enumerate(peers)]
+    return peers, plaintext, packets
+
+
+def _rate(name: str, count: int, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<22} {count / elapsed:12,.0f} msg/s")
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200_000)
+    parser.add_argument('--peers', type=int, default=100)
+    parser.add_argument('--size', type=int, default=256, help='размер открытого текста, байт')
+    parser.add_argument('--cache-size', type=int, default=4096)
+    args = parser.parse_args()
+
+    peers, plaintext, packets = _setup(args)
+    n, count = args.peers, args.messages
+    print(f"{count} сообщений по {args.size} байт, {n} собеседников, одно ядро")
+
+    def legacy_decrypt():
+        for i in range(count):
+            server_private, session = peers[i % n]
+            secret = KeyManager.derive_shared_secret(server_private, session.public_key)
+            E2EE.decrypt(packets[i % n], secret)
+
+    cache = SessionCache(args.cache_size)
+
+    def cached_decrypt():
+        for i in range(count):
+            server_private, session = peers[i % n]
+            cache.decrypt(server_private, session.public_key, packets[i % n], owner=i % n)
+
+    def legacy_encrypt():
+        for i in range(count):
+            E2EE.encrypt(plaintext, peers[i % n][1].keys[i % n])
+
+    def cached_encrypt():
+        for i in range(count):
+            peers[i % n][1].encrypt_for_chat(i % n, plaintext)
+
+    print("сервер, расшифровка:")
+    before = _rate('legacy (ECDH/msg)', count, legacy_decrypt)
+    after = _rate('SessionCache', count, cached_decrypt)
+    print(f"  ускорение x{after / before:.1f}, кеш {cache.stats()}")
+    print("клиент, шифрование:")
+    before = _rate('legacy (cipher/msg)', count, legacy_encrypt)
+    after = _rate('cipher per chat', count, cached_encrypt)
+    print(f"  ускорение x{after / before:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Бенчмарк рассылки: полный обход соединений против индекса подписок.
+
+10k простаивающих TCP-соединений (фиктивные writer'ы без сокетов),
+группы по 100 участников. Печатает задержку доставки одного сообщения
+(p50/p99/max) для старого обхода всех соединений и для FanoutIndex
+с исходящими очередями. ``--slow`` добавляет в каждую группу получателей
+с медленным drain(), задержка считается по остальным.
+
+    python -m mini_messenger.bench.fanout --connections 10000 --group 100
+    python -m mini_messenger.bench.fanout --slow 2 --messages 200
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from mini_messenger.server.server import MiniServer
+from mini_messenger.server.connections import ConnectionRegistry
+from mini_messenger.server.outbound import OutboundQueue
+from mini_messenger.protocol.packet import Packet
+from mini_messenger.protocol.types import MessageType, ChatType
+
+
+class _Probe:
+    """Считает доставки здоровым получателям текущего сообщения."""
+
+    def __init__(self):
+        self.remaining = 0
+        self.done = asyncio.Event()
+
+    def arm(self, expected: int):
+        self.remaining = expected
+        self.done.clear()
+        if not expected:
+            self.done.set()
+
+    def hit(self):
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.done.set()
+
+
+class _Transport:
+    def abort(self):
+        pass
+
+
+class _Writer:
+    """Минимальная замена StreamWriter; delay > 0 — получатель с плохой связью."""
+
+    transport = _Transport()
+
+    def __init__(self, probe: _Probe, delay: float = 0.0):
+        self.probe = probe
+        self.delay = delay
+        self.sent = 0
+
+    def write(self, data):
+        self.sent += len(data)
+        if not self.delay:
+            self.probe.hit()
+
+    async def drain(self):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+
+async def _indexed_broadcast(server: MiniServer, chat_id: int, data: bytes, exclude=None):
+    server._broadcast(chat_id, data, exclude=exclude)
+
+
+async def _legacy_broadcast(server: MiniServer, chat_id: int, data: bytes, exclude=None):
+    # копия прежнего MiniServer._broadcast
+    members = server.storage.chats[chat_id]['members']
+    for writer, c in server.connections.by_conn.items():
+        if writer != exclude and c.user_id in members:
+            try:
+                writer.write(data)
+                await writer.drain()
+            except: pass
+
+
+def _setup(args, probe: _Probe) -> tuple[MiniServer, list]:
+    server = MiniServer(send_queue_size=args.queue, overflow_policy=args.policy)
+    connections, group = args.connections, args.group
+    writers = []
+    for i in range(connections):
+        # первые args.slow участников каждой группы — с плохой связью
+        slow = 0 < i % group <= args.slow
+        writer = _Writer(probe, args.delay / 1000 if slow else 0.0)
+        c = server.connections.add(writer, ConnectionRegistry.TCP)
+        c.outbound = server._tcp_queue(writer, c.user_id)
+        writers.append(writer)
+    chats = []
+    for chat_id in range(connections // group):
+        members = writers[chat_id * group:(chat_id + 1) * group]
+        server.storage.chats[chat_id] = {
+            'type': ChatType.GROUP, 'name': f"Chat_{chat_id}",
+            'members': {server.connections.by_conn[w].user_id for w in members},
+            'admin': None
+        }
+        for writer in members:
+            server.tcp_index.subscribe(chat_id, writer)
+        healthy = sum(1 for w in members[1:] if not w.delay)
+        chats.append((chat_id, members[0], healthy))
+    return server, chats
+
+
+def _percentile(samples: list, p: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+async def _measure(broadcast, server: MiniServer, chats: list, probe: _Probe,
+                   messages: int) -> list:
+    data = Packet.pack(0, MessageType.TEXT, ChatType.GROUP, 0, b'x' * 48)
+    samples = []
+    for _ in range(messages):
+        chat_id, sender, healthy = random.choice(chats)
+        probe.arm(healthy)
+        start = time.perf_counter()
+        await broadcast(server, chat_id, data, exclude=sender)
+        # задержка — до записи во все сокеты здоровых получателей
+        await probe.done.wait()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples
+
+
+def _report(name: str, samples: list):
+    us = [s * 1e6 for s in samples]
+    print(f"{name:>8}: p50 {_percentile(us, 0.5):9.1f} µs  p99 {_percentile(us, 0.99):9.1f} µs  "
+          f"max {us[-1]:9.1f} µs  ({len(us) / sum(samples):,.0f} msg/s)")
+
+
+async def _run(args):
+    probe = _Probe()
+    server, chats = _setup(args, probe)
+    print(f"{args.connections} connections, {len(chats)} chats x {args.group} members "
+          f"({args.slow} slow, {args.delay} ms drain), {args.messages} messages")
+    _report('legacy', await _measure(_legacy_broadcast, server, chats, probe, args.messages))
+    _report('index', await _measure(_indexed_broadcast, server, chats, probe, args.messages))
+    print(f"outbound: {server.outbound_stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=10_000)
+    parser.add_argument('--group', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=2_000)
+    parser.add_argument('--slow', type=int, default=0,
+                        help='получателей с плохой связью в каждой группе')
+    parser.add_argument('--delay', type=float, default=50.0,
+                        help='задержка drain() медленного получателя, мс')
+    parser.add_argument('--queue', type=int, default=256, help='high-water исходящей очереди')
+    parser.add_argument('--policy', default=OutboundQueue.DROP_OLDEST,
+                        choices=OutboundQueue.POLICIES)
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Бенчмарк разбора TCP-потока: старый путь чтения против FrameDecoder.
+
+Старый путь: readexactly(заголовок) + чтение остатка + склейка
+``header + rest`` и Packet.unpack на каждый кадр. Новый: один read() на
+много кадров и FrameDecoder.feed() со срезами memoryview.
+
+    python -m mini_messenger.bench.framing --frames 200000 --size 120
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from mini_messenger.protocol.packet import Packet
+from mini_messenger.protocol.framing import FrameDecoder
+from mini_messenger.protocol.types import PacketFlag, MessageType, ChatType
+
+READ_SIZE = 64 * 1024
+
+
+def _make_stream(count: int, size: int) -> bytes:
+    # зашифрованные сообщения не сжимаются, размер кадра стабилен
+    payload = os.urandom(size)
+    frame = Packet.pack(PacketFlag.ENCRYPTED, MessageType.TEXT, ChatType.GROUP, 1, payload)
+    return frame * count
+
+
+def _reader_for(stream: bytes) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader(limit=len(stream) + 1)
+    # кормим кусками размера сокетного чтения, как это делает транспорт
+    for i in range(0, len(stream), READ_SIZE):
+        reader.feed_data(stream[i:i + READ_SIZE])
+    reader.feed_eof()
+    return reader
+
+
+async def _legacy(reader: asyncio.StreamReader) -> tuple[int, int]:
+    frames = copied = 0
+    while True:
+        try:
+            header = await reader.readexactly(Packet.HEADER_SIZE)
+        except asyncio.IncompleteReadError:
+            break
+        rest = await reader.readexactly(Packet.frame_size(header) - Packet.HEADER_SIZE)
+        data = header + rest
+        payload = Packet.unpack(data)[4]
+        # header, rest, header + rest и срез payload — четыре копии
+        copied += len(header) + len(rest) + len(data) + len(payload)
+        frames += 1
+    return frames, copied
+
+
+async def _decoder(reader: asyncio.StreamReader) -> tuple[int, int]:
+    decoder = FrameDecoder()
+    frames = copied = 0
+    while True:
+        data = await reader.read(READ_SIZE)
+        if not data:
+            break
+        copied += len(data)
+        for frame in decoder.feed(data):
+            Packet.unpack(frame)
+            frames += 1
+    return frames, copied + decoder.bytes_copied
+
+
+async def _timed(impl, stream: bytes) -> tuple[int, int, float]:
+    reader = _reader_for(stream)
+    start = time.perf_counter()
+    frames, copied = await impl(reader)
+    return frames, copied, time.perf_counter() - start
+
+
+def _run(name: str, impl, stream: bytes):
+    frames, copied, elapsed = asyncio.run(_timed(impl, stream))
+    print(f"{name:>8}: {frames / elapsed:12,.0f} frames/s  "
+          f"{copied / frames:8.1f} bytes copied/frame  ({frames} frames)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=200_000)
+    parser.add_argument('--size', type=int, default=120, help='размер payload, байт')
+    args = parser.parse_args()
+
+    stream = _make_stream(args.frames, args.size)
+    print(f"frame = {Packet.HEADER_SIZE} + {args.size} bytes, stream = {len(stream)} bytes")
+    _run('legacy', _legacy, stream)
+    _run('decoder', _decoder, stream)
+
+
+if __name__ == '__main__':
+    main()
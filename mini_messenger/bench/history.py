@@ -0,0 +1,70 @@
+"""Бенчмарк памяти истории: список dict на чат против HistoryStore.
+
+Пишет ``--messages`` сообщений в ``--chats`` чатов и печатает байты
+на хранимое сообщение (tracemalloc, без учёта самих payload) и время
+записи. Лимит HistoryStore подобран так, чтобы сохранилось всё.
+
+    python -m mini_messenger.bench.history --messages 1000000
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+from mini_messenger.server.history import HistoryStore
+
+
+def _payloads(count: int, size: int) -> list:
+    # payload создаются заранее и не входят в замер: их хранят оба варианта
+    return [os.urandom(size) for _ in range(count)]
+
+
+def _legacy(args, senders: list, payloads: list):
+    # прежний InMemoryStorage: chats[chat_id]['messages'] — list of dict
+    chats = {chat_id: {'messages': []} for chat_id in range(args.chats)}
+    for i, data in enumerate(payloads):
+        chats[i % args.chats]['messages'].append({
+            'from': senders[i % len(senders)],
+            'data': data,
+            'encrypted': False
+        })
+    return chats
+
+
+def _store(args, senders: list, payloads: list):
+    history = HistoryStore(max_messages=-(-args.messages // args.chats))
+    for i, data in enumerate(payloads):
+        history.append(i % args.chats, senders[i % len(senders)], data)
+    return history
+
+
+def _measure(name: str, impl, args, senders: list, payloads: list):
+    tracemalloc.start()
+    start = time.perf_counter()
+    keep = impl(args, senders, payloads)
+    elapsed = time.perf_counter() - start
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>8}: {used / args.messages:7.1f} bytes/message  "
+          f"{args.messages / elapsed:12,.0f} appends/s")
+    del keep
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--senders', type=int, default=1_000)
+    parser.add_argument('--size', type=int, default=64, help='размер payload, байт')
+    args = parser.parse_args()
+
+    senders = [f"user_{i}" for i in range(args.senders)]
+    payloads = _payloads(args.messages, args.size)
+    print(f"{args.messages} messages, {args.chats} chats, {args.senders} senders, "
+          f"payload {args.size} bytes (+{payloads[0].__sizeof__()} bytes/object not counted)")
+    _measure('legacy', _legacy, args, senders, payloads)
+    _measure('history', _store, args, senders, payloads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""Память сервера на простаивающее соединение (RSS), TCP и WebSocket.
+
+Для каждого транспорта сервер запускается отдельным процессом, затем
+``--procs`` процессов-клиентов открывают вместе ``--connections``
+соединений (не больше ``--concurrency`` одновременных подключений на
+процесс) и молчат. TCP-клиент ждёт KEY_EX, WS-клиент — ответ на
+рукопожатие (подпротокол JSON или ``--packet``; ``--deflate`` предлагает
+permessage-deflate) и отвечает на ping сервера. Клиенты — сырые сокеты с
+адресов 127.0.0.2, 127.0.0.3, ... (по 20 000 на адрес), чтобы хватило
+эфемерных портов.
+
+Печатается прирост RSS сервера на соединение после ``--hold`` секунд
+простоя. Для 100k соединений нужен лимит файловых дескрипторов выше
+100 000 (``ulimit -n``): бенчмарк поднимает мягкий лимит до жёсткого.
+
+    python -m mini_messenger.bench.idle --connections 100000 --procs 4
+    python -m mini_messenger.bench.idle --connections 10000 --transports ws --packet
+"""
+import argparse
+import asyncio
+import base64
+import multiprocessing
+import os
+import resource
+import struct
+import time
+
+from mini_messenger.bench.load import _rss, _wait_port
+from mini_messenger.protocol.types import MessageType
+from mini_messenger.server.server import MiniServer
+
+PER_ADDRESS = 20_000  # соединений с одного адреса-источника (эфемерные порты)
+
+
+def _raise_nofile(needed: int) -> int:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return min(needed, hard) if hard != resource.RLIM_INFINITY else needed
+
+
+def _serve(port: int, ws_port: int, connections: int, heartbeat: float):
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)  # без построчных логов подключений
+    _raise_nofile(connections + 256)
+    asyncio.run(MiniServer(host='127.0.0.1', port=port, ws_port=ws_port, metrics=False,
+                           heartbeat_interval=heartbeat).start())
+
+
+async def _tcp(port: int, source: str):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port, local_addr=(source, 0))
+    header = await reader.readexactly(12)
+    assert header[1] == MessageType.KEY_EX
+    return reader, writer, None
+
+
+def _handshake(args) -> bytes:
+    key = base64.b64encode(os.urandom(16)).decode()
+    protocol = MiniServer.WS_PACKET if args.packet else MiniServer.WS_JSON
+    lines = [
+        "GET / HTTP/1.1", f"Host: 127.0.0.1:{args.port + 1}", "Upgrade: websocket",
+        "Connection: Upgrade", f"Sec-WebSocket-Key: {key}", "Sec-WebSocket-Version: 13",
+        f"Sec-WebSocket-Protocol: {protocol}",
+    ]
+    if args.deflate:
+        lines.append("Sec-WebSocket-Extensions: permessage-deflate; client_max_window_bits")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+
+async def _ws(port: int, source: str, request: bytes):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port, local_addr=(source, 0))
+    writer.write(request)
+    response = await reader.readuntil(b"\r\n\r\n")
+    assert response.startswith(b"HTTP/1.1 101"), response[:64]
+    return reader, writer, True
+
+
+async def _idle(reader, writer, ws: bool):
+    # читаем всё, что шлёт сервер; на ping WS отвечаем pong (маска из нулей)
+    try:
+        while True:
+            if not ws:
+                if not await reader.read(4096):
+                    return
+                continue
+            b0, b1 = await reader.readexactly(2)
+            n = b1 & 0x7F
+            if n == 126:
+                n = struct.unpack('!H', await reader.readexactly(2))[0]
+            elif n == 127:
+                n = struct.unpack('!Q', await reader.readexactly(8))[0]
+            payload = await reader.readexactly(n)
+            if b0 & 0x0F == 0x9:
+                writer.write(bytes((0x8A, 0x80 | n)) + b'\0\0\0\0' + payload)
+    except (OSError, asyncio.IncompleteReadError):
+        return
+
+
+def _clients(args, transport: str, index: int, count: int, ready, done):
+    _raise_nofile(count + 64)
+
+    async def run():
+        gate = asyncio.Semaphore(args.concurrency)
+        request = _handshake(args)
+        conns = []
+
+        async def connect(i: int):
+            n = index + i * args.procs  # сквозной номер соединения
+            source = f"127.0.0.{2 + n // PER_ADDRESS}"
+            async with gate:
+                if transport == 'tcp':
+                    conns.append(await _tcp(args.port, source))
+                else:
+                    conns.append(await _ws(args.port + 1, source, request))
+
+        await asyncio.gather(*(connect(i) for i in range(count)))
+        readers = [asyncio.create_task(_idle(*c)) for c in conns]
+        ready.put(len(conns))
+        await asyncio.get_running_loop().run_in_executor(None, done.wait)
+        for task in readers:
+            task.cancel()
+        for _, writer, _ in conns:
+            writer.transport.abort()
+
+    asyncio.run(run())
+
+
+def _round(args, transport: str) -> dict:
+    ctx = multiprocessing.get_context('spawn')
+    server = ctx.Process(target=_serve, daemon=True,
+                         args=(args.port, args.port + 1, args.connections, args.heartbeat))
+    server.start()
+    clients = []
+    try:
+        _wait_port('127.0.0.1', args.port + (transport != 'tcp'))
+        time.sleep(args.settle)  # запас ключей заполнен, RSS устоялся
+        before = _rss(server.pid)
+        ready, done = ctx.Queue(), ctx.Event()
+        share = args.connections // args.procs
+        start = time.perf_counter()
+        for i in range(args.procs):
+            count = share + (i < args.connections % args.procs)
+            p = ctx.Process(target=_clients, args=(args, transport, i, count, ready, done),
+                            daemon=True)
+            p.start()
+            clients.append(p)
+        connected = sum(ready.get(timeout=args.timeout) for _ in clients)
+        elapsed = time.perf_counter() - start
+        time.sleep(args.hold)
+        after = _rss(server.pid)
+        done.set()
+        return {'connected': connected, 'seconds': elapsed,
+                'per_conn': (after - before) / connected, 'rss': after}
+    finally:
+        for p in clients:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
+        server.terminate()
+        server.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=100_000)
+    parser.add_argument('--transports', default='tcp,ws', help='через запятую: tcp, ws')
+    parser.add_argument('--packet', action='store_true', help='WS-подпротокол кадров Packet')
+    parser.add_argument('--deflate', action='store_true', help='WS-клиенты предлагают deflate')
+    parser.add_argument('--procs', type=int, default=4, help='процессов-клиентов')
+    parser.add_argument('--concurrency', type=int, default=500,
+                        help='одновременных подключений на процесс')
+    parser.add_argument('--heartbeat', type=float, default=20.0, help='heartbeat_interval сервера, с')
+    parser.add_argument('--hold', type=float, default=5.0, help='простой перед замером, с')
+    parser.add_argument('--settle', type=float, default=2.0, help='пауза после запуска сервера, с')
+    parser.add_argument('--timeout', type=float, default=600.0)
+    parser.add_argument('--port', type=int, default=19900)
+    args = parser.parse_args()
+
+    limit = _raise_nofile(args.connections + 256)
+    if limit < args.connections + 256:
+        print(f"лимит дескрипторов {limit}: поднимите ulimit -n выше {args.connections + 256}")
+        return
+
+    print(f"{args.connections} простаивающих соединений, {args.procs} процессов-клиентов:")
+    for i, transport in enumerate(args.transports.split(',')):
+        args.port += 10 * i
+        r = _round(args, transport)
+        name = transport
+        if transport == 'ws':
+            name += (' packet' if args.packet else ' json') + (' deflate' if args.deflate else '')
+        print(f"  {name:<18} {r['per_conn'] / 1024:7.2f} KiB RSS на соединение, "
+              f"RSS {r['rss'] / 2 ** 20:7.1f} MiB, подключение {r['connected'] / r['seconds']:6.0f}/s")
+
+
+if __name__ == '__main__':
+    main()
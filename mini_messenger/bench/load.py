@@ -0,0 +1,412 @@
+"""Нагрузочный прогон MiniServer по TCP и WebSocket с отчётом в JSON.
+
+Открывает ``--tcp`` клиентов MiniClient и ``--ws`` WebSocket-клиентов,
+создаёт через WS группы и каналы заданного размера и личные чаты пар
+TCP-клиентов (E2EE), затем ``--duration`` секунд шлёт ``--rate``
+сообщений в секунду. Доля ``--encrypted`` уходит в личные чаты
+зашифрованной, остальное — в группы (от случайного участника) и каналы
+(от их владельца). Размеры payload — смесь ``--sizes`` (размер:вес).
+
+Группа или канал целиком живут на одном транспорте: сервер не пересылает
+сообщения между TCP и WS. Задержка — от отправки до получения каждым
+участником (часы общие: клиенты в одном процессе). Сообщения, отправленные
+во время ``--warmup``, не учитываются.
+
+По умолчанию сервер запускается отдельным процессом (``--server spawn``),
+и в отчёт попадает его RSS: после подключения клиентов, пиковый и в
+конце. С ``--server external`` нагрузка идёт на уже запущенный сервер,
+RSS — по ``--pid``, если он задан.
+
+Результат — JSON (в stdout или ``--output``) с конфигурацией и версией
+(git), чтобы сравнивать прогоны между версиями; краткая сводка — в stderr.
+
+То же доступно как ``python -m mini_messenger.bench``:
+
+    python -m mini_messenger.bench --tcp 2000 --ws 1000 --rate 5000 --duration 30
+    python -m mini_messenger.bench --server external --pid 1234 --output run.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import random
+import socket
+import string
+import subprocess
+import sys
+import time
+
+import websockets
+
+from mini_messenger.client.client import MiniClient
+from mini_messenger.protocol.types import ChatType
+
+GROUP, CHANNEL, PRIVATE = 'group', 'channel', 'private'
+CONNECT_BATCH = 200  # одновременных подключений при разгоне
+
+
+def _percentiles(samples: list) -> dict:
+    if not samples:
+        return {'count': 0}
+    samples.sort()
+    n = len(samples)
+
+    def at(p):
+        return round(samples[min(n - 1, int(n * p))], 3)
+
+    return {'count': n, 'p50': at(0.5), 'p90': at(0.9), 'p99': at(0.99),
+            'p999': at(0.999), 'max': round(samples[-1], 3)}
+
+
+def _parse_sizes(spec: str) -> tuple:
+    sizes, weights = [], []
+    for item in spec.split(','):
+        size, _, weight = item.partition(':')
+        sizes.append(int(size))
+        weights.append(float(weight or 1))
+    return sizes, weights
+
+
+def _rss(pid: int | None) -> int | None:
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _version() -> str | None:
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True,
+                              text=True, cwd=os.path.dirname(__file__), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _serve(host: str, port: int, ws_port: int):
+    from mini_messenger.server.server import MiniServer
+
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)  # без построчных логов подключений
+    asyncio.run(MiniServer(host=host, port=port, ws_port=ws_port).start())
+
+
+def _wait_port(host: str, port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+class _Stats:
+    """Счётчики одной категории (tcp, ws, e2ee) за окно замера."""
+
+    def __init__(self):
+        self.sent = 0
+        self.sent_bytes = 0
+        self.expected = 0
+        self.delivered = 0
+        self.delivered_bytes = 0
+        self.send_errors = 0  # сервер закрыл соединение отправителя
+        self.latencies = []  # мс
+
+    def report(self, elapsed: float) -> dict:
+        return {
+            'sent': self.sent, 'expected': self.expected, 'delivered': self.delivered,
+            'lost': max(0, self.expected - self.delivered),
+            'send_errors': self.send_errors,
+            'sent_per_s': round(self.sent / elapsed, 1),
+            'delivered_per_s': round(self.delivered / elapsed, 1),
+            'sent_bytes_per_s': round(self.sent_bytes / elapsed),
+            'delivered_bytes_per_s': round(self.delivered_bytes / elapsed),
+            'latency_ms': _percentiles(self.latencies),
+        }
+
+
+class LoadRun:
+    def __init__(self, args):
+        self.args = args
+        self.sizes, self.weights = _parse_sizes(args.sizes)
+        self.rng = random.Random(args.seed)
+        self.filler = ''.join(self.rng.choices(string.ascii_letters + ' ' * 8, k=max(self.sizes)))
+        self.stats = {'tcp': _Stats(), 'ws': _Stats(), 'e2ee': _Stats()}
+        self.window = (float('inf'), float('inf'))  # [начало, конец) замера по времени отправки
+        self.tcp = []
+        self.ws = []
+        self.ws_readers = []
+        self.chats = []  # {'id', 'kind', 'transport', 'members'}
+
+    # --- получение ---
+
+    def _received(self, category: str, text: bytes | str):
+        sent_at = float(text[:text.index(' ' if isinstance(text, str) else b' ')])
+        if not self.window[0] <= sent_at < self.window[1]:
+            return
+        stats = self.stats[category]
+        stats.delivered += 1
+        stats.delivered_bytes += len(text)
+        stats.latencies.append((time.perf_counter() - sent_at) * 1000)
+
+    def _on_tcp(self, chat_id: int, payload):
+        self._received('e2ee' if chat_id in self.private_ids else 'tcp', bytes(payload))
+
+    async def _ws_reader(self, ws):
+        try:
+            async for raw in ws:
+                self._received('ws', json.loads(raw)['text'])
+        except websockets.ConnectionClosed:
+            pass
+
+    # --- подготовка ---
+
+    async def _connect(self):
+        a = self.args
+
+        async def tcp_client():
+            client = MiniClient(a.host, a.port, on_message=self._on_tcp, verbose=False)
+            await client.connect()
+            return client
+
+        for start in range(0, a.tcp, CONNECT_BATCH):
+            n = min(CONNECT_BATCH, a.tcp - start)
+            self.tcp += await asyncio.gather(*(tcp_client() for _ in range(n)))
+        url = f"ws://{a.host}:{a.ws_port}"
+        for start in range(0, a.ws, CONNECT_BATCH):
+            n = min(CONNECT_BATCH, a.ws - start)
+            self.ws += await asyncio.gather(*(websockets.connect(url, max_queue=None)
+                                              for _ in range(n)))
+        await asyncio.gather(*(c.keyed.wait() for c in self.tcp))
+
+    def _plan(self):
+        a = self.args
+        cursor = {'tcp': 0, 'ws': 0}
+        pools = {'tcp': len(self.tcp), 'ws': len(self.ws)}
+
+        def members(transport: str, size: int) -> list:
+            pool = pools[transport]
+            size = min(size, pool)
+            start = cursor[transport]
+            cursor[transport] = (start + size) % pool
+            return [(start + i) % pool for i in range(size)]
+
+        chat_id = a.first_chat
+        for kind, count, size in ((GROUP, a.groups, a.group_size),
+                                  (CHANNEL, a.channels, a.channel_size)):
+            for i in range(count):
+                # чаты поровну между транспортами, если есть оба
+                if pools['tcp'] and pools['ws']:
+                    transport = 'ws' if i % 2 else 'tcp'
+                else:
+                    transport = 'tcp' if pools['tcp'] else 'ws'
+                if pools[transport] < 2:
+                    continue
+                self.chats.append({'id': chat_id, 'kind': kind, 'transport': transport,
+                                   'members': members(transport, size)})
+                chat_id += 1
+        if pools['tcp'] >= 2:
+            for _ in range(a.private):
+                self.chats.append({'id': chat_id, 'kind': PRIVATE, 'transport': 'tcp',
+                                   'members': members('tcp', 2)})
+                chat_id += 1
+        self.private_ids = {c['id'] for c in self.chats if c['kind'] == PRIVATE}
+        self.private = [c for c in self.chats if c['kind'] == PRIVATE]
+        self.public = [c for c in self.chats if c['kind'] != PRIVATE]
+
+    async def _create(self):
+        types = {GROUP: ChatType.GROUP, CHANNEL: ChatType.CHANNEL, PRIVATE: ChatType.PRIVATE}
+        async with websockets.connect(f"ws://{self.args.host}:{self.args.ws_port}") as admin:
+            for chat in self.chats:
+                await admin.send(json.dumps({'action': 'create', 'chat_id': chat['id'],
+                                             'type': types[chat['kind']], 'name': chat['kind']}))
+            # на create сервер не отвечает: даём ему обработать очередь
+            await asyncio.sleep(0.2)
+
+        for chat in self.chats:
+            for m in chat['members']:
+                if chat['transport'] == 'tcp':
+                    client = self.tcp[m]
+                    await client.join(chat['id'], types[chat['kind']])
+                    if chat['kind'] == PRIVATE:
+                        client.session.init_e2ee(chat['id'], client.session.server_key)
+                else:
+                    await self.ws[m].send(json.dumps({'action': 'join', 'chat_id': chat['id']}))
+        self.ws_readers = [asyncio.create_task(self._ws_reader(ws)) for ws in self.ws]
+        await asyncio.sleep(0.5)
+
+    # --- отправка ---
+
+    def _pick(self) -> tuple:
+        if self.private and (not self.public or self.rng.random() < self.args.encrypted):
+            chat = self.rng.choice(self.private)
+        else:
+            chat = self.rng.choice(self.public)
+        if chat['kind'] == CHANNEL:
+            sender = chat['members'][0]  # в канал пишет только владелец
+        else:
+            sender = self.rng.choice(chat['members'])
+        return chat, sender
+
+    async def _send(self, chat: dict, sender: int):
+        size = self.rng.choices(self.sizes, self.weights)[0]
+        sent_at = time.perf_counter()
+        head = f"{sent_at:.6f} "
+        text = head + self.filler[:max(0, size - len(head))]
+        if chat['kind'] == PRIVATE:
+            category = 'e2ee'
+        else:
+            category = chat['transport']
+        stats = self.stats[category]
+        try:
+            if chat['transport'] == 'tcp':
+                await self.tcp[sender].send_message(chat['id'], text)
+            else:
+                await self.ws[sender].send(json.dumps({'chat_id': chat['id'], 'text': text}))
+        except (ConnectionError, websockets.ConnectionClosed):
+            stats.send_errors += 1
+            return
+        if self.window[0] <= sent_at < self.window[1]:
+            stats.sent += 1
+            stats.sent_bytes += len(text)
+            stats.expected += len(chat['members']) - 1
+
+    async def _drive(self, until: float):
+        # равномерный темп: за каждый тик досылаем то, что положено к этому моменту
+        start = time.perf_counter()
+        sent = 0
+        while (now := time.perf_counter()) < until:
+            due = int((now - start) * self.args.rate)
+            while sent < due:
+                await self._send(*self._pick())
+                sent += 1
+            await asyncio.sleep(0.001)
+        return sent / (time.perf_counter() - start)
+
+    async def _sample_rss(self, pid: int | None, peak: list):
+        while True:
+            rss = _rss(pid)
+            if rss is not None:
+                peak[0] = max(peak[0], rss)
+            await asyncio.sleep(0.5)
+
+    async def run(self, pid: int | None) -> dict:
+        a = self.args
+        started = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+        t0 = time.perf_counter()
+        await self._connect()
+        self._plan()
+        await self._create()
+        setup = time.perf_counter() - t0
+        rss_idle = _rss(pid)
+        peak = [rss_idle or 0]
+        sampler = asyncio.create_task(self._sample_rss(pid, peak))
+
+        begin = time.perf_counter()
+        self.window = (begin + a.warmup, begin + a.warmup + a.duration)
+        achieved = await self._drive(self.window[1])
+        await asyncio.sleep(a.grace)  # доставка сообщений, ещё находящихся в пути
+        sampler.cancel()
+        rss_end = _rss(pid)
+
+        for ws in self.ws:
+            await ws.close()
+        for client in self.tcp:
+            await client.close()
+        for task in self.ws_readers:
+            task.cancel()
+
+        total = _Stats()
+        for s in self.stats.values():
+            total.sent += s.sent
+            total.sent_bytes += s.sent_bytes
+            total.expected += s.expected
+            total.delivered += s.delivered
+            total.delivered_bytes += s.delivered_bytes
+            total.send_errors += s.send_errors
+            total.latencies += s.latencies
+        counts = {kind: sum(c['kind'] == kind for c in self.chats)
+                  for kind in (GROUP, CHANNEL, PRIVATE)}
+        return {
+            'version': _version(),
+            'started': started,
+            'config': vars(a),
+            'connections': {'tcp': len(self.tcp), 'ws': len(self.ws)},
+            'chats': counts,
+            'setup_s': round(setup, 3),
+            'achieved_rate': round(achieved, 1),
+            'total': total.report(a.duration),
+            'by_category': {name: s.report(a.duration) for name, s in self.stats.items()},
+            'server_rss': {'pid': pid, 'after_connect': rss_idle,
+                           'peak': peak[0] or None, 'end': rss_end},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', choices=('spawn', 'external'), default='spawn')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=19700)
+    parser.add_argument('--ws-port', type=int, default=19701)
+    parser.add_argument('--pid', type=int, default=None, help='pid внешнего сервера для RSS')
+    parser.add_argument('--tcp', type=int, default=1000, help='TCP-клиентов (MiniClient)')
+    parser.add_argument('--ws', type=int, default=500, help='WebSocket-клиентов')
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--group-size', type=int, default=20)
+    parser.add_argument('--channels', type=int, default=5)
+    parser.add_argument('--channel-size', type=int, default=200)
+    parser.add_argument('--private', type=int, default=100, help='личных чатов (пары TCP, E2EE)')
+    parser.add_argument('--rate', type=float, default=1000.0, help='сообщений в секунду')
+    parser.add_argument('--sizes', default='32:60,256:30,4096:9,65536:1',
+                        help='размеры payload с весами: размер:вес,...')
+    parser.add_argument('--encrypted', type=float, default=0.2,
+                        help='доля сообщений в личные чаты (E2EE)')
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--grace', type=float, default=2.0, help='ожидание доставки после замера')
+    parser.add_argument('--first-chat', type=int, default=500_000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help='файл для JSON (по умолчанию stdout)')
+    args = parser.parse_args()
+
+    server = None
+    pid = args.pid
+    if args.server == 'spawn':
+        server = multiprocessing.get_context('spawn').Process(
+            target=_serve, args=(args.host, args.port, args.ws_port), daemon=True)
+        server.start()
+        pid = server.pid
+        _wait_port(args.host, args.port)
+    try:
+        report = asyncio.run(LoadRun(args).run(pid))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    out = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(out + '\n')
+    else:
+        print(out)
+    total = report['total']
+    rss = report['server_rss']['peak']
+    print(f"{report['connections']} {report['chats']}: отправлено {total['sent_per_s']}/s, "
+          f"доставлено {total['delivered_per_s']}/s (потеряно {total['lost']}), "
+          f"p50 {total['latency_ms'].get('p50')} ms, p99 {total['latency_ms'].get('p99')} ms, "
+          f"RSS {rss / 2 ** 20 if rss else 0:.1f} MiB", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
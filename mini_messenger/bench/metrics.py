@@ -0,0 +1,139 @@
+"""Накладные расходы метрик: микробенчмарк и сквозной прогон.
+
+Сначала — стоимость одного вызова Counter.inc(), Histogram.observe(),
+Histogram.since() и выключенной заглушки в наносекундах. Затем сервер
+поднимается в этом процессе попеременно с metrics=True и metrics=False:
+``--senders`` сырых TCP-соединений шлют по ``--messages`` мелких
+сообщений в группу из ``--receivers`` участников, время — до доставки
+всех копий. Для каждого режима печатается медиана по ``--rounds``
+прогонам: процессорное время на сообщение (сервер и клиенты в одном
+процессе, клиентская часть в обоих режимах одинакова) и пропускная
+способность. Разница считается по процессорному времени: на общей
+машине оно стабильнее настенного.
+
+    python -m mini_messenger.bench.metrics --senders 10 --receivers 10 --messages 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import timeit
+
+from mini_messenger.protocol.framing import FrameDecoder
+from mini_messenger.protocol.packet import Packet
+from mini_messenger.protocol.types import ChatType, MessageType
+from mini_messenger.server.metrics import Metrics
+from mini_messenger.server.server import MiniServer
+
+CHAT_ID = 7
+
+
+def _micro():
+    m = Metrics()
+    counter = m.counter('c')
+    hist = m.histogram('h')
+    off = Metrics(enabled=False).histogram('h')
+    n = 1_000_000
+    start = time.perf_counter()
+    cases = (
+        ('Counter.inc()', lambda: counter.inc()),
+        ('Histogram.observe()', lambda: hist.observe(0.000123)),
+        ('Histogram.since()', lambda: hist.since(start)),
+        ('выключено: since()', lambda: off.since(start)),
+        ('пустой вызов', lambda: None),
+    )
+    for name, fn in cases:
+        ns = min(timeit.repeat(fn, number=n, repeat=3)) / n * 1e9
+        print(f"  {name:<22} {ns:6.1f} нс")
+
+
+async def _round(args, enabled: bool, port: int) -> tuple:
+    server = MiniServer(host='127.0.0.1', port=port, ws_port=port + 1, metrics=enabled,
+                        send_queue_size=10 ** 9)  # без потерь: считаем все копии
+    server.storage.save_chat(CHAT_ID, {'type': ChatType.GROUP, 'name': 'g',
+                                       'members': set(), 'admin': None})
+    serve = asyncio.create_task(server.start())
+    await asyncio.sleep(0.2)
+
+    expected = args.senders * args.messages * args.receivers
+    received = [0]
+    done = asyncio.Event()
+
+    async def receiver(reader):
+        decoder = FrameDecoder()
+        while data := await reader.read(1 << 20):
+            for frame in decoder.feed(data):
+                if frame[1] == MessageType.TEXT:
+                    received[0] += 1
+            if received[0] >= expected:
+                done.set()
+
+    conns = []
+    for _ in range(args.receivers):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(Packet.pack(0, MessageType.JOIN, ChatType.GROUP, CHAT_ID, b''))
+        conns.append((reader, writer))
+    senders = [await asyncio.open_connection('127.0.0.1', port) for _ in range(args.senders)]
+    await asyncio.sleep(0.2)
+    readers = [asyncio.create_task(receiver(r)) for r, _ in conns]
+    drains = [asyncio.create_task(_discard(r)) for r, _ in senders]
+
+    frame = Packet.pack(0, MessageType.TEXT, ChatType.GROUP, CHAT_ID, b'm' * args.size)
+    chunk = frame * 100
+
+    async def sender(writer):
+        for _ in range(args.messages // 100):
+            writer.write(chunk)
+            await writer.drain()
+
+    sent = args.senders * (args.messages // 100) * 100
+    start, cpu = time.perf_counter(), time.process_time()
+    await asyncio.gather(*(sender(w) for _, w in senders))
+    await asyncio.wait_for(done.wait(), 60)
+    cpu_us = (time.process_time() - cpu) / sent * 1e6
+    rate = sent / (time.perf_counter() - start)
+
+    for _, writer in conns + senders:
+        writer.close()
+    await asyncio.sleep(0.1)
+    for task in readers + drains:
+        task.cancel()
+    await server.stop()
+    serve.cancel()
+    return cpu_us, rate
+
+
+async def _discard(reader):
+    while await reader.read(1 << 16):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--senders', type=int, default=10)
+    parser.add_argument('--receivers', type=int, default=10)
+    parser.add_argument('--messages', type=int, default=2000, help='сообщений на отправителя')
+    parser.add_argument('--size', type=int, default=32)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--port', type=int, default=19900)
+    args = parser.parse_args()
+
+    print("стоимость вызова:")
+    _micro()
+
+    runs = {True: [], False: []}
+    for i in range(args.rounds):
+        for enabled in (False, True):  # попеременно, чтобы дрейф машины делился поровну
+            runs[enabled].append(asyncio.run(_round(args, enabled, args.port + 2 * (2 * i + enabled))))
+    print(f"{args.senders} отправителей x {args.messages} -> {args.receivers} получателей, "
+          f"медиана по {args.rounds} прогонам:")
+    cpu = {}
+    for enabled, name in ((False, 'выключены'), (True, 'включены')):
+        cpu[enabled] = statistics.median(c for c, _ in runs[enabled])
+        rate = statistics.median(r for _, r in runs[enabled])
+        print(f"  метрики {name + ':':<10} {cpu[enabled]:6.2f} мкс CPU на сообщение, {rate:8.0f} msg/s")
+    print(f"  накладные расходы: {(cpu[True] - cpu[False]) / cpu[False]:+.1%} CPU")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""Задержка цикла событий при смешанной нагрузке: мелкие и 1 МБ сообщения.
+
+Сервер запускается в этом же процессе дважды: всё в цикле
+(--threshold 0 => offload выключен) и с выносом zlib/шифрования в пул.
+Клиенты — сырые TCP-соединения с заранее упакованными кадрами, чтобы
+их собственная работа почти не нагружала общий цикл:
+
+* ``--big`` отправителей шлют зашифрованные 1 МБ сообщения в личный
+  чат (сервер расшифровывает, сжимает и пересылает получателю);
+* ``--small`` отправителей шлют мелкие сообщения в группу, получатель
+  меряет их задержку доставки.
+
+Пробник внутри цикла спит по 1 мс и записывает опоздание (loop lag).
+
+    python -m mini_messenger.bench.offload --size 1048576 --duration 5
+"""
+import argparse
+import asyncio
+import os
+import struct
+import time
+
+from mini_messenger.crypto.e2ee import E2EE
+from mini_messenger.crypto.keys import KeyManager
+from mini_messenger.protocol.framing import FrameDecoder
+from mini_messenger.protocol.packet import Packet
+from mini_messenger.protocol.types import ChatType, MessageType, PacketFlag
+from mini_messenger.server.server import MiniServer
+
+PRIVATE_CHAT = 1
+GROUP_CHAT = 2
+
+
+def _percentile(samples: list, p: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * p))] if samples else 0.0
+
+
+def _text(size: int) -> bytes:
+    # сжимаемый «текст», чтобы zlib работал как на реальных сообщениях
+    words = [os.urandom(4).hex().encode() for _ in range(512)]
+    out = bytearray()
+    i = 0
+    while len(out) < size:
+        out += words[(i * 7919) % len(words)] + b' '
+        i += 1
+    return bytes(out[:size])
+
+
+async def _connect(port: int):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    decoder = FrameDecoder()
+    while True:
+        frames = decoder.feed(await reader.read(65536))
+        if frames:
+            break
+    _, _, _, _, payload = Packet.unpack(frames[0])  # KEY_EX с ключом сервера
+    key_len = struct.unpack('!I', payload[:4])[0]
+    server_key = bytes(payload[4:4 + key_len])
+    private, public = KeyManager.generate_keypair()
+    writer.write(Packet.pack(PacketFlag.SYSTEM, MessageType.KEY_EX, 0, 0,
+                             struct.pack('!I', len(public)) + public))
+    return reader, writer, KeyManager.derive_shared_secret(private, server_key)
+
+
+async def _join(writer, chat_type: int, chat_id: int):
+    writer.write(Packet.pack(0, MessageType.JOIN, chat_type, chat_id, b''))
+    await writer.drain()
+
+
+async def _drain_reader(reader, on_frame=None):
+    decoder = FrameDecoder()
+    while True:
+        data = await reader.read(1 << 20)
+        if not data:
+            return
+        for frame in decoder.feed(data):
+            if on_frame:
+                on_frame(frame)
+
+
+async def _probe(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append((time.perf_counter() - start - 0.001) * 1000)
+
+
+async def _run(args, threshold: int, port: int) -> dict:
+    server = MiniServer(host='127.0.0.1', port=port, ws_port=port + 1,
+                        offload_threshold=threshold or None, offload_workers=args.workers)
+    server.storage.save_chat(PRIVATE_CHAT, {'type': ChatType.PRIVATE, 'name': 'p',
+                                            'members': set(), 'admin': None})
+    server.storage.save_chat(GROUP_CHAT, {'type': ChatType.GROUP, 'name': 'g',
+                                          'members': set(), 'admin': None})
+    serve = asyncio.create_task(server.start())
+    await asyncio.sleep(0.3)
+
+    big_text = _text(args.size)
+    big = [await _connect(port) for _ in range(args.big)]
+    big_frames = [Packet.pack(PacketFlag.ENCRYPTED, MessageType.TEXT, ChatType.PRIVATE,
+                              PRIVATE_CHAT, E2EE.encrypt(big_text, secret))
+                  for _, _, secret in big]
+    small = [await _connect(port) for _ in range(args.small)]
+    big_rx, small_rx = await _connect(port), await _connect(port)
+    await _join(big_rx[1], ChatType.PRIVATE, PRIVATE_CHAT)
+    await _join(small_rx[1], ChatType.GROUP, GROUP_CHAT)
+    await asyncio.sleep(0.2)
+
+    latencies = []
+
+    def on_small(frame):
+        _, _, _, _, payload = Packet.unpack(frame)
+        latencies.append((time.perf_counter() - struct.unpack('!d', payload[:8])[0]) * 1000)
+
+    readers = [asyncio.create_task(_drain_reader(big_rx[0])),
+               asyncio.create_task(_drain_reader(small_rx[0], on_small))]
+    readers += [asyncio.create_task(_drain_reader(r)) for r, _, _ in big + small]
+
+    stop = asyncio.Event()
+    lags = []
+    sent = {'big': 0, 'small': 0, 'lost': 0}
+
+    async def big_sender(writer, frame):
+        try:
+            while not stop.is_set():
+                writer.write(frame)
+                await writer.drain()
+                sent['big'] += 1
+                await asyncio.sleep(1 / args.big_rate)
+        except ConnectionError:
+            sent['lost'] += 1  # сервер закрыл соединение (например, не расшифровал)
+
+    async def small_sender(writer):
+        pad = b'x' * 24  # до 32 байт — без сжатия, упаковка почти бесплатна
+        while not stop.is_set():
+            writer.write(Packet.pack(0, MessageType.TEXT, ChatType.GROUP, GROUP_CHAT,
+                                     struct.pack('!d', time.perf_counter()) + pad))
+            sent['small'] += 1
+            await asyncio.sleep(1 / args.small_rate)
+
+    tasks = [asyncio.create_task(_probe(lags, stop))]
+    tasks += [asyncio.create_task(big_sender(w, f)) for (_, w, _), f in zip(big, big_frames)]
+    tasks += [asyncio.create_task(small_sender(w)) for _, w, _ in small]
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    await asyncio.sleep(0.5)
+
+    # сначала закрываем клиентов, чтобы обработчики сервера завершились сами
+    for _, writer, _ in big + small + [big_rx, small_rx]:
+        writer.close()
+    await asyncio.sleep(0.2)
+    for task in readers + [serve]:
+        task.cancel()
+    stats = server.offload.stats()
+    server.offload.close()
+    lags.sort()
+    latencies.sort()
+    return {
+        'lag_p50': _percentile(lags, 0.5), 'lag_p99': _percentile(lags, 0.99),
+        'lag_max': lags[-1] if lags else 0.0,
+        'small_p50': _percentile(latencies, 0.5), 'small_p99': _percentile(latencies, 0.99),
+        'small_delivered': len(latencies), 'big_sent': sent['big'], 'lost': sent['lost'],
+        'offload': stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=1 << 20, help='размер крупного сообщения')
+    parser.add_argument('--big', type=int, default=2, help='отправителей крупных сообщений')
+    parser.add_argument('--big-rate', type=float, default=20.0, help='крупных в секунду на отправителя')
+    parser.add_argument('--small', type=int, default=20, help='отправителей мелких сообщений')
+    parser.add_argument('--small-rate', type=float, default=100.0, help='мелких в секунду на отправителя')
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--threshold', type=int, default=64 * 1024, help='порог offload, байт')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--port', type=int, default=19400)
+    args = parser.parse_args()
+
+    print(f"{args.big}x{args.size} байт @ {args.big_rate}/s + {args.small} мелких @ "
+          f"{args.small_rate}/s, {args.duration} s, {os.cpu_count()} CPU")
+    for name, threshold, port in (('inline', 0, args.port),
+                                  (f"offload>={args.threshold}", args.threshold, args.port + 10)):
+        r = asyncio.run(_run(args, threshold, port))
+        print(f"  {name:>16}: loop lag p50 {r['lag_p50']:6.2f} p99 {r['lag_p99']:7.2f} "
+              f"max {r['lag_max']:7.2f} ms | мелкие p50 {r['small_p50']:6.2f} "
+              f"p99 {r['small_p99']:7.2f} ms ({r['small_delivered']}) | "
+              f"крупных {r['big_sent']} (потеряно отправителей {r['lost']}) | {r['offload']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Бенчмарк персистентной истории (DiskHistoryStore / DiskStorage).
+
+1. Пропускная способность записи для каждого режима fsync. Запись идёт
+   внутри asyncio, как на сервере: каждые ``--burst`` сообщений цикл
+   получает управление (в batch это и есть окно группового коммита);
+   в конце — sync(), в замер входит сброс всего на диск.
+2. Холодный старт с ``--messages`` сообщениями: подъём DiskStorage
+   (снимок + хвост журнала) и последняя страница каждого чата — против
+   полного перечитывания всех сегментов.
+
+    python -m mini_messenger.bench.persist --messages 10000000
+    python -m mini_messenger.bench.persist --dir /var/tmp/bench --keep   # без повторного заполнения
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from mini_messenger.server.disk_log import DiskHistoryStore, _parse
+from mini_messenger.server.storage import DiskStorage
+
+
+async def _write(store: DiskHistoryStore, args, payload: bytes) -> float:
+    start = time.perf_counter()
+    for i in range(args.writes):
+        store.append(i % args.write_chats, f"user_{i % 1000}", payload)
+        if i % args.burst == 0:
+            await asyncio.sleep(0)
+    store.sync()
+    return time.perf_counter() - start
+
+
+def _throughput(args, payload: bytes):
+    for mode in args.modes:
+        root = tempfile.mkdtemp(dir=args.dir)
+        store = DiskHistoryStore(root, max_messages=args.writes, fsync=mode)
+        elapsed = asyncio.run(_write(store, args, payload))
+        print(f"  fsync={mode:<6} {args.writes / elapsed:12,.0f} msg/s  "
+              f"{args.writes * len(payload) / elapsed / 2**20:7.1f} MiB/s payload  "
+              f"{store.syncs:7} fsync groups")
+        store.close()
+        shutil.rmtree(root)
+
+
+def _fill(root: str, args, payload: bytes):
+    start = time.perf_counter()
+    storage = DiskStorage(root, history_limit=args.messages, fsync='never')
+    for chat_id in range(args.chats):
+        storage.save_chat(chat_id, {'type': 2, 'name': f"Chat_{chat_id}",
+                                    'members': {f"user_{chat_id}"}, 'admin': None})
+    for i in range(args.messages):
+        storage.history.append(i % args.chats, f"user_{i % 1000}", payload)
+    storage.close()
+    print(f"  заполнение: {args.messages:,} сообщений за {time.perf_counter() - start:.1f} s")
+
+
+def _cold_start(root: str, args):
+    start = time.perf_counter()
+    storage = DiskStorage(root, history_limit=args.messages)
+    opened = time.perf_counter() - start
+    total = 0
+    for chat_id in storage.chats:
+        total += len(storage.history.page(chat_id, limit=50))
+    ready = time.perf_counter() - start
+    print(f"  быстрый старт: метаданные {opened * 1000:8.1f} ms, "
+          f"+ последние страницы {len(storage.chats)} чатов ({total} сообщений) "
+          f"{ready * 1000:8.1f} ms")
+    last = sum(storage.history.last_seq(chat_id) for chat_id in storage.chats)
+    storage.close()
+    return last
+
+
+def _full_replay(root: str) -> int:
+    # что пришлось бы делать без снимка и индекса: разобрать каждую запись
+    start = time.perf_counter()
+    records = 0
+    messages = os.path.join(root, 'messages')
+    for chat in os.listdir(messages):
+        for name in sorted(os.listdir(os.path.join(messages, chat))):
+            if not name.endswith('.log'):
+                continue
+            with open(os.path.join(messages, chat, name), 'rb') as f:
+                buf = f.read()
+            offset = 0
+            while (record := _parse(buf, offset, len(buf))) is not None:
+                offset = record[5]
+                records += 1
+    print(f"  полное перечитывание: {records:,} записей за {time.perf_counter() - start:.1f} s")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writes', type=int, default=20_000, help='сообщений на режим fsync')
+    parser.add_argument('--write-chats', type=int, default=10, help='чатов в замере записи')
+    parser.add_argument('--modes', nargs='+', default=list(DiskHistoryStore.FSYNC_MODES),
+                        choices=DiskHistoryStore.FSYNC_MODES)
+    parser.add_argument('--burst', type=int, default=100, help='сообщений между уступками циклу')
+    parser.add_argument('--messages', type=int, default=10_000_000, help='для холодного старта')
+    parser.add_argument('--chats', type=int, default=1_000)
+    parser.add_argument('--size', type=int, default=64, help='размер payload, байт')
+    parser.add_argument('--dir', default=None, help='каталог для данных (по умолчанию временный)')
+    parser.add_argument('--keep', action='store_true', help='не удалять и переиспользовать данные')
+    parser.add_argument('--skip-replay', action='store_true')
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size)
+    print(f"запись: {args.writes:,} сообщений по {args.size} байт в {args.write_chats} чатов")
+    _throughput(args, payload)
+
+    root = os.path.join(args.dir or tempfile.gettempdir(), 'mini_messenger_persist_bench')
+    print(f"холодный старт: {args.messages:,} сообщений в {args.chats} чатов ({root})")
+    if not (args.keep and os.path.isdir(root)):
+        shutil.rmtree(root, ignore_errors=True)
+        _fill(root, args, payload)
+    last = _cold_start(root, args)
+    if not args.skip_replay:
+        _full_replay(root)
+    print(f"  сумма last_seq по чатам: {last:,}")
+    if not args.keep:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
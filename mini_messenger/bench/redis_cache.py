@@ -0,0 +1,165 @@
+"""Бенчмарк RedisCache: прежний синхронный клиент против пакетного asyncio.
+
+Горячий путь «до»: add_message и get_members (SMEMBERS) на каждое
+сообщение, add_member = SADD + HGET + HSET + DEL + SADD. «После»:
+команды копятся за тик и уходят одним MULTI, рассылка идёт по индексу
+подписок без SMEMBERS. Сообщения приходят пачками по ``--burst`` за тик.
+
+    python -m mini_messenger.bench.redis_cache --url redis://localhost:6379/15
+    python -m mini_messenger.bench.redis_cache --fake   # нужен пакет fakeredis
+
+Внимание: бенчмарк очищает выбранную базу (FLUSHDB).
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from mini_messenger.server.cache import RedisCache
+
+
+class _Counting:
+    """Прокси клиента redis, считающий вызовы команд (каждый — round-trip)."""
+
+    def __init__(self, client):
+        self._client = client
+        self.calls = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self.calls += 1
+            return attr(*args, **kwargs)
+        return call
+
+
+class _LegacyRedisCache:
+    """Копия прежнего синхронного RedisCache."""
+
+    def __init__(self, client):
+        self.r = client
+
+    def store_chat(self, chat_id: int, chat_obj: dict):
+        obj = {**chat_obj}
+        if "members" in obj and isinstance(obj["members"], (set, list)):
+            obj["members"] = list(obj["members"])
+        obj.pop("messages", None)
+        self.r.hset("chats", chat_id, json.dumps(obj))
+        if "members" in chat_obj:
+            key = f"chat:{chat_id}:members"
+            self.r.delete(key)
+            if chat_obj["members"]:
+                self.r.sadd(key, *chat_obj["members"])
+
+    def get_chat(self, chat_id: int) -> dict | None:
+        val = self.r.hget("chats", chat_id)
+        if not val:
+            return None
+        obj = json.loads(val)
+        if "members" in obj:
+            obj["members"] = set(obj["members"])
+        return obj
+
+    def add_member(self, chat_id: int, user_id: str):
+        key = f"chat:{chat_id}:members"
+        self.r.sadd(key, user_id)
+        chat = self.get_chat(chat_id)
+        if chat:
+            chat_members = chat.get("members", set())
+            chat_members.add(user_id)
+            chat["members"] = chat_members
+            self.store_chat(chat_id, chat)
+
+    def get_members(self, chat_id: int) -> set:
+        return set(self.r.smembers(f"chat:{chat_id}:members"))
+
+    def add_message(self, chat_id: int, message_obj: dict):
+        self.r.rpush(f"chat:{chat_id}:messages", json.dumps(message_obj))
+
+
+def _clients(args):
+    if args.fake:
+        import fakeredis
+        server = fakeredis.FakeServer()
+        return (fakeredis.FakeRedis(server=server, decode_responses=True),
+                fakeredis.FakeAsyncRedis(server=server))
+    import redis
+    import redis.asyncio as aioredis
+    # RedisCache хранит двоичные записи: его клиенту — bytes
+    return (redis.from_url(args.url, decode_responses=True), aioredis.from_url(args.url))
+
+
+def _chat(chat_id: int) -> dict:
+    return {'type': 2, 'name': f"Chat_{chat_id}", 'members': {'user_0'}, 'admin': None}
+
+
+def _message(i: int) -> dict:
+    return {'from': f"user_{i % 100}", 'data': f"message {i}".encode(), 'encrypted': False}
+
+
+def _legacy(client, args) -> tuple[int, float]:
+    counting = _Counting(client)
+    cache = _LegacyRedisCache(counting)
+    start = time.perf_counter()
+    for chat_id in range(args.chats):
+        cache.store_chat(chat_id, _chat(chat_id))
+        for m in range(1, args.members):
+            cache.add_member(chat_id, f"user_{m}")
+    for i in range(args.messages):
+        chat_id = i % args.chats
+        message = _message(i)
+        # прежний JSON не кодировал bytes, передаём текст
+        cache.add_message(chat_id, {**message, 'data': message['data'].decode()})
+        cache.get_members(chat_id)  # прежний _broadcast
+    return counting.calls, time.perf_counter() - start
+
+
+async def _pipelined(client, args) -> tuple[int, float]:
+    cache = RedisCache(client=client)
+    start = time.perf_counter()
+    for chat_id in range(args.chats):
+        cache.store_chat(chat_id, _chat(chat_id))
+        for m in range(1, args.members):
+            cache.add_member(chat_id, f"user_{m}")
+        await asyncio.sleep(0)
+    for i in range(args.messages):
+        cache.add_message(i % args.chats, _message(i))
+        if i % args.burst == args.burst - 1:
+            await asyncio.sleep(0)  # конец тика
+    await cache.flush()
+    elapsed = time.perf_counter() - start
+    round_trips = cache.round_trips
+    assert await cache.get_members(0) == {f"user_{m}" for m in range(args.members)}
+    return round_trips, elapsed
+
+
+def _report(name: str, round_trips: int, elapsed: float, messages: int):
+    print(f"{name:>9}: {round_trips:8} round-trips  {messages / elapsed:10,.0f} msg/s  "
+          f"({elapsed:.2f} s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='redis://localhost:6379/15')
+    parser.add_argument('--fake', action='store_true', help='fakeredis вместо redis-server')
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--members', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=20_000)
+    parser.add_argument('--burst', type=int, default=32, help='сообщений за один тик')
+    args = parser.parse_args()
+
+    sync_client, async_client = _clients(args)
+    print(f"{args.chats} chats x {args.members} members, {args.messages} messages, "
+          f"burst {args.burst}")
+    sync_client.flushdb()
+    _report('legacy', *_legacy(sync_client, args), args.messages)
+    sync_client.flushdb()
+    _report('pipelined', *asyncio.run(_pipelined(async_client, args)), args.messages)
+    sync_client.flushdb()
+
+
+if __name__ == '__main__':
+    main()
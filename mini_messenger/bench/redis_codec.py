@@ -0,0 +1,179 @@
+"""Форматы записей RedisCache: прежний JSON против кодеков codec.py.
+
+Прежняя раскладка: метаданные всех чатов — JSON в общем хэше "chats",
+сообщение — строка "seq ts json" с payload в base64. Новая: хэш на чат
+по полю на атрибут и запись "[ts:6][запись кодека]" (JsonCodec или
+BinaryCodec). Печатается время кодирования и разбора одной записи
+(мкс) и память Redis на чат и на сообщение (MEMORY USAGE; у fakeredis
+его нет — тогда байты ключей и значений). Payload — ``--payload``
+случайных байтов (как шифротекст E2EE) или реплики chat_corpus.txt.
+
+    python -m mini_messenger.bench.redis_codec --url redis://localhost:6379/15
+    python -m mini_messenger.bench.redis_codec --fake --payload 64
+
+Внимание: бенчмарк очищает выбранную базу (FLUSHDB).
+"""
+import argparse
+import base64
+import json
+import os
+import time
+
+from mini_messenger.server.codec import BinaryCodec, JsonCodec
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'chat_corpus.txt')
+
+
+class _Legacy:
+    """Прежние записи RedisCache (до codec.py)."""
+
+    @staticmethod
+    def message(seq: int, sender: str, data: bytes, encrypted: bool) -> bytes:
+        body = json.dumps({'from': sender, 'data': base64.b64encode(data).decode(),
+                           'encrypted': encrypted})
+        return f"{seq} {time.time():.3f} {body}".encode()
+
+    @staticmethod
+    def parse_message(item: bytes) -> tuple:
+        seq, ts, body = item.split(b' ', 2)
+        m = json.loads(body)
+        return int(seq), float(ts), m['from'], base64.b64decode(m['data']), m['encrypted']
+
+    @staticmethod
+    def chat(chat: dict) -> bytes:
+        return json.dumps(chat).encode()
+
+    @staticmethod
+    def parse_chat(raw: bytes) -> dict:
+        return json.loads(raw)
+
+
+def _record(codec, sender: str, data: bytes, encrypted: bool) -> bytes:
+    # как RedisCache.add_message
+    return int(time.time() * 1000).to_bytes(6, 'big') + codec.encode_message(sender, data, encrypted)
+
+
+def _parse(codec, item: bytes) -> tuple:
+    # как RedisCache.get_page
+    return int.from_bytes(item[:6], 'big') / 1000, codec.decode_message(item[6:])
+
+
+def _us(fn, items: list, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            fn(item)
+    return (time.perf_counter() - start) / (repeat * len(items)) * 1e6
+
+
+def _chats(args) -> list:
+    return [{'type': 1 + i % 3, 'name': f"Chat_{i}", 'admin': f"user_{i}" if i % 3 == 2 else None}
+            for i in range(args.chats)]
+
+
+def _messages(args) -> list:
+    if args.payload:
+        payloads = [os.urandom(args.payload) for _ in range(256)]
+    else:
+        with open(CORPUS, encoding='utf-8') as f:
+            payloads = [line.strip().encode() for line in f if line.strip()]
+    return [(f"user_{i % 1000}", payloads[i % len(payloads)], args.payload > 0)
+            for i in range(args.messages)]
+
+
+def _timings(args, chats: list, messages: list) -> dict:
+    out = {}
+    encoded = [_Legacy.message(i, *m) for i, m in enumerate(messages)]
+    stored = [_Legacy.chat(c) for c in chats]
+    out['legacy json'] = (
+        _us(lambda m: _Legacy.message(1, *m), messages, args.repeat),
+        _us(_Legacy.parse_message, encoded, args.repeat),
+        _us(_Legacy.chat, chats, args.repeat),
+        _us(_Legacy.parse_chat, stored, args.repeat),
+    )
+    for name, codec in (('JsonCodec', JsonCodec()), ('BinaryCodec', BinaryCodec())):
+        encoded = [_record(codec, *m) for m in messages]
+        # HGETALL отдаёт ключи полей в bytes
+        stored = [{k.encode(): v for k, v in codec.encode_chat(c).items()} for c in chats]
+        out[name] = (
+            _us(lambda m: _record(codec, *m), messages, args.repeat),
+            _us(lambda item: _parse(codec, item), encoded, args.repeat),
+            _us(codec.encode_chat, chats, args.repeat),
+            _us(codec.decode_chat, stored, args.repeat),
+        )
+    return out
+
+
+def _usage(client, keys: list) -> int:
+    try:
+        return sum(client.memory_usage(key) for key in keys)
+    except Exception:  # нет MEMORY USAGE (fakeredis): считаем байты ключей и значений
+        total = 0
+        for key in keys:
+            kind = client.type(key)
+            if kind == b'hash':
+                total += sum(len(k) + len(v) for k, v in client.hgetall(key).items())
+            elif kind == b'list':
+                total += sum(len(v) for v in client.lrange(key, 0, -1))
+            total += len(key)
+        return total
+
+
+def _memory(client, args, chats: list, messages: list) -> dict:
+    out = {}
+    client.flushdb()
+    for chat_id, chat in enumerate(chats):
+        client.hset('chats', chat_id, _Legacy.chat(chat))
+    for i, m in enumerate(messages):
+        client.rpush(f"chat:{i % args.chats}:messages", _Legacy.message(i + 1, *m))
+    out['legacy json'] = (
+        _usage(client, ['chats']) / len(chats),
+        _usage(client, [f"chat:{c}:messages" for c in range(args.chats)]) / len(messages),
+    )
+    for name, codec in (('JsonCodec', JsonCodec()), ('BinaryCodec', BinaryCodec())):
+        client.flushdb()
+        for chat_id, chat in enumerate(chats):
+            client.hset(f"chat:{chat_id}", mapping=codec.encode_chat(chat))
+        for i, m in enumerate(messages):
+            client.rpush(f"chat:{i % args.chats}:log", _record(codec, *m))
+        out[name] = (
+            _usage(client, [f"chat:{c}" for c in range(args.chats)]) / len(chats),
+            _usage(client, [f"chat:{c}:log" for c in range(args.chats)]) / len(messages),
+        )
+    client.flushdb()
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='redis://localhost:6379/15')
+    parser.add_argument('--fake', action='store_true', help='fakeredis вместо redis-server')
+    parser.add_argument('--chats', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=20_000)
+    parser.add_argument('--payload', type=int, default=0,
+                        help='байт случайного payload (0 — реплики корпуса)')
+    parser.add_argument('--repeat', type=int, default=5, help='повторов замера времени')
+    args = parser.parse_args()
+
+    if args.fake:
+        import fakeredis
+        client = fakeredis.FakeRedis()
+    else:
+        import redis
+        client = redis.from_url(args.url)
+
+    chats, messages = _chats(args), _messages(args)
+    timings = _timings(args, chats, messages)
+    memory = _memory(client, args, chats, messages)
+    source = f"{args.payload} байт случайных" if args.payload else "реплики корпуса"
+    print(f"{args.chats} чатов, {args.messages} сообщений ({source}); мкс на запись, байт Redis:")
+    print(f"  {'':<12} {'msg enc':>8} {'msg dec':>8} {'chat enc':>9} {'chat dec':>9} "
+          f"{'B/chat':>8} {'B/msg':>8}")
+    for name, (enc, dec, chat_enc, chat_dec) in timings.items():
+        per_chat, per_msg = memory[name]
+        print(f"  {name:<12} {enc:8.2f} {dec:8.2f} {chat_enc:9.2f} {chat_dec:9.2f} "
+              f"{per_chat:8.1f} {per_msg:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Шторм подключений: запас пар X25519 против генерации на подключение.
+
+Сервер запускается отдельным процессом дважды: без запаса ключей
+(key_pool_high=0, пара генерируется в цикле на каждое подключение, как
+раньше) и с запасом ``--low``/``--high``. После прогрева ``--connections``
+TCP-клиентов подключаются разом, не больше ``--concurrency`` одновременно
+ждущих, и каждый ждёт первый кадр сервера (KEY_EX). Клиенты — сырые
+сокеты в этом процессе, ключей они не генерируют.
+
+Печатается число принятых подключений в секунду (до первого кадра у
+всех) и перцентили времени до первого кадра. Шторм длиннее ``--high``
+подключений выбирает запас, дальше ключи генерируются на месте — как
+без запаса.
+
+    python -m mini_messenger.bench.storm --connections 2000 --concurrency 200 --high 4096
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+
+from mini_messenger.bench.load import _percentiles, _wait_port
+from mini_messenger.protocol.types import MessageType
+from mini_messenger.server.server import MiniServer
+
+
+def _serve(port: int, low: int, high: int):
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)  # без построчных логов подключений
+    asyncio.run(MiniServer(host='127.0.0.1', port=port, ws_port=port + 1, metrics=False,
+                           key_pool_low=low, key_pool_high=high).start())
+
+
+async def _storm(args, port: int) -> dict:
+    gate = asyncio.Semaphore(args.concurrency)
+    first = []
+    writers = []
+
+    async def client():
+        async with gate:
+            start = time.perf_counter()
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            header = await reader.readexactly(12)
+            first.append((time.perf_counter() - start) * 1000)  # мс
+            assert header[1] == MessageType.KEY_EX
+            writers.append(writer)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.connections)))
+    elapsed = time.perf_counter() - start
+    for writer in writers:
+        writer.close()
+    await asyncio.sleep(0.5)  # сервер разбирает отключения
+    return {'rate': args.connections / elapsed, 'latency': _percentiles(first)}
+
+
+def _run(args, port: int, low: int, high: int) -> dict:
+    server = multiprocessing.get_context('spawn').Process(
+        target=_serve, args=(port, low, high), daemon=True)
+    server.start()
+    try:
+        _wait_port('127.0.0.1', port)
+        time.sleep(args.settle)  # запас заполняется в фоне
+        return asyncio.run(_storm(args, port))
+    finally:
+        server.terminate()
+        server.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=200, help='одновременных подключений')
+    parser.add_argument('--low', type=int, default=1024)
+    parser.add_argument('--high', type=int, default=4096)
+    parser.add_argument('--settle', type=float, default=1.0, help='пауза после запуска сервера, с')
+    parser.add_argument('--port', type=int, default=19800)
+    args = parser.parse_args()
+
+    print(f"{args.connections} подключений, до {args.concurrency} одновременно:")
+    for i, (name, low, high) in enumerate((('без запаса', 0, 0),
+                                           (f'запас {args.low}/{args.high}', args.low, args.high))):
+        r = _run(args, args.port + 10 * i, low, high)
+        lat = r['latency']
+        print(f"  {name:<16} {r['rate']:7.0f} подключений/s, до первого кадра: "
+              f"p50 {lat.get('p50')} ms, p99 {lat.get('p99')} ms, max {lat.get('max')} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""Масштабирование по ядрам: Supervisor с 1..N воркерами на общих портах.
+
+Для каждого числа воркеров запускается Supervisor (отдельным процессом,
+воркеры слушают одни порты через SO_REUSEPORT, общий Redis). Чаты
+создаются заранее через WS, затем ``--clients`` процессов-нагрузчиков
+открывают по ``--pairs`` пар TCP-соединений: в каждой паре одно шлёт
+сообщения в свой групповой чат, другое принимает. Отправитель держит не
+больше ``--window`` недоставленных сообщений, поэтому очереди сервера не
+переполняются, а результат — устойчивая пропускная способность
+(доставленных сообщений в секунду). Пара может попасть на разные
+воркеры — тогда доставка идёт через Redis, как между узлами кластера.
+
+Нагрузчики тоже занимают CPU: на машине с C ядрами честный прогон —
+воркеров до C - clients. ``--fake`` годится только для проверки, что всё
+работает: TcpFakeServer обслуживает всех воркеров в одном процессе под
+GIL и под нагрузкой теряет часть pub/sub-сообщений между соединениями
+(видно по «зависаниям окна»), поэтому цифры масштабирования — с
+настоящим redis-server.
+
+    python -m mini_messenger.bench.workers --url redis://localhost:6379/15 --workers 1,2,4
+    python -m mini_messenger.bench.workers --fake   # fakeredis по TCP в этом процессе
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+import websockets
+
+from mini_messenger.protocol.framing import FrameDecoder
+from mini_messenger.protocol.packet import Packet
+from mini_messenger.protocol.types import ChatType, MessageType
+from mini_messenger.server.supervisor import Supervisor
+
+FIRST_CHAT = 70_000
+
+
+def _fake_redis(port: int) -> str:
+    # один процесс fakeredis на всех воркеров; сам он однопоточен по GIL
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(('127.0.0.1', port), server_type='redis')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"redis://127.0.0.1:{port}/0"
+
+
+def _serve(workers: int, kwargs: dict, verbose: bool):
+    if not verbose:
+        # воркеры наследуют stdout: без построчных логов подключений
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+    Supervisor(workers, **kwargs).run()
+
+
+def _wait_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+async def _create_chats(ws_port: int, chat_ids: list):
+    async with websockets.connect(f"ws://127.0.0.1:{ws_port}") as ws:
+        for chat_id in chat_ids:
+            await ws.send(json.dumps({'action': 'create', 'chat_id': chat_id, 'name': 'bench'}))
+        await asyncio.sleep(0.5)  # запись в Redis идёт фоном
+
+
+async def _pair(port: int, chat_id: int, window: int, state: dict):
+    rx_reader, rx_writer = await asyncio.open_connection('127.0.0.1', port)
+    _, tx_writer = await asyncio.open_connection('127.0.0.1', port)
+    rx_writer.write(Packet.pack(0, MessageType.JOIN, ChatType.GROUP, chat_id, b''))
+    await rx_writer.drain()
+    frame = Packet.pack(0, MessageType.TEXT, ChatType.GROUP, chat_id, b'm' * 32)
+    counts = {'sent': 0, 'received': 0}
+    wake = asyncio.Event()
+
+    async def receive():
+        decoder = FrameDecoder()
+        while data := await rx_reader.read(1 << 16):
+            for f in decoder.feed(data):
+                if f[1] == MessageType.TEXT:
+                    counts['received'] += 1
+                    if state['measuring']:
+                        state['delivered'] += 1
+            wake.set()
+
+    async def send():
+        await state['go'].wait()
+        while not state['stop'].is_set():
+            wake.clear()
+            room = window - (counts['sent'] - counts['received'])
+            if room > 0:
+                tx_writer.write(frame * room)
+                counts['sent'] += room
+                await tx_writer.drain()
+            try:
+                await asyncio.wait_for(wake.wait(), 1.0)
+            except asyncio.TimeoutError:
+                state['stalls'] += 1  # сообщение потеряно — окно открываем заново
+                counts['sent'] = counts['received']
+
+    return asyncio.create_task(receive()), asyncio.create_task(send()), (rx_writer, tx_writer)
+
+
+def _client(port: int, chat_ids: list, args, ready, go, results):
+    async def main():
+        state = {'measuring': False, 'delivered': 0, 'stalls': 0,
+                 'go': asyncio.Event(), 'stop': asyncio.Event()}
+        pairs = [await _pair(port, chat_id, args.window, state) for chat_id in chat_ids]
+        ready.put(True)
+        await asyncio.get_running_loop().run_in_executor(None, go.wait)
+        state['go'].set()
+        await asyncio.sleep(args.warmup)
+        state['measuring'] = True
+        start = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        state['measuring'] = False
+        elapsed = time.perf_counter() - start
+        state['stop'].set()
+        for receiver, sender, writers in pairs:
+            sender.cancel()
+            receiver.cancel()
+            for writer in writers:
+                writer.close()
+        results.put((state['delivered'], elapsed, state['stalls']))
+
+    asyncio.run(main())
+
+
+def _run(workers: int, port: int, args, ctx) -> dict:
+    kwargs = {'host': '127.0.0.1', 'port': port, 'ws_port': port + 1, 'redis_url': args.url}
+    supervisor = ctx.Process(target=_serve, args=(workers, kwargs, args.verbose))
+    supervisor.start()
+    _wait_port(port)
+    time.sleep(1.0)  # остальные воркеры ещё импортируются
+
+    chat_ids = [FIRST_CHAT + port * 10 + i for i in range(args.clients * args.pairs)]
+    asyncio.run(_create_chats(port + 1, chat_ids))
+
+    ready, results, go = ctx.Queue(), ctx.Queue(), ctx.Event()
+    clients = [ctx.Process(target=_client,
+                           args=(port, chat_ids[i::args.clients], args, ready, go, results))
+               for i in range(args.clients)]
+    for proc in clients:
+        proc.start()
+    for _ in clients:
+        ready.get()
+    time.sleep(0.5)  # подписки воркеров в Redis применяются асинхронно
+    go.set()
+    totals = [results.get() for _ in clients]
+    for proc in clients:
+        proc.join()
+
+    supervisor.terminate()  # SIGTERM: Supervisor плавно останавливает воркеров
+    supervisor.join()
+    delivered = sum(d for d, _, _ in totals)
+    elapsed = max(e for _, e, _ in totals)
+    return {'rate': delivered / elapsed, 'delivered': delivered,
+            'stalls': sum(s for _, _, s in totals), 'exitcode': supervisor.exitcode}
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    default_workers = sorted({1, *(2 ** i for i in range(8) if 2 ** i <= cpus // 2), max(1, cpus // 2)})
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='redis://localhost:6379/15')
+    parser.add_argument('--fake', action='store_true', help='fakeredis по TCP вместо redis-server')
+    parser.add_argument('--workers', default=','.join(map(str, default_workers)),
+                        help='числа воркеров через запятую')
+    parser.add_argument('--clients', type=int, default=max(1, cpus // 2), help='процессов нагрузки')
+    parser.add_argument('--pairs', type=int, default=50, help='пар соединений на процесс нагрузки')
+    parser.add_argument('--window', type=int, default=32, help='недоставленных сообщений на пару')
+    parser.add_argument('--warmup', type=float, default=1.0)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--port', type=int, default=19600)
+    parser.add_argument('--verbose', action='store_true', help='не глушить вывод воркеров')
+    args = parser.parse_args()
+    if args.fake:
+        args.url = _fake_redis(args.port - 1)
+
+    ctx = multiprocessing.get_context('spawn')
+    counts = [int(n) for n in args.workers.split(',')]
+    print(f"{cpus} CPU, {args.clients} процессов нагрузки x {args.pairs} пар, "
+          f"окно {args.window}, {args.duration} s, {args.url}")
+    base = None
+    for i, workers in enumerate(counts):
+        r = _run(workers, args.port + 10 * i, args, ctx)
+        base = base or r['rate']
+        print(f"  {workers:3} воркеров: {r['rate']:10.0f} msg/s  x{r['rate'] / base:5.2f}  "
+              f"(доставлено {r['delivered']}, зависаний окна {r['stalls']}, "
+              f"код supervisor {r['exitcode']})")
+
+
+if __name__ == '__main__':
+    main()
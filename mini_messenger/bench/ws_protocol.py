@@ -0,0 +1,157 @@
+"""Протоколы WebSocket: JSON против кадров Packet, с deflate и без.
+
+Сервер запускается отдельным процессом (permessage-deflate включён, клиент
+решает, предлагать ли его). Для каждого режима ``--receivers`` клиентов
+входят в свою группу, один отправитель шлёт ``--messages`` реплик из
+chat_corpus.txt пачками по ``--burst`` за тик и ждёт, пока все копии
+дойдут. Печатается процессорное время сервера (utime + stime из /proc)
+и байты на проводе (входящий поток клиентов, с заголовками WS) на одно
+доставленное сообщение, а также время доставки.
+
+В режиме packet сервер кодирует кадр один раз и склеивает всё, что
+накопилось у клиента за тик, в одно WS-сообщение; JSON — по сообщению на
+кадр, как ждёт index.html.
+
+    python -m mini_messenger.bench.ws_protocol --receivers 200 --messages 2000 --burst 20
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+import websockets
+from websockets.asyncio.client import ClientConnection
+
+from mini_messenger.bench.load import _wait_port
+from mini_messenger.protocol.framing import FrameDecoder
+from mini_messenger.protocol.packet import Packet
+from mini_messenger.protocol.types import ChatType, MessageType
+from mini_messenger.server.server import MiniServer
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'chat_corpus.txt')
+MODES = (  # имя, подпротокол, сжатие клиента
+    ('json', MiniServer.WS_JSON, None),
+    ('json+deflate', MiniServer.WS_JSON, 'deflate'),
+    ('packet', MiniServer.WS_PACKET, None),
+    ('packet+deflate', MiniServer.WS_PACKET, 'deflate'),
+)
+FIRST_CHAT = 90_000
+
+
+class _Counted(ClientConnection):
+    wire = 0  # байт от сервера на всех соединениях
+
+    def data_received(self, data: bytes):
+        _Counted.wire += len(data)
+        super().data_received(data)
+
+
+def _serve(port: int, ws_port: int):
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)  # без построчных логов подключений
+    asyncio.run(MiniServer(host='127.0.0.1', port=port, ws_port=ws_port, metrics=False,
+                           send_queue_size=10 ** 6).start())
+
+
+def _cpu(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+async def _round(args, pid: int, chat_id: int, protocol: str, compression, texts: list) -> dict:
+    url = f"ws://127.0.0.1:{args.ws_port}"
+    packets = protocol == MiniServer.WS_PACKET
+
+    async def connect():
+        return await websockets.connect(url, subprotocols=[protocol], compression=compression,
+                                        create_connection=_Counted, max_size=None)
+
+    async with websockets.connect(url) as admin:
+        await admin.send(json.dumps({'action': 'create', 'chat_id': chat_id, 'name': 'bench'}))
+        await asyncio.sleep(0.1)
+
+    conns = [await connect() for _ in range(args.receivers + 1)]
+    sender, receivers = conns[0], conns[1:]
+    if packets:
+        for ws in conns:
+            await ws.recv()  # KEY_EX сервера
+    for ws in receivers:
+        if packets:
+            await ws.send(Packet.pack(0, MessageType.JOIN, ChatType.GROUP, chat_id, b''))
+        else:
+            await ws.send(json.dumps({'action': 'join', 'chat_id': chat_id}))
+    await asyncio.sleep(0.5)
+
+    expected = args.messages * args.receivers
+    received = [0]
+    done = asyncio.Event()
+
+    async def receive(ws):
+        decoder = FrameDecoder()
+        async for message in ws:
+            if packets:
+                received[0] += sum(f[1] == MessageType.TEXT for f in decoder.feed(message))
+            else:
+                received[0] += 1
+            if received[0] >= expected:
+                done.set()
+
+    if packets:
+        outgoing = [Packet.pack(0, MessageType.TEXT, ChatType.GROUP, chat_id, t.encode('utf-8'))
+                    for t in texts]
+    else:
+        outgoing = [json.dumps({'chat_id': chat_id, 'text': t}) for t in texts]
+    source = itertools.cycle(outgoing)
+    readers = [asyncio.create_task(receive(ws)) for ws in receivers]
+
+    wire, cpu, start = _Counted.wire, _cpu(pid), time.perf_counter()
+    for _ in range(args.messages // args.burst):
+        for _ in range(args.burst):
+            await sender.send(next(source))
+        await asyncio.sleep(0)
+    await asyncio.wait_for(done.wait(), 120)
+    elapsed = time.perf_counter() - start
+    cpu, wire = _cpu(pid) - cpu, _Counted.wire - wire
+
+    for task in readers:
+        task.cancel()
+    for ws in conns:
+        await ws.close()
+    delivered = args.messages // args.burst * args.burst * args.receivers
+    return {'cpu_us': cpu / delivered * 1e6, 'bytes': wire / delivered,
+            'seconds': elapsed, 'delivered': delivered}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--receivers', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--burst', type=int, default=20, help='сообщений отправителя за тик')
+    parser.add_argument('--corpus', default=CORPUS)
+    parser.add_argument('--port', type=int, default=19700)
+    parser.add_argument('--ws-port', type=int, default=19701)
+    args = parser.parse_args()
+    with open(args.corpus, encoding='utf-8') as f:
+        texts = [line.strip() for line in f if line.strip()]
+
+    server = multiprocessing.get_context('spawn').Process(
+        target=_serve, args=(args.port, args.ws_port), daemon=True)
+    server.start()
+    try:
+        _wait_port('127.0.0.1', args.ws_port)
+        print(f"группа из {args.receivers}, {args.messages} сообщений пачками по {args.burst}:")
+        for i, (name, protocol, compression) in enumerate(MODES):
+            r = asyncio.run(_round(args, server.pid, FIRST_CHAT + i, protocol, compression, texts))
+            print(f"  {name:<15} {r['cpu_us']:6.2f} мкс CPU сервера, {r['bytes']:6.1f} байт "
+                  f"на доставленное, {r['delivered'] / r['seconds']:8.0f} msg/s")
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,50 +1,120 @@
 import asyncio
 import struct
-from mini_messenger.protocol.packet import Packet
+from mini_messenger.protocol.packet import Packet, SYNC_REQUEST, SYNC_REPLY
+from mini_messenger.protocol.framing import FrameDecoder
 from mini_messenger.protocol.types import PacketFlag, MessageType, ChatType
 from .session import Session
-from mini_messenger.crypto.e2ee import E2EE
 
 class MiniClient:
-    def __init__(self, host='127.0.0.1', port=9000):
+    READ_SIZE = 64 * 1024
+    SYNC_LIMIT = 128  # сообщений на страницу SYNC (сервер может ограничить сильнее)
+
+    def __init__(self, host='127.0.0.1', port=9000, on_message=None, verbose=True,
+                 keypool=None, identity=None):
         self.host = host
         self.port = port
-        self.session = Session()
+        # keypool — запас пар X25519, identity — постоянная пара (см. Session)
+        self.session = Session(keypool, identity)
         self.reader = None
         self.writer = None
+        # on_message(chat_id, payload) вместо печати входящих; verbose=False — без печати вообще
+        self.on_message = on_message
+        self.verbose = verbose
+        self.keyed = asyncio.Event()  # сервер прислал свой ключ
     
     async def connect(self):
         self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
-        print("✅ Подключено к серверу")
-        asyncio.create_task(self._receiver())
+        if self.verbose:
+            print("✅ Подключено к серверу")
+        self._receiver_task = asyncio.create_task(self._receiver())
     
     async def _receiver(self):
+        decoder = FrameDecoder()
         while True:
             try:
-                header = await self.reader.readexactly(Packet.HEADER_SIZE)
-                rest = await self.reader.read(1024)
-                flags, msg_type, chat_type, chat_id, payload = Packet.unpack(
-                    header + rest
-                )
-                
-                if msg_type == MessageType.KEY_EX:  # Получен публичный ключ
-                    key_len = struct.unpack('!I', payload[:4])[0]
-                    peer_key = payload[4:4+key_len]
-                    # Логика сохранения ключа для будущих личных чатов
-                    continue
-                
-                # Дешифрование если E2EE
-                if flags & PacketFlag.ENCRYPTED and chat_id in self.session.keys:
-                    payload = E2EE.decrypt(payload, self.session.keys[chat_id])
-                
-                text = payload.decode('utf-8', errors='replace')
-                chat_name = self.session.chat_list.get(chat_id, {}).get('name', f"Chat_{chat_id}")
-                print(f"\n[{chat_name}] {text}")
-                print("> ", end='', flush=True)
+                data = await self.reader.read(self.READ_SIZE)
+                if not data:
+                    if self.verbose:
+                        print("\nСоединение закрыто сервером")
+                    break
+                for frame in decoder.feed(data):
+                    self._handle_frame(frame)
             except Exception as e:
-                print(f"\nОшибка получения: {e}")
+                if self.verbose:
+                    print(f"\nОшибка получения: {e}")
                 break
-    
+
+    def _handle_frame(self, frame: memoryview):
+        flags, msg_type, chat_type, chat_id, payload = Packet.unpack(frame)
+
+        if msg_type == MessageType.KEY_EX:  # Получен публичный ключ
+            key_len = struct.unpack('!I', payload[:4])[0]
+            self.session.server_key = bytes(payload[4:4+key_len])
+            self.send_public_key()
+            self.keyed.set()
+            return
+        if msg_type == MessageType.PING:  # heartbeat сервера
+            self.writer.write(Packet.pack(PacketFlag.SYSTEM, MessageType.PING, 0, 0, b''))
+            return
+        if msg_type == MessageType.SYNC:  # конец страницы истории
+            through, more = SYNC_REPLY.unpack_from(payload)
+            if self.session.synced(chat_id, through, bool(more)):
+                self._request_sync(chat_id, through)
+            return
+
+        seq = Packet.seq(frame)
+        if seq is not None and not self.session.seen(chat_id, seq):
+            return
+
+        # Дешифрование если E2EE
+        if flags & PacketFlag.ENCRYPTED and chat_id in self.session.ciphers:
+            payload = self.session.decrypt_for_chat(chat_id, payload)
+
+        if self.on_message is not None:
+            self.on_message(chat_id, payload)
+            return
+        if not self.verbose:
+            return
+        text = str(payload, 'utf-8', errors='replace')
+        chat_name = self.session.chat_list.get(chat_id, {}).get('name', f"Chat_{chat_id}")
+        print(f"\n[{chat_name}] {text}")
+        print("> ", end='', flush=True)
+
+    def send_public_key(self):
+        """Ответный KEY_EX: сервер выводит общий секрет с этим ключом"""
+        key = self.session.public_key
+        self.writer.write(Packet.pack(
+            PacketFlag.SYSTEM, MessageType.KEY_EX, 0, 0, struct.pack('!I', len(key)) + key
+        ))
+
+    async def join(self, chat_id: int, chat_type: int, name: str = None):
+        """Вступление в существующий чат; дальше сервер присылает его сообщения.
+        Если из чата уже что-то получено (переподключение) — догружает пропущенное."""
+        self.session.chat_list[chat_id] = {'name': name or f"Chat_{chat_id}", 'type': chat_type}
+        self.writer.write(Packet.pack(0, MessageType.JOIN, chat_type, chat_id, b''))
+        if chat_id in self.session.last_seq:
+            self._request_sync(chat_id, self.session.begin_sync(chat_id))
+        await self.writer.drain()
+
+    async def sync(self, chat_id: int):
+        """Сообщения чата после последнего полученного seq — страницами,
+        следующая запрашивается по ответу SYNC, пока сервер не скажет, что всё."""
+        self._request_sync(chat_id, self.session.begin_sync(chat_id))
+        await self.writer.drain()
+
+    def _request_sync(self, chat_id: int, after: int):
+        chat_type = self.session.chat_list.get(chat_id, {}).get('type', 0)
+        self.writer.write(Packet.pack(0, MessageType.SYNC, chat_type, chat_id,
+                                      SYNC_REQUEST.pack(after, self.SYNC_LIMIT)))
+
+    async def close(self):
+        self._receiver_task.cancel()
+        self.writer.close()
+
+    def rekey(self):
+        self.session.rekey()
+        self.send_public_key()
+
     async def send_message(self, chat_id: int, text: str):
         payload, is_encrypted = self.session.encrypt_for_chat(chat_id, text.encode('utf-8'))
         flags = PacketFlag.ENCRYPTED if is_encrypted else 0
@@ -52,4 +122,5 @@ class MiniClient:
         packet = Packet.pack(flags, MessageType.TEXT, chat_type, chat_id, payload)
         self.writer.write(packet)
         await self.writer.drain()
-        print(f"📤 Отправлено в чат {chat_id} ({len(packet)} байт)")
+        if self.verbose:
+            print(f"📤 Отправлено в чат {chat_id} ({len(packet)} байт)")
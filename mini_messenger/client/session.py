@@ -1,24 +1,69 @@
 import struct
 from mini_messenger.crypto.keys import KeyManager
+from mini_messenger.crypto.keypool import KeyPool
 from mini_messenger.crypto.e2ee import E2EE
 from mini_messenger.protocol.types import ChatType
 
 class Session:
-    def __init__(self):
+    def __init__(self, keypool: KeyPool = None, identity: tuple = None):
         self.user_id = None
         self.current_chat = None
         self.chat_list = {}  # chat_id: {name, type, peer_pubkey?}
         self.keys = {}  # chat_id: shared_secret (для E2EE)
-        self.private_key, self.public_key = KeyManager.generate_keypair()
+        self.ciphers = {}  # chat_id: шифр, создаётся один раз на чат
+        self.server_key = None  # публичный ключ сервера из KEY_EX
+        self.last_seq = {}  # chat_id: последний полученный seq — с него SYNC после переподключения
+        self._sync_seen = {}  # chat_id: seq, пришедшие во время догрузки (от дублей)
+        # пары берутся из запаса (по умолчанию общего на процесс);
+        # identity — своя долговременная пара (private, public)
+        self.keypool = keypool if keypool is not None else KeyPool.shared()
+        self.private_key, self.public_key = identity or self.keypool.take()
     
     def init_e2ee(self, chat_id: int, peer_pubkey: bytes):
         """Вызывается при создании личного чата"""
         secret = KeyManager.derive_shared_secret(self.private_key, peer_pubkey)
         self.keys[chat_id] = secret
+        self.ciphers[chat_id] = E2EE.cipher(secret)
     
+    def rekey(self):
+        """Новая пара ключей; секреты чатов выводятся заново через init_e2ee"""
+        self.private_key, self.public_key = self.keypool.take()
+        self.keys.clear()
+        self.ciphers.clear()
+    
+    def begin_sync(self, chat_id: int) -> int:
+        """Начало догрузки чата; возвращает seq, после которого просить."""
+        self._sync_seen.setdefault(chat_id, set())
+        return self.last_seq.get(chat_id, 0)
+
+    def seen(self, chat_id: int, seq: int) -> bool:
+        """Отмечает полученное сообщение; False — дубль: во время догрузки
+        оно пришло и вживую, и страницей истории."""
+        during_sync = self._sync_seen.get(chat_id)
+        if during_sync is not None:
+            # last_seq продвигают только ответы SYNC: до них в истории может быть пробел
+            if seq in during_sync:
+                return False
+            during_sync.add(seq)
+        elif seq > self.last_seq.get(chat_id, 0):
+            self.last_seq[chat_id] = seq
+        return True
+
+    def synced(self, chat_id: int, through: int, more: bool) -> bool:
+        """Ответ SYNC; True — за through есть ещё страница."""
+        self.last_seq[chat_id] = max(self.last_seq.get(chat_id, 0), through)
+        if more:
+            return True
+        during_sync = self._sync_seen.pop(chat_id, ())
+        self.last_seq[chat_id] = max(self.last_seq[chat_id], max(during_sync, default=0))
+        return False
+
     def encrypt_for_chat(self, chat_id: int, plaintext: bytes) -> tuple[bytes, bool]:
         """Возвращает (данные, флаг_шифрования)"""
         chat = self.chat_list.get(chat_id)
-        if chat and chat['type'] == ChatType.PRIVATE and chat_id in self.keys:
-            return E2EE.encrypt(plaintext, self.keys[chat_id]), True
+        if chat and chat['type'] == ChatType.PRIVATE and chat_id in self.ciphers:
+            return E2EE.encrypt_with(self.ciphers[chat_id], plaintext), True
         return plaintext, False
+    
+    def decrypt_for_chat(self, chat_id: int, payload: bytes) -> bytes:
+        return E2EE.decrypt_with(self.ciphers[chat_id], payload)
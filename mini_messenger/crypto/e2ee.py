@@ -4,18 +4,29 @@ from .keys import KeyManager
 
 class E2EE:
     NONCE_SIZE = 12  # Оптимально для ChaCha20
-    
+
     @staticmethod
-    def encrypt(plaintext: bytes, key: bytes) -> bytes:
+    def cipher(key: bytes) -> ChaCha20Poly1305:
+        """Шифр для ключа; его можно переиспользовать для многих сообщений."""
+        return ChaCha20Poly1305(bytes(key[:32]))  # Используем первые 32 байта ключа
+
+    @staticmethod
+    def encrypt_with(chacha: ChaCha20Poly1305, plaintext: bytes) -> bytes:
         """Возвращает: nonce (12) + ciphertext + tag (16)"""
         nonce = os.urandom(E2EE.NONCE_SIZE)
-        chacha = ChaCha20Poly1305(key[:32])  # Используем первые 32 байта ключа
         ciphertext = chacha.encrypt(nonce, plaintext, None)
         return nonce + ciphertext  # Итого: 12 + len(plaintext) + 16
-    
+
     @staticmethod
-    def decrypt(packet: bytes, key: bytes) -> bytes:
+    def decrypt_with(chacha: ChaCha20Poly1305, packet: bytes) -> bytes:
         nonce = packet[:E2EE.NONCE_SIZE]
         ciphertext = packet[E2EE.NONCE_SIZE:]
-        chacha = ChaCha20Poly1305(key[:32])
         return chacha.decrypt(nonce, ciphertext, None)
+
+    @staticmethod
+    def encrypt(plaintext: bytes, key: bytes) -> bytes:
+        return E2EE.encrypt_with(E2EE.cipher(key), plaintext)
+
+    @staticmethod
+    def decrypt(packet: bytes, key: bytes) -> bytes:
+        return E2EE.decrypt_with(E2EE.cipher(key), packet)
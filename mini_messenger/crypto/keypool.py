@@ -0,0 +1,85 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .keys import KeyManager
+
+
+class KeyPool:
+    """Запас заранее сгенерированных пар X25519.
+
+    take() отдаёт готовую пару без генерации на горячем пути (подключение,
+    rekey). Когда в запасе остаётся меньше low пар, фоновый поток добирает
+    его до high; пустой запас — пара генерируется на месте, как раньше.
+    Запас общий для всех потоков: deque без блокировок на take().
+    """
+
+    _shared = None
+
+    def __init__(self, low: int = 64, high: int = 256, executor=None):
+        if not 0 <= low <= high:
+            raise ValueError("нужно 0 <= low <= high")
+        self.low = low
+        self.high = high
+        self._own = executor is None and high > 0
+        self._executor = executor or (
+            ThreadPoolExecutor(1, thread_name_prefix='keys') if self._own else None
+        )
+        self._pairs = deque()
+        self._filling = False  # поток пополнения уже работает
+        self._closed = False
+        self.hits = 0     # пар выдано из запаса
+        self.misses = 0   # пар сгенерировано на месте
+        self.refills = 0  # пополнений запаса
+
+    @classmethod
+    def shared(cls) -> 'KeyPool':
+        """Общий запас процесса; им по умолчанию пользуются клиенты."""
+        if cls._shared is None:
+            cls._shared = cls(low=16, high=64)
+        return cls._shared
+
+    def take(self) -> tuple:
+        """(private, public) — из запаса, если он не пуст."""
+        try:
+            pair = self._pairs.popleft()
+            self.hits += 1
+        except IndexError:
+            pair = KeyManager.generate_keypair()
+            self.misses += 1
+        if len(self._pairs) < self.low:
+            self.fill()
+        return pair
+
+    def fill(self):
+        """Добрать запас до high в фоне (если пополнение ещё не идёт)."""
+        if self._closed or self._executor is None or self._filling:
+            return
+        if len(self._pairs) >= self.high:
+            return
+        self._filling = True
+        self.refills += 1
+        self._executor.submit(self._fill)
+
+    def _fill(self):
+        try:
+            while not self._closed and len(self._pairs) < self.high:
+                self._pairs.append(KeyManager.generate_keypair())
+        finally:
+            self._filling = False
+
+    def close(self):
+        self._closed = True
+        if self._own:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._pairs),
+            'low': self.low,
+            'high': self.high,
+            'hits': self.hits,
+            'misses': self.misses,
+            'refills': self.refills,
+        }
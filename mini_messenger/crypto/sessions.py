@@ -0,0 +1,97 @@
+from collections import OrderedDict
+from .keys import KeyManager
+from .e2ee import E2EE
+
+
+class KeySession:
+    """Результат ECDH для пары ключей: общий секрет и готовый шифр."""
+
+    __slots__ = ('secret', 'cipher', 'owner')
+
+    def __init__(self, secret: bytes, owner=None):
+        self.secret = bytearray(secret)  # bytearray, чтобы затереть при удалении
+        self.cipher = E2EE.cipher(self.secret)
+        self.owner = owner
+
+    def wipe(self):
+        self.secret[:] = bytes(len(self.secret))
+        self.cipher = None
+
+
+class SessionCache:
+    """LRU-кеш E2EE-сессий по ключу (local_private, peer_public).
+
+    Разбор ключей X25519, обмен ECDH и создание ChaCha20Poly1305
+    выполняются один раз на пару ключей, а не на каждое сообщение.
+    Сессии привязаны к владельцу (соединению): forget(owner) стирает
+    их при отключении, а также при смене ключей (rekey) — следующий
+    get() с новыми ключами выведет новый секрет.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._sessions = OrderedDict()  # (local_private, peer_public): KeySession
+        self._by_owner = {}             # owner: set(ключей)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, local_private: bytes, peer_public: bytes, owner=None) -> KeySession:
+        key = (bytes(local_private), bytes(peer_public))
+        session = self._sessions.get(key)
+        if session is not None:
+            self._sessions.move_to_end(key)
+            self.hits += 1
+            return session
+        self.misses += 1
+        session = KeySession(KeyManager.derive_shared_secret(*key), owner)
+        self._sessions[key] = session
+        if owner is not None:
+            self._by_owner.setdefault(owner, set()).add(key)
+        while len(self._sessions) > self.maxsize:
+            self._remove(next(iter(self._sessions)))
+            self.evictions += 1
+        return session
+
+    def encrypt(self, local_private: bytes, peer_public: bytes, plaintext: bytes,
+                owner=None) -> bytes:
+        return E2EE.encrypt_with(self.get(local_private, peer_public, owner).cipher, plaintext)
+
+    def decrypt(self, local_private: bytes, peer_public: bytes, packet: bytes,
+                owner=None) -> bytes:
+        return E2EE.decrypt_with(self.get(local_private, peer_public, owner).cipher, packet)
+
+    def _remove(self, key: tuple):
+        session = self._sessions.pop(key, None)
+        if session is None:
+            return
+        keys = self._by_owner.get(session.owner)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_owner[session.owner]
+        session.wipe()
+
+    def drop(self, local_private: bytes, peer_public: bytes):
+        self._remove((bytes(local_private), bytes(peer_public)))
+
+    def forget(self, owner):
+        """Стирает все сессии владельца (отключение или смена ключей)."""
+        for key in list(self._by_owner.get(owner, ())):
+            self._remove(key)
+
+    def clear(self):
+        for key in list(self._sessions):
+            self._remove(key)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._sessions),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
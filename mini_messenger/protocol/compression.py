@@ -0,0 +1,113 @@
+import zlib
+from collections import Counter
+from .types import PacketFlag
+from .dictionary import CHAT_DICTIONARY
+
+_CODEC_BITS = PacketFlag.DEFLATE | PacketFlag.DICT
+
+
+class Compressor:
+    """Адаптивное сжатие payload пакетов.
+
+    Кодек и уровень выбираются по размеру payload:
+      < min_size  — без сжатия: заголовок deflate съест выигрыш;
+      < dict_max  — сырой deflate с общим словарём (DICT): маленькое
+                    окно и memLevel, поэтому подготовка потока почти
+                    бесплатна, а словарь даёт совпадения даже в одной
+                    строке;
+      < fast_min  — сырой deflate уровня 6 (DEFLATE);
+      иначе       — сырой deflate уровня 1 (DEFLATE), скорость важнее.
+
+    Сжатый вариант отправляется, только если он короче исходного. Кодек
+    записан в битах флагов, раскодируются все, включая прежний zlib
+    (COMPRESSED без битов кодека). codecs ограничивает, чем сжимать;
+    согласования с пиром нет — Packet.compressor один на процесс и общий
+    для всех соединений (кадр кодируется один раз на всех получателей),
+    так что codecs=('zlib',) сужает выбор сразу для всех пиров.
+    """
+
+    ZLIB, DEFLATE, DICT = 'zlib', 'deflate', 'dict'
+    CODECS = (DICT, DEFLATE, ZLIB)
+
+    def __init__(self, codecs=CODECS, dictionary: bytes = CHAT_DICTIONARY,
+                 min_size: int = 16, dict_max: int = 1024, fast_min: int = 64 * 1024,
+                 max_size: int = 0xFFFFFF):
+        self.codecs = frozenset(codecs)
+        self.dictionary = dictionary
+        self.min_size = min_size
+        self.dict_max = dict_max
+        self.fast_min = fast_min
+        self.max_size = max_size  # предел распакованного payload (защита от zip-бомб)
+        # окно — наименьшее, в которое помещается словарь
+        self._dict_wbits = min(15, max(9, (len(dictionary) + 262).bit_length()))
+
+    def compress(self, flags: int, payload) -> tuple:
+        """(flags, payload) — сжатый, если это выгодно, иначе исходный."""
+        size = len(payload)
+        flags &= ~(PacketFlag.COMPRESSED | _CODEC_BITS)
+        if size < self.min_size:
+            return flags, payload
+        if size < self.dict_max and self.DICT in self.codecs:
+            out = self._deflate(payload, 6, self._dict_wbits, 4, self.dictionary)
+            codec = PacketFlag.DICT
+        elif self.DEFLATE in self.codecs:
+            # окно больше payload бесполезно, а его подготовка стоит дороже сжатия
+            wbits = min(15, max(9, size.bit_length()))
+            level = 6 if size < self.fast_min else 1
+            out = self._deflate(payload, level, wbits, 8 if wbits == 15 else 4)
+            codec = PacketFlag.DEFLATE
+        elif self.ZLIB in self.codecs:
+            out = zlib.compress(payload, 6 if size < self.fast_min else 1)
+            codec = 0
+        else:
+            return flags, payload
+        if len(out) >= size:
+            return flags, payload
+        return flags | PacketFlag.COMPRESSED | codec, out
+
+    @staticmethod
+    def _deflate(payload, level: int, wbits: int, mem_level: int, zdict: bytes = None) -> bytes:
+        if zdict is None:
+            c = zlib.compressobj(level, zlib.DEFLATED, -wbits, mem_level)
+        else:
+            c = zlib.compressobj(level, zlib.DEFLATED, -wbits, mem_level, zdict=zdict)
+        return c.compress(payload) + c.flush()
+
+    def decompress(self, flags: int, payload) -> bytes:
+        if flags & PacketFlag.DICT:
+            d = zlib.decompressobj(-15, zdict=self.dictionary)
+        elif flags & PacketFlag.DEFLATE:
+            d = zlib.decompressobj(-15)
+        else:
+            d = zlib.decompressobj()
+        out = d.decompress(payload, self.max_size)
+        if d.unconsumed_tail:
+            raise ValueError("Decompressed payload too large")
+        if not d.eof:
+            raise ValueError("Truncated compressed payload")
+        return out
+
+
+def train_dictionary(samples, size: int = 2048) -> bytes:
+    """Словарь для Compressor из примеров сообщений.
+
+    Берёт слова и фразы из 2–3 слов, встречающиеся больше одного раза,
+    в порядке выгоды (частота * длина) до заполнения size байт; самые
+    выгодные — в конец словаря.
+    """
+    counts = Counter()
+    for text in samples:
+        words = text.split()
+        for n in (1, 2, 3):
+            for i in range(len(words) - n + 1):
+                counts[' '.join(words[i:i + n])] += 1
+    ranked = sorted(((c * len(p.encode('utf-8')), p) for p, c in counts.items() if c > 1),
+                    reverse=True)
+    chosen, total = [], 0
+    for _, phrase in ranked:
+        cost = len(phrase.encode('utf-8')) + 1
+        if total + cost > size or any(phrase in other for other in chosen):
+            continue
+        chosen.append(phrase)
+        total += cost
+    return ' '.join(reversed(chosen)).encode('utf-8')
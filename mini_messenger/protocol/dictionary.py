@@ -0,0 +1,48 @@
+"""Общий словарь для сжатия коротких сообщений чата.
+
+Частые фрагменты переписки (русский и английский, ссылки, время,
+смайлы). deflate кодирует совпадение со словарём ссылкой назад, поэтому
+самые частые фрагменты стоят в конце — ближе к началу сообщения, ссылки
+на них короче. Словарь зашит в протокол и одинаков у всех сторон: ни
+его версия, ни его идентификатор не передаются, поэтому любая правка
+несовместима с пиром, собранным со старым словарём, — пакеты DICT он
+раскодирует в мусор или отвергнет. Собственный словарь (train_dictionary()
+из compression) годится только там, где он гарантированно один у всех.
+"""
+
+_PHRASES = (
+    # редкие — в начале
+    "https://docs.google.com/document/d/", "https://github.com/", "https://www.youtube.com/watch?v=",
+    "https://t.me/", ".pdf", ".png", ".jpg", "скриншот", "screenshot", "документ", "document",
+    "презентация", "договор", "счёт", "оплата", "invoice", "payment", "адрес", "address",
+    "пароль", "password", "ссылка", "link", "файл", "file", "папка", "folder",
+    "понедельник", "вторник", "среда", "четверг", "пятница", "суббота", "воскресенье",
+    "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday",
+    "января", "февраля", "марта", "апреля", "мая", "июня", "июля", "августа", "сентября",
+    "октября", "ноября", "декабря",
+    "День рождения", "Happy birthday!", "Поздравляю!", "Congratulations!",
+    "встреча", "meeting", "созвон", "call", "zoom", "офис", "office", "дома", "at home",
+    "работа", "work", "проект", "project", "задача", "task", "релиз", "release", "баг", "bug",
+    "тест", "test", "деплой", "deploy", "сервер", "server", "ошибка", "error",
+    "Доброе утро", "Good morning", "Спокойной ночи", "Good night", "Добрый вечер",
+    "С праздником", "Как выходные?", "How was your weekend?",
+    "пожалуйста", "please", "извини", "sorry", "не могу", "can't", "не знаю", "I don't know",
+    "подожди", "wait", "минуту", "a minute", "скоро буду", "on my way", "опаздываю", "running late",
+    "в пробке", "уже выхожу", "I'm leaving now", "буду через 10 минут", "be there in 10 minutes",
+    "давай", "let's", "завтра", "tomorrow", "сегодня", "today", "вчера", "yesterday",
+    "вечером", "tonight", "утром", "in the morning", "после обеда", "after lunch",
+    "в 10:00", "в 12:00", "в 15:00", "в 18:00", "в 19:00", "at 10", "at 3pm",
+    "ахах", "хаха", "haha", "lol", "ок", "ok", "окей", "okay", "ага", "угу", "ну", "yeah",
+    ":)", ":(", ";)", ":D", "))", "😂", "👍", "❤️", "🙏", "🔥", "😊", "🤔",
+    "Привет! ", "Привет, ", "Hi! ", "Hey, ", "Hello, ", "Как дела?", "How are you?",
+    "Всё хорошо", "I'm fine", "Отлично", "Great", "Спасибо!", "Thanks!", "Thank you!",
+    "Не за что", "You're welcome", "Конечно", "Sure", "Да, ", "Нет, ", "Yes, ", "No, ",
+    "что ", "как ", "где ", "когда ", "почему ", "это ", "тоже ", "уже ", "ещё ", "если ",
+    "what ", "when ", "where ", "why ", "this ", "that ", "just ", "also ", "have ", "will ",
+    " и ", " в ", " на ", " не ", " что ", " я ", " ты ", " мы ", " с ", " по ", " за ", " к ",
+    " the ", " to ", " and ", " you ", " it ", " is ", " in ", " of ", " for ", " I ",
+    # частые — в конце
+    "?", "!", ". ", ", ",
+)
+
+CHAT_DICTIONARY = ' '.join(_PHRASES).encode('utf-8')
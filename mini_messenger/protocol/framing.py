@@ -0,0 +1,73 @@
+import struct
+from .packet import Packet
+
+_LENGTH = struct.Struct('!I')
+
+
+class FrameDecoder:
+    """Инкрементальный декодер кадров для потокового (TCP) транспорта.
+
+    feed() принимает очередной кусок данных из сокета и возвращает список
+    полных кадров (memoryview: заголовок + payload). Кадры, целиком
+    лежащие в пришедшем куске, отдаются срезами без копирования; в буфер
+    копируется только незавершённый хвост и ровно столько следующего
+    куска, сколько нужно, чтобы его дособрать.
+    """
+
+    def __init__(self, max_payload: int = Packet.MAX_PAYLOAD):
+        self.max_payload = max_payload
+        self._pending = bytearray()
+        self._needed = 0  # сколько байт нужно в _pending до следующего разбора
+        self.frames_decoded = 0
+        self.bytes_copied = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def feed(self, data) -> list:
+        view = memoryview(data)
+        end = len(view)
+        pos = 0
+        frames = []
+        header_size = Packet.HEADER_SIZE
+        if self._pending:
+            # дописываем в хвост только недостающее до конца кадра, остальное
+            # разбирается срезами; на _pending нет живых memoryview, пока кадр не собран
+            pending = self._pending
+            while True:
+                take = min(self._needed - len(pending), end - pos)
+                pending += view[pos:pos + take]
+                self.bytes_copied += take
+                pos += take
+                if len(pending) < self._needed:
+                    return []
+                if self._needed != header_size:
+                    break
+                length = _LENGTH.unpack_from(pending, Packet.LENGTH_OFFSET)[0]
+                if length > self.max_payload:
+                    raise ValueError("Frame too large")
+                self._needed = header_size + length
+                if not length:
+                    break
+            frames.append(memoryview(pending))
+            self._pending = bytearray()
+
+        while end - pos >= header_size:
+            length = _LENGTH.unpack_from(view, pos + Packet.LENGTH_OFFSET)[0]
+            if length > self.max_payload:
+                raise ValueError("Frame too large")
+            frame_end = pos + header_size + length
+            if frame_end > end:
+                break
+            frames.append(view[pos:frame_end])
+            pos = frame_end
+
+        if pos < end:
+            tail = end - pos
+            self._pending = bytearray(view[pos:])
+            self.bytes_copied += tail
+            self._needed = header_size + length if tail >= header_size else header_size
+
+        self.frames_decoded += len(frames)
+        return frames
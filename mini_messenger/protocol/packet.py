@@ -1,32 +1,111 @@
 import struct
-import zlib
 from .types import PacketFlag
+from .compression import Compressor
+
+# [flags:1][msg_type:1][chat_type:1][reserved:1][chat_id:4][length:4]
+# с флагом SEQ payload начинается с [seq:8]; length его включает
+_HEADER = struct.Struct('!BBBxII')
+_SEQ = struct.Struct('!Q')
+_CHAT_ID = struct.Struct('!I')
+# payload SYNC: запрос клиента и ответ сервера после страницы сообщений
+SYNC_REQUEST = struct.Struct('!QH')  # after, limit
+SYNC_REPLY = struct.Struct('!QB')    # through (seq последнего отданного), more
+
 
 class Packet:
-    HEADER_SIZE = 8  # [flags:1][msg_type:1][chat_type:1][reserved:1][chat_id:4]
-    
+    HEADER_SIZE = _HEADER.size  # 12 байт
+    CHAT_ID_OFFSET = 4  # смещение поля chat_id внутри заголовка
+    LENGTH_OFFSET = 8  # смещение поля length внутри заголовка
+    MAX_PAYLOAD = 0xFFFFFF  # 16MB лимит
+    # кодек и уровень по размеру, только если сжатие выгодно (см. Compressor)
+    compressor = Compressor(max_size=MAX_PAYLOAD)
+
     @staticmethod
-    def pack(flags: int, msg_type: int, chat_type: int, chat_id: int, payload: bytes) -> bytes:
-        if len(payload) > 0xFFFFFF:  # 16MB лимит
+    def _prepare(flags: int, payload) -> tuple:
+        if len(payload) > Packet.MAX_PAYLOAD:
             raise ValueError("Payload too large")
-        
+
         # Сжатие если нет флага ENCRYPTED (шифрование уже "сжимает" энтропию)
-        if not (flags & PacketFlag.ENCRYPTED) and len(payload) > 64:
-            payload = zlib.compress(payload, level=1)
-            flags |= PacketFlag.COMPRESSED
-        
-        header = struct.pack('!BBBI', flags, msg_type, chat_type, chat_id)
+        if not (flags & PacketFlag.ENCRYPTED):
+            flags, payload = Packet.compressor.compress(flags, payload)
+        return flags, payload
+
+    @staticmethod
+    def pack(flags: int, msg_type: int, chat_type: int, chat_id: int, payload: bytes,
+             seq: int | None = None) -> bytes:
+        flags, payload = Packet._prepare(flags, payload)
+        if seq is not None:
+            return (_HEADER.pack(flags | PacketFlag.SEQ, msg_type, chat_type, chat_id,
+                                 _SEQ.size + len(payload)) + _SEQ.pack(seq) + payload)
+        header = _HEADER.pack(flags, msg_type, chat_type, chat_id, len(payload))
         return header + payload
-    
+
+    @staticmethod
+    def stamp(frame, seq: int | None) -> bytes:
+        """Кадр с номером seq (флаг SEQ); payload не пересобирается и не
+        пересжимается. seq=None — кадр как есть."""
+        if seq is None:
+            return bytes(frame)
+        flags, msg_type, chat_type, chat_id, length = _HEADER.unpack_from(frame)
+        body = Packet.HEADER_SIZE
+        if flags & PacketFlag.SEQ:  # прежний номер заменяется
+            body += _SEQ.size
+            length -= _SEQ.size
+        return (_HEADER.pack(flags | PacketFlag.SEQ, msg_type, chat_type, chat_id,
+                             _SEQ.size + length) + _SEQ.pack(seq) + frame[body:])
+
+    @staticmethod
+    def chat_id(frame) -> int:
+        """chat_id из заголовка, без разбора payload."""
+        return _CHAT_ID.unpack_from(frame, Packet.CHAT_ID_OFFSET)[0]
+
     @staticmethod
-    def unpack(data: bytes) -> tuple:
+    def seq(frame) -> int | None:
+        """Номер сообщения из кадра с флагом SEQ, иначе None."""
+        if frame[0] & PacketFlag.SEQ:
+            return _SEQ.unpack_from(frame, Packet.HEADER_SIZE)[0]
+        return None
+
+    @staticmethod
+    def pack_into(buffer, offset: int, flags: int, msg_type: int, chat_type: int,
+                  chat_id: int, payload: bytes) -> int:
+        """Записывает пакет в buffer (bytearray/memoryview) начиная с offset.
+
+        Возвращает количество записанных байт. Буфер должен вмещать
+        заголовок и (возможно сжатый) payload, иначе ValueError.
+        """
+        flags, payload = Packet._prepare(flags, payload)
+        size = Packet.HEADER_SIZE + len(payload)
+        if offset + size > len(buffer):
+            raise ValueError("Buffer too small")
+        _HEADER.pack_into(buffer, offset, flags, msg_type, chat_type, chat_id, len(payload))
+        buffer[offset + Packet.HEADER_SIZE:offset + size] = payload
+        return size
+
+    @staticmethod
+    def frame_size(data, offset: int = 0) -> int:
+        """Полный размер кадра по заголовку, начинающемуся с offset."""
+        length = struct.unpack_from('!I', data, offset + Packet.LENGTH_OFFSET)[0]
+        return Packet.HEADER_SIZE + length
+
+    @staticmethod
+    def unpack(data) -> tuple:
+        """Разбирает один кадр из bytes/bytearray/memoryview.
+
+        Для memoryview payload возвращается срезом без копирования
+        (если он не был сжат).
+        """
         if len(data) < Packet.HEADER_SIZE:
             raise ValueError("Incomplete header")
-        
-        flags, msg_type, chat_type, chat_id = struct.unpack('!BBBI', data[:Packet.HEADER_SIZE])
-        payload = data[Packet.HEADER_SIZE:]
-        
+
+        flags, msg_type, chat_type, chat_id, length = _HEADER.unpack_from(data)
+        end = Packet.HEADER_SIZE + length
+        if len(data) < end:
+            raise ValueError("Incomplete payload")
+        start = Packet.HEADER_SIZE + _SEQ.size if flags & PacketFlag.SEQ else Packet.HEADER_SIZE
+        payload = data[start:end]
+
         if flags & PacketFlag.COMPRESSED:
-            payload = zlib.decompress(payload)
-        
+            payload = Packet.compressor.decompress(flags, payload)
+
         return flags, msg_type, chat_type, chat_id, payload
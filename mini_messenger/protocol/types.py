@@ -6,11 +6,16 @@ class ChatType(IntEnum):
     CHANNEL = 0x03  # Канал (только отправка от админа)
 
 class PacketFlag(IntEnum):
-    COMPRESSED = 0x01
+    COMPRESSED = 0x01  # payload сжат; кодек — в битах DEFLATE/DICT (нет битов — zlib)
     ENCRYPTED  = 0x02
     SYSTEM     = 0x04  # Системное сообщение (вступление в группу и т.д.)
+    DEFLATE    = 0x08  # сырой deflate, без заголовка и контрольной суммы zlib
+    DICT       = 0x10  # сырой deflate с общим словарём чатов (короткие сообщения)
+    SEQ        = 0x20  # перед payload — номер сообщения в чате [seq:8]
 
 class MessageType(IntEnum):
     TEXT   = 0x01
     KEY_EX = 0x02  # Обмен ключами для E2EE
     JOIN   = 0x03  # Запрос на вступление в группу/канал
+    SYNC   = 0x04  # Догрузка пропущенного: запрос [after:8][limit:2], ответ [through:8][more:1]
+    PING   = 0x05  # Проверка связи: сервер шлёт простаивающему соединению, клиент отвечает тем же
@@ -0,0 +1,167 @@
+import asyncio
+import time
+
+
+class RateLimiter:
+    """Token bucket на множество ключей (GCRA): на ключ хранится одно число.
+
+    Вместо пары «жетоны, время» хранится момент, когда ведро снова станет
+    полным (TAT). Запрос стоимостью cost проходит, если после него TAT
+    опережает текущее время не больше, чем на burst / rate. Полное ведро
+    неотличимо от отсутствующего, поэтому ключи живут в двух поколениях:
+    раз в период (не меньше времени наполнения ведра) старое поколение
+    выбрасывается целиком, а тронутые за период ключи переезжают в новое.
+    Простаивающие ведра исчезают без обхода словаря.
+    """
+
+    def __init__(self, rate: float, burst: float | None = None, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        burst = rate if burst is None else burst
+        self.rate = rate
+        self.burst = burst
+        self._interval = 1.0 / rate
+        self._tolerance = burst * self._interval + 1e-9  # допуск на округление float
+        self._period = max(self._tolerance, 1.0)
+        self._clock = clock
+        self._current = {}   # key: TAT
+        self._previous = {}
+        self._rotate_at = clock() + self._period
+
+    def _rotate(self, now: float):
+        # за целый период нетронутые ведра успели наполниться — забываем их
+        self._previous = self._current if now < self._rotate_at + self._period else {}
+        self._current = {}
+        self._rotate_at = now + self._period
+
+    def allow(self, key, cost: float = 1) -> bool:
+        now = self._clock()
+        if now >= self._rotate_at:
+            self._rotate(now)
+        tat = self._current.get(key)
+        if tat is None:
+            tat = self._previous.pop(key, now)
+        if tat < now:
+            tat = now
+        new = tat + cost * self._interval
+        if new - self._tolerance > now:
+            self._current[key] = tat
+            return False
+        self._current[key] = new
+        return True
+
+    def forget(self, key):
+        self._current.pop(key, None)
+        self._previous.pop(key, None)
+
+    def __len__(self):
+        return len(self._current) + len(self._previous)
+
+
+class AdmissionControl:
+    """Допуск соединений и входящих кадров.
+
+    Лимиты сообщений — RateLimiter на соединение, на пользователя и на
+    чат (rate в секунду, burst — сколько можно сразу; None — без лимита).
+    Кадр сверх лимита отбрасывается до распаковки; лимит чата считает
+    только сообщения (TEXT), служебные кадры — лимиты соединения и
+    пользователя. max_conns_per_ip ограничивает одновременные соединения
+    с одного адреса, max_frame — payload кадра (больше — разрыв).
+
+    shed_lag — сброс нагрузки: пока цикл событий просыпается позже
+    положенного больше чем на shed_lag секунд, новые соединения и
+    догрузка истории (SYNC) не принимаются.
+    """
+
+    MAX_FRAME = 4 * 1024 * 1024
+    LAG_INTERVAL = 0.05  # с, период замера задержки цикла
+
+    def __init__(self, conn_rate: float | None = None, conn_burst: float | None = None,
+                 user_rate: float | None = None, user_burst: float | None = None,
+                 chat_rate: float | None = None, chat_burst: float | None = None,
+                 max_conns_per_ip: int | None = None, max_frame: int = MAX_FRAME,
+                 shed_lag: float | None = None, clock=time.monotonic):
+        self.conn = RateLimiter(conn_rate, conn_burst, clock) if conn_rate else None
+        self.user = RateLimiter(user_rate, user_burst, clock) if user_rate else None
+        self.chat = RateLimiter(chat_rate, chat_burst, clock) if chat_rate else None
+        self.max_conns_per_ip = max_conns_per_ip
+        self.max_frame = max_frame
+        self.shed_lag = shed_lag
+        self.lag = 0.0
+        self._per_ip = {}  # ip: открытых соединений (только при max_conns_per_ip)
+        self._lag_task = None
+        self.rejected = {'conn': 0, 'user': 0, 'chat': 0, 'ip': 0, 'shed': 0}
+
+    @property
+    def shedding(self) -> bool:
+        return self.shed_lag is not None and self.lag > self.shed_lag
+
+    # --- соединения ---
+
+    def connect(self, ip) -> bool:
+        """Можно ли принять соединение; принятое закрывается через disconnect(ip)."""
+        if self.shedding:
+            self.rejected['shed'] += 1
+            return False
+        if self.max_conns_per_ip is not None and ip is not None:
+            n = self._per_ip.get(ip, 0)
+            if n >= self.max_conns_per_ip:
+                self.rejected['ip'] += 1
+                return False
+            self._per_ip[ip] = n + 1
+        return True
+
+    def disconnect(self, ip, conn=None):
+        n = self._per_ip.get(ip)
+        if n is not None:
+            if n <= 1:
+                del self._per_ip[ip]
+            else:
+                self._per_ip[ip] = n - 1
+        if conn is not None and self.conn is not None:
+            self.conn.forget(conn)
+
+    # --- кадры ---
+
+    def allow(self, conn, user_id: str, chat_id=None) -> bool:
+        """Кадр соединения conn; chat_id — для сообщений в чат."""
+        if self.conn is not None and not self.conn.allow(conn):
+            self.rejected['conn'] += 1
+            return False
+        if self.user is not None and not self.user.allow(user_id):
+            self.rejected['user'] += 1
+            return False
+        if chat_id is not None and self.chat is not None and not self.chat.allow(chat_id):
+            self.rejected['chat'] += 1
+            return False
+        return True
+
+    def allow_sync(self) -> bool:
+        if self.shedding:
+            self.rejected['shed'] += 1
+            return False
+        return True
+
+    @property
+    def limits_frames(self) -> bool:
+        return self.conn is not None or self.user is not None or self.chat is not None
+
+    def buckets(self) -> int:
+        return sum(len(limiter) for limiter in (self.conn, self.user, self.chat) if limiter)
+
+    # --- задержка цикла ---
+
+    def watch_loop(self):
+        if self.shed_lag is not None and self._lag_task is None:
+            self._lag_task = asyncio.create_task(self._watch_loop())
+
+    async def _watch_loop(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.LAG_INTERVAL)
+            self.lag = max(0.0, time.perf_counter() - start - self.LAG_INTERVAL)
+
+    def close(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
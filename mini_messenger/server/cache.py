@@ -1,70 +1,364 @@
+import asyncio
 import os
 import json
+import time
+import uuid
+
+from .near_cache import NearCache
+from .history import MessageRecord
+from .codec import BinaryCodec, codec_for
+
+# Добавление пачки сообщений: seq выдаётся INCRBY, записи
+# "[ts, мс:6][запись кодека]" кладутся в список (seq следует из позиции),
+# голова обрезается по лимиту и по возрасту.
+# KEYS: log, seq; ARGV: limit, cutoff в мс (0 — без TTL), записи...
+_APPEND_LUA = """
+local n = #ARGV - 2
+local last = redis.call('INCRBY', KEYS[2], n)
+for i = 1, n do
+  redis.call('RPUSH', KEYS[1], ARGV[i + 2])
+end
+local limit = tonumber(ARGV[1])
+if limit > 0 then
+  redis.call('LTRIM', KEYS[1], -limit, -1)
+end
+local cutoff = tonumber(ARGV[2])
+if cutoff > 0 then
+  for _ = 1, 1000 do
+    local head = redis.call('LINDEX', KEYS[1], 0)
+    if not head then break end
+    local b1, b2, b3, b4, b5, b6 = string.byte(head, 1, 6)
+    if ((((b1 * 256 + b2) * 256 + b3) * 256 + b4) * 256 + b5) * 256 + b6 >= cutoff then
+      break
+    end
+    redis.call('LPOP', KEYS[1])
+  end
+end
+return last
+"""
+
+# Страница истории: в списке лежат подряд идущие seq, поэтому индекс
+# вычисляется из последнего seq и длины списка. Семантика как у
+# HistoryStore.page; ARGV: after (-1 — не задан), before (0 — не задан), limit.
+# Возвращает {seq первой записи, записи}.
+_PAGE_LUA = """
+local last = tonumber(redis.call('GET', KEYS[2]) or '0')
+local first = last - redis.call('LLEN', KEYS[1]) + 1
+local after, before, limit = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local hi = last
+if before > 0 then hi = math.min(hi, before - 1) end
+local lo
+if after >= 0 then
+  lo = math.max(first, after + 1)
+  hi = math.min(hi, lo + limit - 1)
+else
+  lo = math.max(first, hi - limit + 1)
+end
+if hi < lo then return {} end
+return {lo, redis.call('LRANGE', KEYS[1], lo - first, hi - first)}
+"""
 
 
 class RedisCache:
-    """Простой распределённый кэш на базе Redis.
+    """Простой распределённый кэш на базе Redis (asyncio).
 
     Используется для хранения метаданных чатов (тип, имя, участники) и
     очереди сообщений. Клиенты могут запускаться на нескольких серверах,
     разделяющих Redis, что даёт базовую поддержку распределённости.
+
+    Запись не блокирует цикл событий: store_chat, add_member и add_message
+    только ставят команды в очередь, а в конце текущего тика всё
+    накопленное уходит одним MULTI-пайплайном (один round-trip).
+    Чтения — корутины; перед чтением дожидаются записи очереди.
+
+    Метаданные чата лежат в хэше chat:{id} по полю на атрибут, участники
+    — в множестве chat:{id}:members, история — в списке chat:{id}:log.
+    Клиент redis должен отдавать bytes (без decode_responses).
+
+    Метаданные и участники чатов дополнительно кэшируются в памяти
+    процесса (NearCache). Каждая запись о чате публикуется в канал
+    INVALIDATE_CHANNEL, и остальные серверы, разделяющие Redis,
+    сбрасывают свою локальную копию (см. start_invalidation).
     """
 
-    def __init__(self, url: str | None = None):
-        try:
-            import redis
-        except ImportError:
-            raise RuntimeError("redis package is required for RedisCache")
+    INVALIDATE_CHANNEL = "chats:invalidate"
+
+    def __init__(self, url: str | None = None, client=None,
+                 local_size: int = 10_000, local_ttl: float = 30.0,
+                 history_limit: int = 10_000, history_ttl: float | None = None,
+                 codec=None):
+        if client is None:
+            try:
+                import redis.asyncio as aioredis
+            except ImportError:
+                raise RuntimeError("redis package is required for RedisCache")
+
+            self.url = url or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+            # записи двоичные, поэтому без decode_responses
+            client = aioredis.from_url(self.url)
+        else:
+            self.url = url
+        self.r = client
+        # формат записей (см. codec.py); прочитать можно любой известный
+        self.codec = codec or BinaryCodec()
+
+        self._ops = []       # команды текущего тика: [method, key, *args]
+        self._results = []   # (индекс команды, callback(результат)) текущего тика
+        self._appends = {}   # key: команда добавления сообщений текущего тика
+        self._batch = None   # future, завершится после записи _ops
+        self._lock = asyncio.Lock()  # пакеты пишутся строго по порядку
+        self._flushes = set()
+        self.round_trips = 0
+        self.commands = 0
+        # гистограммы времени round-trip (Metrics.histogram), если заданы
+        self.write_rtt = None
+        self.read_rtt = None
+
+        self.local = NearCache(local_size, local_ttl)
+        self.node_id = uuid.uuid4().hex[:12]  # чтобы не сбрасывать кэш своими же событиями
+        self._epoch = 0  # растёт при любом изменении чата; защищает от гонки чтения
+        self._listener = None
+
+        # история: лимит сообщений на чат и TTL, секунд
+        self.history_limit = history_limit
+        self.history_ttl = history_ttl
+        self._append_script = self.r.register_script(_APPEND_LUA)
+        self._page_script = self.r.register_script(_PAGE_LUA)
+
+    # --- запись: пакетирование по тикам ---
+
+    def _queue(self, *op):
+        if self._batch is None:
+            loop = asyncio.get_running_loop()
+            self._batch = loop.create_future()
+            loop.call_soon(self._start_flush)
+        op = list(op)
+        self._ops.append(op)
+        return op
+
+    def _start_flush(self):
+        ops, results, batch = self._ops, self._results, self._batch
+        self._ops, self._results, self._appends, self._batch = [], [], {}, None
+        task = asyncio.create_task(self._flush(ops, results, batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, ops: list, results: list, batch: asyncio.Future):
+        async with self._lock:
+            try:
+                pipe = self.r.pipeline(transaction=True)
+                for method, *args in ops:
+                    if isinstance(method, str):
+                        getattr(pipe, method)(*args)
+                    else:  # Lua-скрипт: (keys, args); execute() сам загрузит его при NOSCRIPT
+                        keys, argv = args
+                        pipe.scripts.add(method)
+                        pipe.evalsha(method.sha, len(keys), *keys, *argv)
+                start = time.perf_counter()
+                replies = await pipe.execute()
+                if self.write_rtt is not None:
+                    self.write_rtt.since(start)
+                self.round_trips += 1
+                self.commands += len(ops)
+            except Exception as e:
+                print(f"[cache] пакет из {len(ops)} команд не записан: {e}")
+                replies = None
+            finally:
+                batch.set_result(None)
+            for index, callback in results:
+                callback(None if replies is None else replies[index])
+
+    async def flush(self):
+        """Дожидается записи всех поставленных в очередь команд."""
+        if self._batch is not None:
+            await self._batch
+        async with self._lock:
+            pass
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+        await self.flush()
+        await self.r.aclose()
 
-        self.url = url or os.getenv("REDIS_URL", "redis://localhost:6379/0")
-        # decode_responses=True позволяет работать со строками вместо байтов
-        self.r = redis.from_url(self.url, decode_responses=True)
+    def stats(self) -> dict:
+        return {
+            "round_trips": self.round_trips,
+            "commands": self.commands,
+            "local": self.local.stats(),
+        }
+
+    # --- инвалидация локального кэша между серверами ---
+
+    def _changed(self, chat_id: int):
+        self._epoch += 1
+        self._queue("publish", self.INVALIDATE_CHANNEL, json.dumps([self.node_id, chat_id]))
+
+    def start_invalidation(self):
+        """Запускает подписку на инвалидации других серверов."""
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            try:
+                pubsub = self.r.pubsub()
+                await pubsub.subscribe(self.INVALIDATE_CHANNEL)
+                # пока подписки не было, инвалидации могли потеряться
+                self.local.clear()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    node_id, chat_id = json.loads(message["data"])
+                    if node_id != self.node_id:
+                        self._epoch += 1
+                        self.local.invalidate(chat_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[cache] подписка на инвалидацию прервана: {e}")
+                await asyncio.sleep(1)
 
     def store_chat(self, chat_id: int, chat_obj: dict):
-        # подготовим объект, конвертируя множество в список
-        obj = {**chat_obj}
-        if "members" in obj and isinstance(obj["members"], (set, list)):
-            obj["members"] = list(obj["members"])
-        # не сохраняем сообщения в основном хэше, они хранятся в списке
-        obj.pop("messages", None)
-        self.r.hset("chats", chat_id, json.dumps(obj))
-        # хранение множества участников отдельно для быстрого доступа
+        # участники и сообщения живут в отдельных ключах, в хэше только метаданные
+        obj = {k: v for k, v in chat_obj.items() if k not in ("members", "messages")}
+        key = f"chat:{chat_id}"
+        fields = self.codec.encode_chat(obj)  # ValueError — до постановки команд в очередь
+        # замена хэша целиком: поля со значением None не пишутся
+        self._queue("delete", key)
+        self._queue("hset", key, None, None, fields)  # (name, key, value, mapping)
         if "members" in chat_obj:
             key = f"chat:{chat_id}:members"
-            # перезаписать целиком
-            self.r.delete(key)
+            # замена множества атомарна: DEL и SADD в одном MULTI
+            self._queue("delete", key)
             if chat_obj["members"]:
-                self.r.sadd(key, *chat_obj["members"])
+                self._queue("sadd", key, *chat_obj["members"])
+        self._changed(chat_id)
+        if "members" not in chat_obj:
+            # участники в Redis не менялись, но здесь их нет: пустое множество
+            # в кэше было бы неправдой, пусть следующее чтение загрузит чат
+            self.local.invalidate(chat_id)
+            return
+        obj["members"] = set(chat_obj["members"])
+        self.local.put(chat_id, obj)
+
+    def add_member(self, chat_id: int, user_id: str):
+        # инкрементально: хэш метаданных не переписывается
+        self._queue("sadd", f"chat:{chat_id}:members", user_id)
+        self._changed(chat_id)
+        chat = self.local.peek(chat_id)
+        if chat is not None:
+            chat["members"].add(user_id)
+
+    def add_message(self, chat_id: int, message_obj: dict) -> asyncio.Future:
+        """Ставит сообщение в очередь; future получит его seq после записи
+        (None, если пакет записать не удалось)."""
+        key = f"chat:{chat_id}:log"
+        record = int(time.time() * 1000).to_bytes(6, "big") + self.codec.encode_message(
+            message_obj["from"], message_obj["data"], message_obj["encrypted"])
+        future = asyncio.get_running_loop().create_future()
+        pending = self._appends.get(key)
+        if pending is not None:
+            # сообщения одного чата за тик — одним вызовом скрипта
+            op, futures = pending
+            op[2].append(record)
+            futures.append(future)
+            return future
+
+        cutoff = int((time.time() - self.history_ttl) * 1000) if self.history_ttl else 0
+        op = self._queue(self._append_script, [key, f"chat:{chat_id}:seq"],
+                         [self.history_limit, cutoff, record])
+        futures = [future]
+        self._appends[key] = (op, futures)
+
+        def resolve(last_seq):
+            # скрипт вернул seq последнего сообщения пачки
+            for i, f in enumerate(futures):
+                if not f.done():
+                    f.set_result(None if last_seq is None else last_seq - len(futures) + 1 + i)
+        self._results.append((len(self._ops) - 1, resolve))
+        return future
 
-    def get_chat(self, chat_id: int) -> dict | None:
-        val = self.r.hget("chats", chat_id)
-        if not val:
+    # --- чтение ---
+
+    async def get_chat(self, chat_id: int) -> dict | None:
+        chat = await self._load_chat(chat_id)
+        if chat is None:
             return None
-        obj = json.loads(val)
-        if "members" in obj:
-            obj["members"] = set(obj["members"])
-        # добавим сообщения из списка, если нужно
-        return obj
+        # вызывающий может менять результат, кэш отдаёт копию
+        return {**chat, "members": set(chat["members"])}
 
-    def add_member(self, chat_id: int, user_id: str):
-        key = f"chat:{chat_id}:members"
-        self.r.sadd(key, user_id)
-        # синхронизируем основной хэш
-        chat = self.get_chat(chat_id)
-        if chat:
-            chat_members = chat.get("members", set())
-            chat_members.add(user_id)
-            chat["members"] = chat_members
-            self.store_chat(chat_id, chat)
-
-    def get_members(self, chat_id: int) -> set:
-        return set(self.r.smembers(f"chat:{chat_id}:members"))
-
-    def add_message(self, chat_id: int, message_obj: dict):
-        key = f"chat:{chat_id}:messages"
-        self.r.rpush(key, json.dumps(message_obj))
-
-    def get_messages(self, chat_id: int) -> list:
-        key = f"chat:{chat_id}:messages"
-        raw = self.r.lrange(key, 0, -1)
-        return [json.loads(m) for m in raw]
+    async def _load_chat(self, chat_id: int) -> dict | None:
+        chat = self.local.get(chat_id)
+        if chat is not None:
+            return chat
+        epoch = self._epoch
+        await self.flush()
+        pipe = self.r.pipeline(transaction=False)
+        pipe.hgetall(f"chat:{chat_id}")
+        pipe.smembers(f"chat:{chat_id}:members")
+        pipe.hget("chats", chat_id)  # прежний формат: JSON в общем хэше
+        start = time.perf_counter()
+        fields, members, legacy = await pipe.execute()
+        if self.read_rtt is not None:
+            self.read_rtt.since(start)
+        self.round_trips += 1
+        if fields:
+            chat = codec_for(fields[b"v"][0]).decode_chat(fields)
+        elif legacy:
+            chat = json.loads(legacy)
+        else:
+            return None
+        chat["members"] = {m.decode() for m in members}
+        # пока шёл запрос, чат могли изменить — такой ответ не кэшируем
+        if epoch == self._epoch:
+            self.local.put(chat_id, chat)
+        return chat
+
+    async def has_chat(self, chat_id: int) -> bool:
+        """Есть ли чат; без копии участников, как у get_chat."""
+        return await self._load_chat(chat_id) is not None
+
+    async def get_members(self, chat_id: int) -> set:
+        chat = await self._load_chat(chat_id)
+        if chat is not None:
+            return set(chat["members"])
+        await self.flush()
+        self.round_trips += 1
+        return {m.decode() for m in await self.r.smembers(f"chat:{chat_id}:members")}
+
+    async def get_chat_field(self, chat_id: int, name: str):
+        """Одно поле метаданных чата (HGET, без разбора остальных);
+        None — нет поля или чата."""
+        chat = self.local.get(chat_id)
+        if chat is not None:
+            return chat.get(name)
+        await self.flush()
+        pipe = self.r.pipeline(transaction=False)
+        pipe.hget(f"chat:{chat_id}", "v")
+        pipe.hget(f"chat:{chat_id}", name)
+        self.round_trips += 1
+        version, raw = await pipe.execute()
+        if version is None or raw is None:
+            return None
+        return codec_for(version[0]).decode_field(name, raw)
+
+    async def get_page(self, chat_id: int, after: int | None = None,
+                       before: int | None = None, limit: int = 50) -> list:
+        """Страница истории (MessageRecord по возрастанию seq), как HistoryStore.page."""
+        await self.flush()
+        self.round_trips += 1
+        reply = await self._page_script(
+            keys=[f"chat:{chat_id}:log", f"chat:{chat_id}:seq"],
+            args=[-1 if after is None else after, before or 0, limit],
+        )
+        if not reply:
+            return []
+        first, items = reply
+        records = []
+        for seq, item in enumerate(items, first):
+            body = item[6:]
+            sender, data, encrypted = codec_for(body[0]).decode_message(body)
+            records.append(MessageRecord(seq, int.from_bytes(item[:6], "big") / 1000,
+                                         sender, data, encrypted))
+        return records
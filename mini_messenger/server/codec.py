@@ -0,0 +1,99 @@
+import base64
+import json
+import struct
+
+
+class BinaryCodec:
+    """Двоичный формат записей RedisCache (версия 1).
+
+    Сообщение: [версия:1][флаги:1][длина отправителя:1][отправитель][data]
+    — payload лежит как есть, без base64. Метаданные чата — поля
+    per-chat хэша: type одним байтом, name и admin в UTF-8 (admin=None —
+    поля нет), прочие поля — JSON. Поле "v" хранит версию формата.
+    Значение не того типа — ValueError, до записи чего-либо.
+    """
+
+    VERSION = 1
+    ENCRYPTED = 0x01
+
+    _HEAD = struct.Struct('!BBB')
+
+    def encode_message(self, sender: str, data: bytes, encrypted: bool) -> bytes:
+        s = sender.encode('utf-8')
+        if len(s) > 255:
+            raise ValueError("sender too long")
+        return self._HEAD.pack(self.VERSION, self.ENCRYPTED if encrypted else 0, len(s)) + s + data
+
+    def decode_message(self, body: bytes) -> tuple:
+        """(sender, data, encrypted)"""
+        _, flags, n = self._HEAD.unpack_from(body)
+        end = self._HEAD.size + n
+        return body[self._HEAD.size:end].decode('utf-8'), body[end:], bool(flags & self.ENCRYPTED)
+
+    def encode_chat(self, chat: dict) -> dict:
+        fields = {'v': bytes((self.VERSION,))}
+        for name, value in chat.items():
+            if value is None:
+                continue
+            fields[name] = self.encode_field(name, value)
+        return fields
+
+    def encode_field(self, name: str, value) -> bytes:
+        if name == 'type':
+            if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= 255:
+                raise ValueError(f"chat type must be an int in 0..255, got {value!r}")
+            return bytes((value,))
+        if name in ('name', 'admin'):
+            if not isinstance(value, str):
+                raise ValueError(f"chat {name} must be a str, got {type(value).__name__}")
+            return value.encode('utf-8')
+        return json.dumps(value).encode('utf-8')
+
+    def decode_field(self, name: str, raw: bytes):
+        if name == 'type':
+            return raw[0]
+        if name in ('name', 'admin'):
+            return raw.decode('utf-8')
+        return json.loads(raw)
+
+    def decode_chat(self, fields: dict) -> dict:
+        chat = {'admin': None}
+        for name, raw in fields.items():
+            name = name.decode('utf-8')
+            if name != 'v':
+                chat[name] = self.decode_field(name, raw)
+        return chat
+
+
+class JsonCodec(BinaryCodec):
+    """Прежнее JSON-представление в тех же ключах: сообщение — JSON-объект
+    с payload в base64, каждое поле чата — JSON. Версию заменяет первый
+    байт объекта, "{"."""
+
+    VERSION = ord('{')
+
+    def encode_message(self, sender: str, data: bytes, encrypted: bool) -> bytes:
+        return json.dumps({'from': sender, 'data': base64.b64encode(data).decode(),
+                           'encrypted': encrypted}).encode('utf-8')
+
+    def decode_message(self, body: bytes) -> tuple:
+        m = json.loads(body)
+        return m['from'], base64.b64decode(m['data']), m['encrypted']
+
+    def encode_field(self, name: str, value) -> bytes:
+        super().encode_field(name, value)  # те же проверки типов
+        return json.dumps(value).encode('utf-8')
+
+    def decode_field(self, name: str, raw: bytes):
+        return json.loads(raw)
+
+
+# версия (первый байт записи): кодек; записи читаются при любом текущем кодеке
+CODECS = {codec.VERSION: codec for codec in (BinaryCodec(), JsonCodec())}
+
+
+def codec_for(version: int):
+    codec = CODECS.get(version)
+    if codec is None:
+        raise ValueError(f"unknown record version {version}")
+    return codec
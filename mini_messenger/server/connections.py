@@ -0,0 +1,70 @@
+import itertools
+import uuid
+
+
+class Connection:
+    """Состояние одного соединения: всё, что сервер о нём знает, в одной записи.
+
+    private_key/public_key — текущая пара сервера для KEY_EX, peer_key —
+    ключ клиента; seen — время последних входящих данных (loop.time()).
+    """
+
+    __slots__ = ('conn', 'user_id', 'transport', 'ip', 'private_key', 'public_key',
+                 'peer_key', 'outbound', 'seen')
+
+    def __init__(self, conn, user_id: str, transport: str, ip, seen: float):
+        self.conn = conn
+        self.user_id = user_id
+        self.transport = transport
+        self.ip = ip
+        self.private_key = None
+        self.public_key = None
+        self.peer_key = None
+        self.outbound = None  # OutboundQueue
+        self.seen = seen
+
+    def __repr__(self):
+        return f"Connection({self.user_id!r}, {self.transport}, ip={self.ip!r})"
+
+
+class ConnectionRegistry:
+    """Живые соединения сервера: by_conn (соединение -> Connection) и
+    by_user (user_id -> Connection) — единственные индексы.
+
+    user_id — счётчик с меткой процесса: node (метка узла на общем Redis)
+    или случайная, если node не задан. Без метки после перезапуска снова
+    выдавались бы user_1, ws_1, ... — и новое соединение унаследовало бы
+    членство и права админа, сохранённые DiskStorage под тем же id.
+    remove() забывает запись целиком, вместе с ключами.
+    """
+
+    TCP = 'tcp'
+    WS = 'ws'
+    _PREFIX = {TCP: 'user', WS: 'ws'}
+
+    def __init__(self, node: str | None = None):
+        self.by_conn = {}
+        self.by_user = {}
+        self._counts = {self.TCP: 0, self.WS: 0}
+        self._ids = itertools.count(1)
+        self._tag = f"{node or uuid.uuid4().hex[:6]}_"
+
+    def add(self, conn, transport: str, ip=None, now: float = 0.0) -> Connection:
+        user_id = f"{self._PREFIX[transport]}_{self._tag}{next(self._ids)}"
+        c = self.by_conn[conn] = self.by_user[user_id] = Connection(conn, user_id, transport, ip, now)
+        self._counts[transport] += 1
+        return c
+
+    def remove(self, conn) -> Connection | None:
+        c = self.by_conn.pop(conn, None)
+        if c is not None:
+            del self.by_user[c.user_id]
+            self._counts[c.transport] -= 1
+            c.private_key = c.public_key = c.peer_key = None
+        return c
+
+    def count(self, transport: str) -> int:
+        return self._counts[transport]
+
+    def __len__(self):
+        return len(self.by_conn)
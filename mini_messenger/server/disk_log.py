@@ -0,0 +1,533 @@
+import asyncio
+import mmap
+import os
+import shutil
+import struct
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+
+from .history import MessageRecord
+
+# запись: [длина:4][crc32:4][seq:8][ts:8][flags:1][len(sender):2][sender][data];
+# длина — вся запись целиком, crc32 — всё после первых 8 байт
+_PREFIX = struct.Struct('!II')
+_BODY = struct.Struct('!QdBH')
+_RECORD_MIN = _PREFIX.size + _BODY.size
+# разреженный индекс сегмента: пары (seq, смещение записи)
+_INDEX = struct.Struct('!QQ')
+
+
+def _chat_dir(chat_id) -> str:
+    # chat_id бывает int (TCP) и произвольной строкой (WS) — в имя файла только безопасное
+    if isinstance(chat_id, int):
+        return str(chat_id)
+    return 's_' + str(chat_id).encode('utf-8').hex()
+
+
+def _chat_id(name: str):
+    if name.startswith('s_'):
+        return bytes.fromhex(name[2:]).decode('utf-8')
+    return int(name)
+
+
+def _parse(buf, offset: int, end: int):
+    """Запись по смещению: (seq, ts, flags, sender, data, следующее смещение) или None."""
+    if end - offset < _RECORD_MIN:
+        return None
+    length, crc = _PREFIX.unpack_from(buf, offset)
+    if length < _RECORD_MIN or offset + length > end:
+        return None
+    if zlib.crc32(buf[offset + _PREFIX.size:offset + length]) != crc:
+        return None
+    seq, ts, flags, sender_len = _BODY.unpack_from(buf, offset + _PREFIX.size)
+    start = offset + _RECORD_MIN
+    sender = str(buf[start:start + sender_len], 'utf-8')
+    data = bytes(buf[start + sender_len:offset + length])
+    return seq, ts, flags, sender, data, offset + length
+
+
+class _Segment:
+    """Файл сегмента, его разреженный индекс и отображение в память.
+
+    Индекс читается лениво: закрытые сегменты при старте не трогаются.
+    """
+
+    __slots__ = ('path', 'base', 'size', 'seqs', 'offsets', 'map')
+
+    def __init__(self, path: str, base: int, size: int = 0):
+        self.path = path
+        self.base = base      # seq первой записи
+        self.size = size      # байт записано (включая буфер писателя)
+        self.seqs = None      # array('Q') seq проиндексированных записей
+        self.offsets = None   # array('Q') их смещения
+        self.map = None
+
+    @property
+    def index_path(self) -> str:
+        return self.path[:-4] + '.idx'
+
+    def load_index(self):
+        if self.seqs is not None:
+            return
+        self.seqs, self.offsets = array('Q'), array('Q')
+        try:
+            with open(self.index_path, 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            raw = b''
+        raw = raw[:len(raw) - len(raw) % _INDEX.size]
+        for seq, offset in _INDEX.iter_unpack(raw):
+            # хвост индекса мог пережить усечённый при восстановлении сегмент
+            if offset >= self.size:
+                break
+            self.seqs.append(seq)
+            self.offsets.append(offset)
+        if not self.seqs:
+            self.seqs.append(self.base)
+            self.offsets.append(0)
+
+    def locate(self, seq: int) -> int:
+        """Смещение проиндексированной записи, не дальше которой лежит seq."""
+        self.load_index()
+        return self.offsets[max(0, bisect_right(self.seqs, seq) - 1)]
+
+    def view(self):
+        # активный сегмент растёт — отображение пересоздаётся по мере записи
+        if self.map is None or len(self.map) < self.size:
+            self.unmap()
+            with open(self.path, 'rb') as f:
+                self.map = mmap.mmap(f.fileno(), self.size, access=mmap.ACCESS_READ)
+        return self.map
+
+    def unmap(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+class _DiskChatLog:
+    """Сегменты одного чата и дескрипторы активного сегмента."""
+
+    __slots__ = ('dir', 'segments', 'bases', 'last_seq', 'last_index', 'file', 'buffered')
+
+    def __init__(self, path: str):
+        self.dir = path
+        self.segments = []    # _Segment по возрастанию base
+        self.bases = []       # base сегментов — для bisect
+        self.last_seq = 0
+        self.last_index = 0   # смещение последней записи индекса в активном сегменте
+        self.file = None      # активный сегмент, открыт на дозапись
+        self.buffered = False  # в буфере писателя есть данные, не отданные ОС
+
+    @property
+    def first_seq(self) -> int:
+        return self.segments[0].base if self.segments else self.last_seq + 1
+
+    def flush(self):
+        if self.buffered:
+            self.file.flush()
+            self.buffered = False
+
+    def sync(self):
+        if self.file is not None:
+            self.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self, sync: bool):
+        if self.file is not None:
+            if sync:
+                self.sync()
+            self.file.close()
+            self.file = None
+            self.buffered = False
+        for segment in self.segments:
+            segment.unmap()
+
+
+class DiskHistoryStore:
+    """Персистентная история: append-only лог сегментов на чат.
+
+    Тот же интерфейс, что у HistoryStore (append/page/last_seq/count/
+    trim_expired/drop), но сообщения лежат на диске::
+
+        root/<chat>/<base_seq>.log   записи сегмента
+        root/<chat>/<base_seq>.idx   разреженный индекс (seq, смещение)
+
+    Сегмент закрывается по достижении segment_size, в индекс попадает
+    запись примерно раз в index_interval байт. Чтение идёт через mmap:
+    от ближайшей точки индекса до нужного seq. Retention работает
+    целыми сегментами, а границу по max_messages/max_age дополнительно
+    применяет page(), так что лишнее никогда не возвращается.
+
+    fsync:
+      always — fsync после каждой записи;
+      batch  — групповой коммит: один fsync на все чаты, изменённые за
+               sync_interval секунд (или за sync_batch записей без цикла);
+      never  — сброс на диск остаётся ОС.
+
+    При старте ничего не переигрывается: лог чата открывается лениво,
+    с диска читаются только имена сегментов и хвост активного сегмента
+    после последней точки индекса (недописанная запись отрезается).
+    """
+
+    FSYNC_MODES = ('always', 'batch', 'never')
+
+    def __init__(self, root: str, max_messages: int = 10_000, max_age: float | None = None,
+                 fsync: str = 'batch', segment_size: int = 64 * 1024 * 1024,
+                 index_interval: int = 4096, sync_interval: float = 0.005,
+                 sync_batch: int = 1024, max_open: int = 512, clock=time.time):
+        if fsync not in self.FSYNC_MODES:
+            raise ValueError(f"fsync must be one of {self.FSYNC_MODES}")
+        self.root = root
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.fsync = fsync
+        self.segment_size = segment_size
+        self.index_interval = index_interval
+        self.sync_interval = sync_interval
+        self.sync_batch = sync_batch
+        self.max_open = max_open
+        self._clock = clock
+        self._chats = {}             # chat_id: _DiskChatLog (уже восстановленные)
+        self._open = OrderedDict()   # chat_id: лог с открытым файлом или mmap, LRU
+        self._dirty = set()          # логи с записями без fsync
+        self._syncing = set()        # логи, чей fsync идёт в пуле потоков
+        self._unsynced = 0
+        self._sync_handle = None
+        self.syncs = 0
+        os.makedirs(root, exist_ok=True)
+
+    # --- открытие и восстановление ---
+
+    def chat_ids(self) -> list:
+        return [_chat_id(name) for name in os.listdir(self.root)
+                if os.path.isdir(os.path.join(self.root, name))]
+
+    def _log(self, chat_id, create: bool = False) -> _DiskChatLog | None:
+        log = self._chats.get(chat_id)
+        if log is None:
+            path = os.path.join(self.root, _chat_dir(chat_id))
+            if not os.path.isdir(path):
+                if not create:
+                    return None
+                os.makedirs(path)
+            log = self._chats[chat_id] = _DiskChatLog(path)
+            self._recover(log)
+        return log
+
+    def _recover(self, log: _DiskChatLog):
+        names = sorted(name for name in os.listdir(log.dir) if name.endswith('.log'))
+        for name in names:
+            path = os.path.join(log.dir, name)
+            log.segments.append(_Segment(path, int(name[:-4]), os.path.getsize(path)))
+            log.bases.append(log.segments[-1].base)
+        if not log.segments:
+            return
+        # закрытые сегменты целы; проверяем только хвост активного
+        active = log.segments[-1]
+        active.load_index()
+        last_seq, end = active.seqs[-1] - 1, active.offsets[-1]
+        if active.size:
+            buf = active.view()
+            while True:
+                record = _parse(buf, end, active.size)
+                if record is None:
+                    break
+                last_seq, end = record[0], record[5]
+            active.unmap()
+        if end < active.size:
+            print(f"[disk] {active.path}: отрезано {active.size - end} байт недописанного хвоста")
+            with open(active.path, 'r+b') as f:
+                f.truncate(end)
+            active.size = end
+            # точка индекса могла указывать на отрезанную запись
+            while len(active.seqs) > 1 and active.offsets[-1] >= end:
+                active.seqs.pop()
+                active.offsets.pop()
+            with open(active.index_path, 'wb') as f:
+                f.write(b''.join(_INDEX.pack(s, o) for s, o in zip(active.seqs, active.offsets)))
+        log.last_seq = last_seq
+        log.last_index = active.offsets[-1]
+
+    def _touch(self, chat_id, log: _DiskChatLog):
+        # у лога с открытым файлом или mmap занят дескриптор — их не больше max_open
+        if chat_id in self._open:
+            self._open.move_to_end(chat_id)
+            return
+        self._open[chat_id] = log
+        if len(self._open) > self.max_open:
+            self._evict()
+
+    def _evict(self):
+        # логи, ждущие группового fsync, закрываются уже после него
+        busy = self._dirty | self._syncing
+        for chat_id in list(self._open):
+            if len(self._open) <= self.max_open:
+                break
+            log = self._open[chat_id]
+            if log not in busy:
+                del self._open[chat_id]
+                log.close(sync=False)
+
+    def _writer(self, chat_id, log: _DiskChatLog) -> _Segment:
+        self._touch(chat_id, log)
+        if log.file is None:
+            if not log.segments:
+                self._add_segment(log, log.last_seq + 1)
+            log.file = open(log.segments[-1].path, 'ab')
+        return log.segments[-1]
+
+    def _add_segment(self, log: _DiskChatLog, base: int):
+        segment = _Segment(os.path.join(log.dir, f"{base:020d}.log"), base)
+        open(segment.path, 'ab').close()
+        segment.seqs, segment.offsets = array('Q'), array('Q')
+        log.segments.append(segment)
+        log.bases.append(base)
+        log.last_index = 0
+
+    def _roll(self, log: _DiskChatLog):
+        log.close(sync=self.fsync != 'never')
+        self._dirty.discard(log)
+        self._add_segment(log, log.last_seq + 1)
+        log.file = open(log.segments[-1].path, 'ab')
+        self._retain(log)
+
+    # --- запись ---
+
+    def append(self, chat_id, sender: str, data: bytes, encrypted: bool = False,
+               ts: float | None = None, seq: int | None = None) -> int:
+        """Добавляет сообщение и возвращает его seq (см. HistoryStore.append)."""
+        log = self._log(chat_id, create=True)
+        if seq is None:
+            seq = log.last_seq + 1
+        elif seq <= log.last_seq:
+            raise ValueError("seq must increase")
+        active = self._writer(chat_id, log)
+        if active.size >= self.segment_size:
+            self._roll(log)
+            active = log.segments[-1]
+
+        sender_b = sender.encode('utf-8')
+        body = _BODY.pack(seq, self._clock() if ts is None else ts, 1 if encrypted else 0,
+                          len(sender_b)) + sender_b + data
+        record = _PREFIX.pack(_PREFIX.size + len(body), zlib.crc32(body)) + body
+        if active.size == 0 or active.size - log.last_index >= self.index_interval:
+            active.load_index()
+            active.seqs.append(seq)
+            active.offsets.append(active.size)
+            # точки индекса редки (раз в index_interval байт) — файл не держим открытым
+            with open(active.index_path, 'ab') as f:
+                f.write(_INDEX.pack(seq, active.size))
+            log.last_index = active.size
+        log.file.write(record)
+        active.size += len(record)
+        log.last_seq = seq
+        log.buffered = True
+
+        if self.fsync == 'always':
+            log.sync()
+            self.syncs += 1
+        elif self.fsync == 'batch':
+            self._dirty.add(log)
+            self._schedule_sync()
+        return seq
+
+    def _schedule_sync(self):
+        self._unsynced += 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # без цикла (утилиты, бенчмарки) группа — sync_batch записей
+            if self._unsynced >= self.sync_batch:
+                self.sync()
+            return
+        if self._sync_handle is None:
+            self._sync_handle = loop.call_later(self.sync_interval, self._sync_group)
+
+    def _sync_group(self):
+        self._sync_handle = None
+        logs, self._dirty = self._dirty, set()
+        self._unsynced = 0
+        for log in logs:
+            log.flush()
+        if logs:
+            self.syncs += 1
+            self._syncing |= logs
+            # fsync блокирует — в пул потоков, цикл продолжает принимать записи
+            done = asyncio.get_running_loop().run_in_executor(None, self._fsync_logs, logs)
+            done.add_done_callback(lambda _: self._synced(logs))
+
+    @staticmethod
+    def _fsync_logs(logs: set):
+        for log in logs:
+            file = log.file
+            if file is not None:
+                try:
+                    os.fsync(file.fileno())
+                except (OSError, ValueError):
+                    pass  # сегмент успел смениться — при закрытии он синхронизирован
+
+    def _synced(self, logs: set):
+        self._syncing -= logs
+        if len(self._open) > self.max_open:
+            self._evict()
+
+    def sync(self):
+        """Синхронно сбрасывает на диск всё записанное."""
+        if self._sync_handle is not None:
+            self._sync_handle.cancel()
+            self._sync_handle = None
+        for log in self._dirty:
+            log.sync()
+        if self._dirty:
+            self.syncs += 1
+        self._dirty.clear()
+        self._unsynced = 0
+        if len(self._open) > self.max_open:
+            self._evict()
+
+    def close(self):
+        self.sync()
+        for log in self._chats.values():
+            log.close(sync=self.fsync != 'never')
+        self._open.clear()
+
+    # --- retention ---
+
+    def _first_live(self, log: _DiskChatLog) -> int:
+        return max(log.first_seq, log.last_seq - self.max_messages + 1)
+
+    @staticmethod
+    def _ts(segment: _Segment, offset: int) -> float:
+        record = _parse(segment.view(), offset, segment.size)
+        return record[1] if record is not None else float('inf')
+
+    def _first_fresh(self, log: _DiskChatLog, cutoff: float) -> int:
+        """Первый seq со временем не раньше cutoff (last_seq + 1 — устарело всё).
+
+        Время записей не убывает, поэтому сегмент и точка индекса ищутся
+        двоичным поиском, дальше — проход не длиннее index_interval байт.
+        """
+        segments = [segment for segment in log.segments if segment.size]
+        lo, hi = 0, len(segments)
+        while lo < hi:  # первый сегмент, начинающийся свежей записью
+            mid = (lo + hi) // 2
+            if self._ts(segments[mid], 0) < cutoff:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return log.first_seq
+        following = segments[lo].base if lo < len(segments) else log.last_seq + 1
+        segment = segments[lo - 1]
+        segment.load_index()
+        a, b = 1, len(segment.offsets)  # первая точка индекса — начало сегмента, она устарела
+        while a < b:
+            mid = (a + b) // 2
+            if self._ts(segment, segment.offsets[mid]) < cutoff:
+                a = mid + 1
+            else:
+                b = mid
+        buf, offset = segment.view(), segment.offsets[a - 1]
+        while True:
+            record = _parse(buf, offset, segment.size)
+            if record is None:
+                return following
+            if record[1] >= cutoff:
+                return record[0]
+            offset = record[5]
+
+    def _retain(self, log: _DiskChatLog):
+        # удаляем только закрытые сегменты, целиком вышедшие за границу
+        first = self._first_live(log)
+        cutoff = self._clock() - self.max_age if self.max_age is not None else None
+        drop = 0
+        while drop + 1 < len(log.segments):
+            segment, following = log.segments[drop], log.segments[drop + 1]
+            expired = cutoff is not None and os.path.getmtime(segment.path) < cutoff
+            if following.base > first and not expired:
+                break
+            drop += 1
+        for segment in log.segments[:drop]:
+            segment.unmap()
+            os.remove(segment.path)
+            try:
+                os.remove(segment.index_path)
+            except FileNotFoundError:
+                pass
+        del log.segments[:drop], log.bases[:drop]
+
+    def trim_expired(self):
+        """Удаляет устаревшие сегменты во всех открытых за время работы чатах."""
+        for log in self._chats.values():
+            self._retain(log)
+
+    # --- чтение ---
+
+    def last_seq(self, chat_id) -> int:
+        log = self._log(chat_id)
+        return log.last_seq if log else 0
+
+    def count(self, chat_id) -> int:
+        log = self._log(chat_id)
+        return log.last_seq - self._first_live(log) + 1 if log else 0
+
+    def drop(self, chat_id):
+        log = self._log(chat_id)
+        if log is not None:
+            self._dirty.discard(log)
+            self._syncing.discard(log)
+            self._open.pop(chat_id, None)
+            log.close(sync=False)
+            del self._chats[chat_id]
+            shutil.rmtree(log.dir, ignore_errors=True)
+
+    def page(self, chat_id, after: int | None = None, before: int | None = None,
+             limit: int = 50) -> list:
+        """Страница истории по возрастанию seq (см. HistoryStore.page).
+
+        seq в логе идут подряд, поэтому граница живых записей (по
+        max_messages и max_age) вычисляется заранее и чтение начинается
+        сразу с нужного сегмента; читается, пока не набрано limit записей.
+        """
+        log = self._log(chat_id)
+        if log is None or limit <= 0 or not log.segments:
+            return []
+        self._touch(chat_id, log)
+        log.flush()  # mmap видит только отданное ОС
+        cutoff = self._clock() - self.max_age if self.max_age is not None else None
+        first = self._first_live(log)
+        if cutoff is not None:
+            first = max(first, self._first_fresh(log, cutoff))
+        hi = log.last_seq if before is None else min(log.last_seq, before - 1)
+        if after is not None:
+            lo = max(first, after + 1)
+        else:
+            lo = max(first, hi - limit + 1)
+        if hi < lo:
+            return []
+
+        result = []
+        i = max(0, bisect_right(log.bases, lo) - 1)
+        offset = log.segments[i].locate(lo)
+        while i < len(log.segments):
+            segment = log.segments[i]
+            if segment.size:
+                buf = segment.view()
+                while True:
+                    record = _parse(buf, offset, segment.size)
+                    if record is None:
+                        break
+                    seq, ts, flags, sender, data, offset = record
+                    if seq > hi:
+                        return result
+                    if seq >= lo and (cutoff is None or ts >= cutoff):
+                        result.append(MessageRecord(seq, ts, sender, data, bool(flags)))
+                        if len(result) == limit:
+                            return result
+            i += 1
+            offset = 0
+        return result
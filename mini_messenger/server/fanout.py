@@ -0,0 +1,59 @@
+class FanoutIndex:
+    """Индекс подписок: chat_id -> множество живых соединений.
+
+    Рассылка обходит только соединения участников чата, а не все
+    подключения сервера. Обратный индекс (соединение -> чаты) позволяет
+    отписать соединение при отключении за O(число его чатов).
+
+    on_first/on_last вызываются, когда у чата появляется первое и
+    пропадает последнее локальное соединение (для межсерверной подписки).
+    """
+
+    def __init__(self, on_first=None, on_last=None):
+        self._by_chat = {}  # chat_id: set(conn)
+        self._by_conn = {}  # conn: set(chat_id)
+        self._on_first = on_first
+        self._on_last = on_last
+
+    def subscribe(self, chat_id: int, conn):
+        conns = self._by_chat.get(chat_id)
+        if conns is None:
+            conns = self._by_chat[chat_id] = set()
+            if self._on_first:
+                self._on_first(chat_id)
+        conns.add(conn)
+        self._by_conn.setdefault(conn, set()).add(chat_id)
+
+    def unsubscribe(self, chat_id: int, conn):
+        conns = self._by_chat.get(chat_id)
+        if conns is not None:
+            conns.discard(conn)
+            if not conns:
+                self._drop(chat_id)
+        chats = self._by_conn.get(conn)
+        if chats is not None:
+            chats.discard(chat_id)
+            if not chats:
+                del self._by_conn[conn]
+
+    def unsubscribe_all(self, conn):
+        for chat_id in self._by_conn.pop(conn, ()):
+            conns = self._by_chat.get(chat_id)
+            if conns is not None:
+                conns.discard(conn)
+                if not conns:
+                    self._drop(chat_id)
+
+    def _drop(self, chat_id: int):
+        del self._by_chat[chat_id]
+        if self._on_last:
+            self._on_last(chat_id)
+
+    def subscribers(self, chat_id: int) -> set:
+        return self._by_chat.get(chat_id, set())
+
+    def chats_of(self, conn) -> set:
+        return self._by_conn.get(conn, set())
+
+    def __len__(self):
+        return len(self._by_chat)
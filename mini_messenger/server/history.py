@@ -0,0 +1,156 @@
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class MessageRecord:
+    """Сообщение из истории чата (результат чтения)."""
+
+    __slots__ = ('seq', 'ts', 'sender', 'data', 'encrypted')
+
+    def __init__(self, seq: int, ts: float, sender: str, data: bytes, encrypted: bool):
+        self.seq = seq
+        self.ts = ts
+        self.sender = sender
+        self.data = data
+        self.encrypted = encrypted
+
+    def __repr__(self):
+        return f"MessageRecord(seq={self.seq}, sender={self.sender!r}, {len(self.data)} bytes)"
+
+
+class _ChatLog:
+    """История одного чата в упакованных столбцах.
+
+    seq, время и индекс отправителя лежат в array, флаги — в bytearray,
+    payload — сырые bytes. Голова обрезается пачками, чтобы удаление из
+    начала массивов не стоило O(n) на каждое сообщение.
+    """
+
+    __slots__ = ('seqs', 'times', 'senders', 'flags', 'data', 'head', 'last_seq')
+
+    def __init__(self):
+        self.seqs = array('Q')
+        self.times = array('d')
+        self.senders = array('I')
+        self.flags = bytearray()
+        self.data = []
+        self.head = 0       # индекс первой живой записи
+        self.last_seq = 0
+
+    def __len__(self):
+        return len(self.data) - self.head
+
+    def compact(self):
+        h = self.head
+        del self.seqs[:h], self.times[:h], self.senders[:h], self.flags[:h], self.data[:h]
+        self.head = 0
+
+
+class HistoryStore:
+    """Ограниченная append-only история сообщений в памяти.
+
+    На чат хранится не больше max_messages сообщений и (если задан
+    max_age) не старше max_age секунд. Отправители интернированы: в
+    записи лежит 4-байтный индекс вместо ссылки на строку. Каждое
+    сообщение получает монотонный в пределах чата номер seq (с 1).
+    """
+
+    COMPACT_MIN = 64  # обрезать голову не чаще, чем раз в столько записей
+
+    def __init__(self, max_messages: int = 10_000, max_age: float | None = None,
+                 clock=time.time):
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self._clock = clock
+        self._chats = {}          # chat_id: _ChatLog
+        self._sender_ids = {}     # sender: индекс
+        self._senders = []        # индекс: sender
+
+    def _sender_index(self, sender: str) -> int:
+        idx = self._sender_ids.get(sender)
+        if idx is None:
+            idx = self._sender_ids[sender] = len(self._senders)
+            self._senders.append(sender)
+        return idx
+
+    def append(self, chat_id: int, sender: str, data: bytes, encrypted: bool = False,
+               ts: float | None = None, seq: int | None = None) -> int:
+        """Добавляет сообщение и возвращает его seq.
+
+        seq можно передать явно (например, выданный Redis); он должен
+        быть больше последнего в чате.
+        """
+        log = self._chats.get(chat_id)
+        if log is None:
+            log = self._chats[chat_id] = _ChatLog()
+        if seq is None:
+            seq = log.last_seq + 1
+        elif seq <= log.last_seq:
+            raise ValueError("seq must increase")
+        log.last_seq = seq
+        log.seqs.append(seq)
+        log.times.append(self._clock() if ts is None else ts)
+        log.senders.append(self._sender_index(sender))
+        log.flags.append(1 if encrypted else 0)
+        log.data.append(bytes(data))
+        self._trim(log)
+        return seq
+
+    def _trim(self, log: _ChatLog):
+        end = len(log.data)
+        head = max(log.head, end - self.max_messages)
+        if self.max_age is not None:
+            cutoff = self._clock() - self.max_age
+            head = max(head, bisect_left(log.times, cutoff, head, end))
+        if head != log.head:
+            # освобождаем payload сразу, столбцы сдвигаем пачками
+            for i in range(log.head, head):
+                log.data[i] = b''
+            log.head = head
+        if log.head >= self.COMPACT_MIN and log.head * 2 >= end:
+            log.compact()
+
+    def trim_expired(self):
+        """Удаляет устаревшие сообщения во всех чатах (для простаивающих чатов)."""
+        for log in self._chats.values():
+            self._trim(log)
+
+    def last_seq(self, chat_id: int) -> int:
+        log = self._chats.get(chat_id)
+        # не "if log": у лога с обрезанной целиком историей len() == 0
+        return log.last_seq if log is not None else 0
+
+    def count(self, chat_id: int) -> int:
+        log = self._chats.get(chat_id)
+        return len(log) if log else 0
+
+    def drop(self, chat_id: int):
+        self._chats.pop(chat_id, None)
+
+    def page(self, chat_id: int, after: int | None = None, before: int | None = None,
+             limit: int = 50) -> list:
+        """Страница истории по возрастанию seq.
+
+        after задан — первые limit сообщений с seq > after (и < before);
+        иначе — последние limit сообщений с seq < before (before=None —
+        самые свежие).
+        """
+        log = self._chats.get(chat_id)
+        if log is None or limit <= 0:
+            return []
+        self._trim(log)
+        start, end = log.head, len(log.data)
+        if before is not None:
+            end = bisect_left(log.seqs, before, start, end)
+        if after is not None:
+            start = bisect_right(log.seqs, after, start, end)
+            end = min(end, start + limit)
+        else:
+            start = max(start, end - limit)
+        senders = self._senders
+        return [
+            MessageRecord(log.seqs[i], log.times[i], senders[log.senders[i]],
+                          log.data[i], bool(log.flags[i]))
+            for i in range(start, end)
+        ]
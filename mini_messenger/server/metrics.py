@@ -0,0 +1,260 @@
+import asyncio
+import collections
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+_now = time.perf_counter
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n: int = 1):
+        self.value += n
+
+
+class Histogram:
+    """Логарифмическая гистограмма: корзина i — значения до 2**i единиц.
+
+    Значение умножается на scale и округляется вниз; номер корзины —
+    bit_length(), без поиска по границам и проверок диапазона (64 корзины
+    вмещают любое int64). Для времени scale=1e6 (корзины по микросекундам),
+    для размеров — 1. Общее число наблюдений не хранится, а считается
+    при чтении: на горячем пути на одно сложение меньше.
+    """
+
+    __slots__ = ('scale', 'counts', 'sum')
+    BUCKETS = 64
+
+    def __init__(self, scale: float = 1.0):
+        self.scale = scale
+        self.counts = [0] * self.BUCKETS
+        self.sum = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, value: float):
+        self.sum += value
+        self.counts[int(value * self.scale).bit_length()] += 1
+
+    def since(self, start: float):
+        """Время от start (time.perf_counter()) до сейчас."""
+        value = _now() - start
+        self.sum += value
+        self.counts[int(value * self.scale).bit_length()] += 1
+
+    def quantile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попадает q-квантиль."""
+        rank = q * sum(self.counts)
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return (2 ** i) / self.scale
+        return 0.0
+
+
+class _Null:
+    # выключенные метрики: вызовы остаются, но ничего не считают
+    __slots__ = ()
+    value = count = 0
+
+    def inc(self, n: int = 1):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+    def since(self, start: float):
+        pass
+
+
+_NULL = _Null()
+_INF = 'le="+Inf"'
+
+
+class Metrics:
+    """Реестр счётчиков, гистограмм и датчиков сервера.
+
+    Счётчик и гистограмма создаются один раз (counter()/histogram()),
+    горячий путь держит ссылку и вызывает inc()/observe() — без поиска по
+    имени. Датчики (gauge) — функции, вычисляются только при выдаче.
+    Метки передаются именованными аргументами и входят в ключ метрики.
+    enabled=False — все счётчики и гистограммы пустые (для замера
+    накладных расходов, см. bench/metrics.py).
+
+    render() — текстовый формат Prometheus; serve() поднимает HTTP на
+    локальном порту: /metrics и /profile?seconds=5 (SamplingProfiler).
+    """
+
+    PREFIX = 'zephyr_'
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._counters = {}    # (name, labels): Counter
+        self._histograms = {}  # (name, labels): Histogram
+        self._gauges = {}      # (name, labels): () -> число
+        self._server = None
+        self._lag_task = None
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, ','.join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+
+    def counter(self, name: str, **labels) -> Counter:
+        if not self.enabled:
+            return _NULL
+        return self._counters.setdefault(self._key(name, labels), Counter())
+
+    def histogram(self, name: str, scale: float = 1e6, **labels) -> Histogram:
+        if not self.enabled:
+            return _NULL
+        return self._histograms.setdefault(self._key(name, labels), Histogram(scale))
+
+    def gauge(self, name: str, fn, **labels):
+        self._gauges[self._key(name, labels)] = fn
+
+    # --- задержка цикла событий ---
+
+    def watch_loop(self, interval: float = 0.1):
+        """Фоновая задача: насколько позже положенного просыпается sleep()."""
+        if self.enabled and self._lag_task is None:
+            self._lag_task = asyncio.create_task(self._watch_loop(interval))
+
+    async def _watch_loop(self, interval: float):
+        lag = self.histogram('loop_lag_seconds')
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag.observe(max(0.0, time.perf_counter() - start - interval))
+
+    # --- выдача ---
+
+    def snapshot(self) -> dict:
+        out = {}
+        for (name, labels), c in self._counters.items():
+            out[f"{name}{{{labels}}}" if labels else name] = c.value
+        for (name, labels), fn in self._gauges.items():
+            out[f"{name}{{{labels}}}" if labels else name] = fn()
+        for (name, labels), h in self._histograms.items():
+            key = f"{name}{{{labels}}}" if labels else name
+            out[key] = {'count': h.count, 'sum': h.sum,
+                        'p50': h.quantile(0.5), 'p99': h.quantile(0.99)}
+        return out
+
+    def render(self) -> str:
+        lines = []
+        p = self.PREFIX
+        typed = set()
+
+        def series(name, labels, extra=''):
+            both = ','.join(x for x in (labels, extra) if x)
+            return f"{p}{name}{{{both}}}" if both else f"{p}{name}"
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {p}{name} {kind}")
+
+        for (name, labels), c in sorted(self._counters.items()):
+            declare(name, 'counter')
+            lines.append(f"{series(name, labels)} {c.value}")
+        for (name, labels), fn in sorted(self._gauges.items()):
+            declare(name, 'gauge')
+            try:
+                lines.append(f"{series(name, labels)} {fn()}")
+            except Exception as e:
+                lines.append(f"# {name}: {e}")
+        for (name, labels), h in sorted(self._histograms.items()):
+            declare(name, 'histogram')
+            count = h.count
+            cumulative = 0
+            last = max((i for i, n in enumerate(h.counts) if n), default=0)
+            for i in range(last + 1):
+                cumulative += h.counts[i]
+                le = f'le="{2 ** i / h.scale:g}"'
+                lines.append(f"{series(name + '_bucket', labels, le)} {cumulative}")
+            lines.append(f"{series(name + '_bucket', labels, _INF)} {count}")
+            lines.append(f"{series(name + '_sum', labels)} {h.sum:.6f}")
+            lines.append(f"{series(name + '_count', labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 9100):
+        self._server = await asyncio.start_server(self._handle_http, host, port)
+        print(f"[metrics] http://{host}:{port}/metrics")
+
+    async def close(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle_http(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass  # заголовки не нужны
+            parts = request.decode('latin-1').split()
+            url = urlsplit(parts[1] if len(parts) > 1 else '/')
+            if url.path == '/metrics':
+                status, body = '200 OK', self.render()
+            elif url.path == '/profile':
+                query = parse_qs(url.query)
+                seconds = min(60.0, float(query.get('seconds', ['5'])[0]))
+                # 0 и меньше — холостой цикл выборки в потоке, больше секунды — бессмысленно
+                interval = min(1.0, max(0.001, float(query.get('interval', ['0.005'])[0])))
+                profiler = SamplingProfiler(threading.get_ident(), interval)  # поток цикла
+                # выборка идёт в потоке, цикл в это время работает как обычно
+                body = await asyncio.get_running_loop().run_in_executor(
+                    None, profiler.run, seconds)
+                status = '200 OK'
+            else:
+                status, body = '404 Not Found', 'not found\n'
+            data = body.encode('utf-8')
+            writer.write(f"HTTP/1.0 {status}\r\nContent-Type: text/plain; charset=utf-8\r\n"
+                         f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+class SamplingProfiler:
+    """Статистический профилировщик: раз в interval снимает стек потока.
+
+    Работает в отдельном потоке и читает sys._current_frames(), поэтому
+    профилируемый код не трогает и стоит только пока включён. Результат
+    — свёрнутые стеки («file:func;file:func N» по строке), которые
+    принимают flamegraph.pl и speedscope.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = collections.Counter()
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+            frame = frame.f_back
+        if stack:
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def run(self, seconds: float) -> str:
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            self._sample()
+            time.sleep(self.interval)
+        return ''.join(f"{stack} {n}\n" for stack, n in self.samples.most_common())
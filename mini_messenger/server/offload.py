@@ -0,0 +1,73 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CpuOffload:
+    """Вынос тяжёлых CPU-операций (zlib, ChaCha20-Poly1305) из цикла.
+
+    Работа над данными меньше threshold байт выполняется сразу: переход
+    в поток дороже неё самой. Крупная уходит в пул потоков — C-код zlib
+    и cryptography отпускает GIL на больших буферах, и цикл всё это
+    время обслуживает остальные соединения. threshold=None — всё в цикле.
+
+    Порядок в пределах соединения сохраняет вызывающий: он дожидается
+    результата, прежде чем браться за следующий кадр. map() отправляет
+    пачку кадров одного чтения одним заданием — один переход в поток
+    вместо переходов на каждый кадр.
+
+    На одном ядре пул не даёт параллелизма, а переключения потоков и
+    GIL только добавляют задержку — там по умолчанию всё в цикле.
+    """
+
+    DEFAULT_THRESHOLD = 64 * 1024 if (os.cpu_count() or 1) > 1 else None
+
+    def __init__(self, threshold: int | None = DEFAULT_THRESHOLD, max_workers: int | None = None,
+                 executor=None):
+        self.threshold = threshold
+        self._own = executor is None and threshold is not None
+        self._executor = executor or (
+            ThreadPoolExecutor(max_workers, thread_name_prefix='cpu') if self._own else None
+        )
+        self.inline = 0     # операций выполнено прямо в цикле
+        self.offloaded = 0  # операций выполнено в пуле
+        self.jobs = 0       # заданий пула (пачка map() — одно задание)
+
+    def _heavy(self, size: int) -> bool:
+        return self.threshold is not None and size >= self.threshold
+
+    async def run(self, size: int, fn, *args):
+        """fn(*args) в цикле или в пуле — в зависимости от размера данных."""
+        if not self._heavy(size):
+            self.inline += 1
+            return fn(*args)
+        self.offloaded += 1
+        self.jobs += 1
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def map(self, fn, items: list) -> list:
+        """[fn(item) ...] по порядку; если данных много — одним заданием пула."""
+        if not self._heavy(sum(len(item) for item in items)):
+            self.inline += len(items)
+            return [fn(item) for item in items]
+        self.offloaded += len(items)
+        self.jobs += 1
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, _apply, fn, items
+        )
+
+    def close(self):
+        if self._own:
+            self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        return {
+            'threshold': self.threshold,
+            'inline': self.inline,
+            'offloaded': self.offloaded,
+            'jobs': self.jobs,
+        }
+
+
+def _apply(fn, items: list) -> list:
+    return [fn(item) for item in items]
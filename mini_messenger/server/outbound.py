@@ -0,0 +1,115 @@
+import asyncio
+from collections import deque
+
+
+class OutboundQueue:
+    """Ограниченная исходящая очередь соединения с собственной задачей-писателем.
+
+    put() не блокирует отправителя: сообщение кладётся в очередь, а
+    отдельная задача отправляет его в сокет. Задача живёт, пока в очереди
+    что-то есть: простаивающее соединение её не держит. При переполнении
+    (глубина больше high_water) применяется политика:
+
+    * ``drop_oldest`` — выбрасывается самое старое сообщение;
+    * ``coalesce`` — всё накопленное склеивается в одну запись через
+      ``combine`` (без потерь); если склейка превысила ``max_bytes``,
+      соединение отключается. Без ``combine`` ведёт себя как drop_oldest;
+    * ``disconnect`` — медленный получатель отключается.
+
+    Если задан ``combine``, писатель и без переполнения забирает все
+    ожидающие сообщения за один раз и отправляет их одной записью.
+    """
+
+    DROP_OLDEST = 'drop_oldest'
+    COALESCE = 'coalesce'
+    DISCONNECT = 'disconnect'
+    POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+    def __init__(self, send, close, high_water: int = 256, policy: str = DROP_OLDEST,
+                 combine=None, max_bytes: int = 8 * 1024 * 1024, name: str = ''):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self._send = send      # async (item) -> None
+        self._close = close    # () -> None, вызывается при вытеснении
+        self.high_water = high_water
+        self.policy = policy
+        self.combine = combine
+        self.max_bytes = max_bytes
+        self.name = name
+        self._items = deque()
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.evicted = False
+        self.closed = False
+        self._task = None
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+    def put(self, item) -> bool:
+        """Ставит сообщение в очередь; False, если оно не будет доставлено."""
+        if self.closed:
+            return False
+        if len(self._items) >= self.high_water:
+            if not self._overflow(item):
+                return False
+        else:
+            self._items.append(item)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return True
+
+    def _overflow(self, item) -> bool:
+        if self.policy == self.DISCONNECT:
+            self.evict()
+            return False
+        if self.policy == self.COALESCE and self.combine is not None:
+            self._items.append(item)
+            merged = self.combine(self._items)
+            if len(merged) > self.max_bytes:
+                self.evict()
+                return False
+            self.coalesced += len(self._items) - 1
+            self._items.clear()
+            self._items.append(merged)
+            return True
+        self._items.popleft()
+        self.dropped += 1
+        self._items.append(item)
+        return True
+
+    def evict(self):
+        if not self.closed:
+            self.evicted = True
+            self.dropped += len(self._items)
+            print(f"[!] {self.name} вытеснен как медленный получатель")
+            self.close()
+            self._close()
+
+    def close(self):
+        self.closed = True
+        self._items.clear()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        while self._items:
+            if self.combine is not None and len(self._items) > 1:
+                count = len(self._items)
+                item = self.combine(self._items)
+                self._items.clear()
+            else:
+                count = 1
+                item = self._items.popleft()
+            try:
+                await self._send(item)
+            except Exception as e:
+                print(f"[-] {self.name} ошибка отправки: {e}")
+                self.closed = True
+                self._items.clear()
+                self._close()
+                return
+            self.sent += count
+        self._task = None
@@ -0,0 +1,162 @@
+import asyncio
+import os
+import time
+
+
+class ClusterRouter:
+    """Маршрутизация сообщений между серверами через Redis pub/sub.
+
+    У каждого чата свой канал. Узел подписан только на каналы чатов, в
+    которых у него есть живые соединения: счётчик ссылок растёт при
+    появлении первого локального подписчика в индексе транспорта и
+    падает при уходе последнего. Исходящие сообщения публикуются один
+    раз, публикации за тик уходят одним пайплайном. Свои же сообщения,
+    вернувшиеся из канала, отбрасываются по node_id.
+
+    Конверт: [node_id:12][kind:1][payload]; kind различает транспорт
+    (кадр Packet для TCP или JSON-текст для WS).
+    """
+
+    TCP = 1  # payload — кадр Packet
+    WS = 2   # payload — JSON-текст в UTF-8
+
+    CHANNEL_PREFIX = "route:chat:"
+    POLL_INTERVAL = 0.05  # как часто применяются изменения подписок, с
+
+    def __init__(self, node_id: str, deliver, url: str | None = None, client=None):
+        if client is None:
+            try:
+                import redis.asyncio as aioredis
+            except ImportError:
+                raise RuntimeError("redis package is required for ClusterRouter")
+
+            url = url or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+            # payload бинарный, поэтому без decode_responses
+            client = aioredis.from_url(url)
+        self.r = client
+        self.node_id = node_id.encode()[:12].ljust(12, b"_")
+        self._deliver = deliver  # (chat_id, kind, payload) -> None
+        self._refs = {}          # chat_id: число локальных индексов с подписчиками
+        self._subscribed = set()  # каналы, на которые реально подписан pubsub
+        self._changed = asyncio.Event()
+        self._ops = []           # публикации текущего тика
+        self._lock = asyncio.Lock()
+        self._flushes = set()
+        self._listener = None
+        self.published = 0
+        self.received = 0
+        self.echoes = 0
+        self.round_trips = 0
+        self.rtt = None  # гистограмма времени публикации пачки (Metrics.histogram)
+
+    def _channel(self, chat_id) -> str:
+        return f"{self.CHANNEL_PREFIX}{chat_id}"
+
+    # --- подписки по счётчику ссылок ---
+
+    def acquire(self, chat_id):
+        self._refs[chat_id] = self._refs.get(chat_id, 0) + 1
+        if self._refs[chat_id] == 1:
+            self._changed.set()
+
+    def release(self, chat_id):
+        refs = self._refs.get(chat_id, 0) - 1
+        if refs > 0:
+            self._refs[chat_id] = refs
+        else:
+            self._refs.pop(chat_id, None)
+            self._changed.set()
+
+    async def _apply_subscriptions(self, pubsub):
+        self._changed.clear()
+        wanted = {self._channel(chat_id) for chat_id in self._refs}
+        added = wanted - self._subscribed
+        removed = self._subscribed - wanted
+        if added:
+            await pubsub.subscribe(*added)
+        if removed:
+            await pubsub.unsubscribe(*removed)
+        self._subscribed = wanted
+
+    # --- публикация пачками по тикам ---
+
+    def publish(self, chat_id, kind: int, payload: bytes):
+        if not self._ops:
+            asyncio.get_running_loop().call_soon(self._start_flush)
+        self._ops.append((self._channel(chat_id), self.node_id + bytes((kind,)) + payload))
+
+    def _start_flush(self):
+        ops, self._ops = self._ops, []
+        task = asyncio.create_task(self._flush(ops))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, ops: list):
+        async with self._lock:
+            try:
+                pipe = self.r.pipeline(transaction=False)
+                for channel, message in ops:
+                    pipe.publish(channel, message)
+                start = time.perf_counter()
+                await pipe.execute()
+                if self.rtt is not None:
+                    self.rtt.since(start)
+                self.round_trips += 1
+                self.published += len(ops)
+            except Exception as e:
+                print(f"[router] {len(ops)} публикаций не отправлено: {e}")
+
+    # --- приём ---
+
+    def start(self):
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+        async with self._lock:
+            pass
+        await self.r.aclose()
+
+    async def _listen(self):
+        while True:
+            pubsub = self.r.pubsub(ignore_subscribe_messages=True)
+            self._subscribed = set()
+            try:
+                while True:
+                    if self._changed.is_set():
+                        await self._apply_subscriptions(pubsub)
+                    if not self._subscribed:
+                        await self._changed.wait()
+                        continue
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=self.POLL_INTERVAL
+                    )
+                    if message is not None and message["type"] == "message":
+                        self._dispatch(message["channel"], message["data"])
+            except asyncio.CancelledError:
+                await pubsub.aclose()
+                raise
+            except Exception as e:
+                print(f"[router] подписка прервана: {e}")
+                self._changed.set()  # после переподключения подписаться заново
+                await asyncio.sleep(1)
+
+    def _dispatch(self, channel: bytes, data: bytes):
+        if data[:12] == self.node_id:
+            self.echoes += 1
+            return
+        self.received += 1
+        chat_id = channel[len(self.CHANNEL_PREFIX):].decode()
+        chat_id = int(chat_id) if chat_id.lstrip("-").isdigit() else chat_id
+        self._deliver(chat_id, data[12], memoryview(data)[13:])
+
+    def stats(self) -> dict:
+        return {
+            "chats": len(self._refs),
+            "published": self.published,
+            "received": self.received,
+            "echoes": self.echoes,
+            "round_trips": self.round_trips,
+        }
@@ -1,14 +1,26 @@
 import asyncio
+import functools
 import json
 import os
 import struct
-import websockets
-from .storage import InMemoryStorage
+import time
+from websockets.asyncio.server import serve as ws_serve
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+from .storage import InMemoryStorage, DiskStorage
 from .chat_manager import ChatManager
-from mini_messenger.protocol.packet import Packet
+from .fanout import FanoutIndex
+from .outbound import OutboundQueue
+from .router import ClusterRouter
+from .offload import CpuOffload
+from .metrics import Metrics
+from .admission import AdmissionControl
+from .connections import ConnectionRegistry
+from mini_messenger.protocol.packet import Packet, SYNC_REQUEST, SYNC_REPLY
+from mini_messenger.protocol.framing import FrameDecoder
 from mini_messenger.protocol.types import PacketFlag, MessageType, ChatType
-from mini_messenger.crypto.keys import KeyManager
+from mini_messenger.crypto.keypool import KeyPool
 from mini_messenger.crypto.e2ee import E2EE
+from mini_messenger.crypto.sessions import SessionCache
 
 # попытка импортировать кеш, если он доступен
 try:
@@ -18,167 +30,657 @@ except ImportError:
 
 
 class MiniServer:
-    def __init__(self, host='0.0.0.0', port=9000, ws_port=8765):
+    READ_SIZE = 64 * 1024  # один read() может содержать много кадров
+    HOUSEKEEPING_INTERVAL = 60  # с
+    SYNC_PAGE = 128  # сообщений истории на один ответ SYNC
+    BACKLOG = 1024  # очередь accept на шторм подключений (ядро урежет до somaxconn)
+    # подпротоколы WS: кадры Packet, как по TCP, и прежний JSON;
+    # клиент без подпротокола (index.html) получает JSON
+    WS_PACKET = 'zephyr.packet.v1'
+    WS_JSON = 'zephyr.json.v1'
+    CHAT_TYPES = frozenset(t.value for t in ChatType)  # допустимый 'type' в WS create
+
+    def __init__(self, host='0.0.0.0', port=9000, ws_port=8765,
+                 send_queue_size=256, overflow_policy=OutboundQueue.DROP_OLDEST,
+                 redis_url=None, history_limit=10_000, history_ttl=None,
+                 data_dir=None, fsync='batch', session_cache_size=4096,
+                 offload_threshold=CpuOffload.DEFAULT_THRESHOLD, offload_workers=None,
+                 metrics=True, metrics_port=None, ws_compression='deflate',
+                 ws_deflate_level=6, ws_deflate_window=12, ws_deflate_mem_level=5,
+                 key_pool_low=64, key_pool_high=256, admission=None,
+                 heartbeat_interval=20.0, idle_timeout=None):
         self.host = host
         self.port = port
         self.ws_port = ws_port
-        self.storage = InMemoryStorage()
+        # permessage-deflate для WS: None — выключен; окно (бит) и memLevel
+        # задают память zlib на соединение, level — цену сжатия в CPU
+        self.ws_compression = ws_compression
+        self.ws_deflate = {'level': ws_deflate_level, 'window': ws_deflate_window,
+                           'mem_level': ws_deflate_mem_level}
+        # исходящие очереди: глубина (high-water) и политика переполнения
+        self.send_queue_size = send_queue_size
+        self.overflow_policy = overflow_policy
+        # история: не больше history_limit сообщений на чат, не старше history_ttl секунд
+        # с data_dir (или DATA_DIR) чаты и история переживают перезапуск
+        data_dir = data_dir or os.getenv('DATA_DIR')
+        if data_dir:
+            self.storage = DiskStorage(data_dir, history_limit, history_ttl, fsync=fsync)
+        else:
+            self.storage = InMemoryStorage(history_limit, history_ttl)
         # при наличии переменной окружения USE_REDIS или REDIS_URL используем кеш
         self.cache = None
-        if RedisCache and (os.getenv('USE_REDIS') or os.getenv('REDIS_URL')):
-            self.cache = RedisCache(os.getenv('REDIS_URL'))
+        self.router = None
+        redis_url = redis_url or os.getenv('REDIS_URL')
+        if RedisCache and (redis_url or os.getenv('USE_REDIS')):
+            self.cache = RedisCache(redis_url, history_limit=history_limit, history_ttl=history_ttl)
+            # доставка клиентам других инстансов, разделяющих Redis
+            self.router = ClusterRouter(self.cache.node_id, self._deliver_remote, redis_url)
 
         self.chat_mgr = ChatManager(self.storage, cache=self.cache)
-        self.tcp_connections = {}  # writer: user_id
-        self.ws_connections = {}   # websocket: user_id
-    
+        # живые соединения: запись на соединение (user_id, ключи, очередь);
+        # user_id уникальны и между перезапусками: с меткой узла или случайной
+        self.connections = ConnectionRegistry(self.cache.node_id[:6] if self.cache else None)
+        # простаивающим дольше heartbeat_interval TCP-соединениям — PING,
+        # молчащие idle_timeout секунд закрываются (None — не закрывать);
+        # WS проверяется ping/pong самого протокола с тем же интервалом
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        # chat_id -> живые соединения участников, отдельно по формату: кадры
+        # Packet (TCP и WS_PACKET) и JSON (WS); кадр кодируется один раз на всех;
+        # первый/последний локальный подписчик включает/снимает подписку узла
+        on_first = self.router.acquire if self.router else None
+        on_last = self.router.release if self.router else None
+        self.tcp_index = FanoutIndex(on_first, on_last)
+        self.ws_index = FanoutIndex(on_first, on_last)
+        # общие секреты и шифры E2EE: ECDH один раз на пару ключей
+        self.sessions = SessionCache(session_cache_size)
+        # пары X25519 для KEY_EX — из запаса, который фоновый поток держит
+        # между key_pool_low и key_pool_high: шторм переподключений не
+        # генерирует ключи в цикле
+        self.keys = KeyPool(key_pool_low, key_pool_high)
+        # лимиты соединений и входящих кадров (AdmissionControl); по умолчанию —
+        # только предельный размер кадра
+        self.admission = admission if admission is not None else AdmissionControl()
+        # zlib и шифрование payload от offload_threshold байт — в пуле потоков
+        self.offload = CpuOffload(offload_threshold, offload_workers)
+        # счётчики и гистограммы горячего пути; HTTP /metrics только на
+        # 127.0.0.1:metrics_port (или METRICS_PORT), если порт задан
+        self.metrics = Metrics(enabled=metrics)
+        self.metrics_port = metrics_port or int(os.getenv('METRICS_PORT', 0)) or None
+        self._instrument()
+
+    def _instrument(self):
+        m = self.metrics
+        self._m_tcp_in = m.counter('messages_in_total', transport='tcp')
+        self._m_tcp_bytes_in = m.counter('bytes_in_total', transport='tcp')
+        self._m_ws_in = m.counter('messages_in_total', transport='ws')
+        self._m_ws_bytes_in = m.counter('bytes_in_total', transport='ws')
+        self._m_tcp_out = m.counter('messages_out_total', transport='tcp')
+        self._m_tcp_bytes_out = m.counter('bytes_out_total', transport='tcp')
+        self._m_ws_out = m.counter('messages_out_total', transport='ws')
+        self._m_ws_bytes_out = m.counter('bytes_out_total', transport='ws')
+        self._m_tcp_errors = m.counter('disconnect_errors_total', transport='tcp')
+        self._m_ws_errors = m.counter('disconnect_errors_total', transport='ws')
+        self._m_unpack = m.histogram('stage_seconds', stage='unpack')
+        self._m_tcp_read = m.histogram('stage_seconds', stage='tcp_read')
+        self._m_ws_message = m.histogram('stage_seconds', stage='ws_message')
+        self._m_decrypt = m.histogram('stage_seconds', stage='decrypt')
+        self._m_repack = m.histogram('stage_seconds', stage='repack')
+        self._m_fanout = m.histogram('fanout_recipients', scale=1)
+        if self.cache:
+            self.cache.write_rtt = m.histogram('redis_rtt_seconds', op='cache_write')
+            self.cache.read_rtt = m.histogram('redis_rtt_seconds', op='cache_read')
+            self.router.rtt = m.histogram('redis_rtt_seconds', op='route_publish')
+            m.gauge('redis_pending_commands', lambda: len(self.cache._ops))
+        m.gauge('connections', lambda: self.connections.count(ConnectionRegistry.TCP), transport='tcp')
+        m.gauge('connections', lambda: self.connections.count(ConnectionRegistry.WS), transport='ws')
+        m.gauge('outbound_queued', lambda: self.outbound_stats()['queued'])
+        m.gauge('outbound_max_depth', lambda: self.outbound_stats()['max_depth'])
+        m.gauge('outbound_dropped_total', lambda: self.outbound_stats()['dropped'])
+        m.gauge('e2ee_sessions', lambda: len(self.sessions))
+        m.gauge('keypool_size', lambda: len(self.keys))
+        m.gauge('keypool_misses_total', lambda: self.keys.misses)
+        for reason in self.admission.rejected:
+            m.gauge('admission_rejected_total',
+                    lambda reason=reason: self.admission.rejected[reason], reason=reason)
+        m.gauge('admission_buckets', self.admission.buckets)
+
     async def handle_client(self, reader, writer):
-        user_id = f"user_{id(writer) % 10000}"
-        private_key, public_key = KeyManager.generate_keypair()
-        self.storage.user_keys[user_id] = {'private': private_key, 'public': public_key}
-        self.storage.users[writer] = {'user_id': user_id, 'public_key': public_key}
-        self.connections[writer] = user_id
+        peer = writer.get_extra_info('peername')
+        ip = peer[0] if peer else None
+        if not self.admission.connect(ip):
+            writer.transport.abort()
+            return
+        loop = asyncio.get_running_loop()
+        c = self.connections.add(writer, ConnectionRegistry.TCP, ip, loop.time())
+        user_id = c.user_id
+        c.outbound = self._tcp_queue(writer, user_id)
         print(f"[+] {user_id} подключился")
         
         # Отправляем публичный ключ клиента (для E2EE в личных чатах)
-        pkt = Packet.pack(
-            PacketFlag.SYSTEM, MessageType.KEY_EX, 0, 0, 
-            struct.pack('!I', len(public_key)) + public_key
-        )
-        writer.write(pkt)
-        await writer.drain()
+        self.rekey(writer)
         
+        decoder = FrameDecoder(self.admission.max_frame)  # больше — ValueError и разрыв
         try:
             while True:
-                header = await reader.readexactly(Packet.HEADER_SIZE)
-                # need to read remaining payload length; for simplicity read rest of stream
-                rest = await reader.read(1024)
-                flags, msg_type, chat_type, chat_id, payload = Packet.unpack(header + rest)
-                
-                # Обработка E2EE для личных чатов
-                if flags & PacketFlag.ENCRYPTED and chat_type == ChatType.PRIVATE:
-                    sender_pubkey = self._get_peer_pubkey(user_id, chat_id)  # Логика поиска ключа
-                    shared_secret = KeyManager.derive_shared_secret(
-                        self.storage.user_keys[user_id]['private'], 
-                        sender_pubkey
-                    )
-                    payload = E2EE.decrypt(payload, shared_secret)
-                
-                # Сохраняем сообщение в хранилище и (опционально) в кэше
-                if chat_id in self.storage.chats:
-                    msg = {
-                        'from': user_id,
-                        'data': payload,
-                        'encrypted': bool(flags & PacketFlag.ENCRYPTED)
-                    }
-                    self.storage.chats[chat_id]['messages'].append(msg)
-                    if self.cache:
-                        self.cache.add_message(chat_id, msg)
-                
-                # Рассылка участникам чата
-                await self._broadcast(chat_id, header + payload, exclude=writer)
+                data = await reader.read(self.READ_SIZE)
+                if not data:
+                    break
+                c.seen = loop.time()
+                self._m_tcp_bytes_in.inc(len(data))
+                frames = decoder.feed(data)
+                if not frames:
+                    continue
+                self._m_tcp_in.inc(len(frames))
+                await self._handle_frames(user_id, writer, frames, self._m_tcp_read)
+            print(f"[-] {user_id} отключился")
         except Exception as e:
+            self._m_tcp_errors.inc()
             print(f"[-] {user_id} отключился: {e}")
         finally:
             self._cleanup(writer)
     
-    async def _broadcast(self, chat_id: int, data: bytes, exclude=None):
-        members = self.cache.get_members(chat_id) if self.cache else self.storage.chats[chat_id]['members']
-        for writer, uid in self.tcp_connections.items():
-            if writer != exclude and uid in members:
-                try:
-                    writer.write(data)
-                    await writer.drain()
-                except: pass
-
-    async def _broadcast_ws(self, chat_id: int, from_user: str, text: str):
-        msg = json.dumps({'chat_id': chat_id, 'from': from_user, 'text': text})
-        members = self.cache.get_members(chat_id) if self.cache else self.storage.chats.get(chat_id, {}).get('members', {})
-        for ws, uid in list(self.ws_connections.items()):
-            if uid != from_user and uid in members:
-                try:
-                    await ws.send(msg)
-                except:
-                    pass
+    async def _handle_frames(self, user_id: str, conn, frames: list, elapsed):
+        # распаковка (zlib) — одной пачкой на чтение, крупная в пуле;
+        # кадры соединения обрабатываются строго по очереди
+        # время — на всё чтение, а не на кадр: под нагрузкой в чтении
+        # десятки кадров, и замер не должен стоить дороже их обработки
+        start = time.perf_counter()
+        if self.admission.limits_frames:
+            # сверх лимита — отбрасываем по заголовку, до распаковки
+            frames = [f for f in frames if self._admit(user_id, conn, f)]
+            if not frames:
+                return
+        packets = await self.offload.map(Packet.unpack, frames)
+        self._m_unpack.since(start)
+        for frame, packet in zip(frames, packets):
+            await self._handle_frame(user_id, conn, frame, packet)
+        elapsed.since(start)
+
+    def _admit(self, user_id: str, conn, frame) -> bool:
+        if frame[1] == MessageType.TEXT:
+            return self.admission.allow(conn, user_id, Packet.chat_id(frame))
+        return self.admission.allow(conn, user_id)
+
+    async def _handle_frame(self, user_id: str, writer, frame: memoryview, packet: tuple):
+        flags, msg_type, chat_type, chat_id, payload = packet
+
+        if msg_type == MessageType.JOIN:
+            await self._join(chat_id, user_id, writer, self.tcp_index)
+            return
+        if msg_type == MessageType.KEY_EX:
+            self._peer_key(writer, payload)
+            return
+        if msg_type == MessageType.SYNC:
+            await self._sync(user_id, writer, chat_id, payload)
+            return
+        if msg_type == MessageType.PING:
+            return  # ответ на heartbeat: время чтения уже отмечено
+
+        # Обработка E2EE для личных чатов
+        if flags & PacketFlag.ENCRYPTED and chat_type == ChatType.PRIVATE:
+            c = self.connections.by_conn[writer]
+            if c.peer_key is None:
+                return  # клиент ещё не прислал свой ключ — расшифровать нечем
+            cipher = self.sessions.get(c.private_key, c.peer_key, owner=writer).cipher
+            start = time.perf_counter()
+            payload = await self.offload.run(len(payload), E2EE.decrypt_with, cipher, payload)
+            self._m_decrypt.since(start)
+            # расшифрованный payload пересобираем в новый пакет (со сжатием)
+            flags &= ~PacketFlag.ENCRYPTED
+            start = time.perf_counter()
+            out = await self.offload.run(
+                len(payload), Packet.pack, flags, msg_type, chat_type, chat_id, payload
+            )
+            self._m_repack.since(start)
+        else:
+            # кадр пересылается как есть (добавляется только seq), сериализация не нужна
+            out = frame
+
+        # Сохраняем сообщение в хранилище и (опционально) в кэше; флаг
+        # ENCRYPTED — про сохраняемые байты: после расшифровки его уже нет
+        seq = None
+        if await self._has_chat(chat_id):
+            seq = self._store_message(chat_id, user_id, bytes(payload),
+                                      bool(flags & PacketFlag.ENCRYPTED))
+
+        # Рассылка участникам чата — с номером сообщения
+        self._when_stored(seq, lambda seq: self._broadcast(
+            chat_id, Packet.stamp(out, seq), exclude=writer))
+
+    def rekey(self, writer):
+        """Новая пара ключей сервера для соединения; старые сессии стираются."""
+        c = self.connections.by_conn[writer]
+        c.private_key, c.public_key = self.keys.take()
+        self.sessions.forget(writer)
+        c.outbound.put(Packet.pack(
+            PacketFlag.SYSTEM, MessageType.KEY_EX, 0, 0,
+            struct.pack('!I', len(c.public_key)) + c.public_key
+        ))
+
+    def _peer_key(self, writer, payload):
+        # ответный KEY_EX: публичный ключ клиента; повторный — клиент сменил ключи
+        key_len = struct.unpack('!I', payload[:4])[0]
+        self.connections.by_conn[writer].peer_key = bytes(payload[4:4 + key_len])
+        self.sessions.forget(writer)
+
+    def _store_message(self, chat_id: int, user_id: str, data: bytes, encrypted: bool):
+        # история живёт в Redis, если он подключён, иначе в памяти процесса;
+        # возвращает seq, с Redis — future с seq (номер выдаётся при записи)
+        if self.cache:
+            return self.cache.add_message(chat_id, {'from': user_id, 'data': data,
+                                                    'encrypted': encrypted})
+        return self.storage.history.append(chat_id, user_id, data, encrypted)
+
+    @staticmethod
+    def _when_stored(seq, deliver):
+        # рассылка ждёт номера, но не блокирует чтение соединения: future
+        # пакета Redis завершаются по порядку seq, порядок доставки тот же
+        if isinstance(seq, asyncio.Future):
+            seq.add_done_callback(lambda f: deliver(None if f.cancelled() else f.result()))
+        else:
+            deliver(seq)
+
+    async def _sync_page(self, user_id: str, chat_id, after: int, limit: int):
+        """Страница истории после after для участника чата: (чат, записи, more)
+        или None. Не больше SYNC_PAGE записей; more — страница полная,
+        за ней могут быть ещё."""
+        limit = max(1, min(limit, self.SYNC_PAGE))
+        chat = await self._load_chat(chat_id)
+        if chat is None or user_id not in chat['members']:
+            return None
+        if self.cache:
+            records = await self.cache.get_page(chat_id, after=after, limit=limit)
+        else:
+            records = self.storage.history.page(chat_id, after=after, limit=limit)
+        return chat, records, len(records) == limit
+
+    async def _sync(self, user_id: str, conn, chat_id: int, payload):
+        if len(payload) < SYNC_REQUEST.size or not self.admission.allow_sync():
+            return
+        after, limit = SYNC_REQUEST.unpack_from(payload)
+        page = await self._sync_page(user_id, chat_id, after, limit)
+        if page is None:
+            return
+        chat, records, more = page
+        # шифротекст уходит с флагом ENCRYPTED, как и при живой рассылке
+        frames = [Packet.pack(PacketFlag.ENCRYPTED if r.encrypted else 0, MessageType.TEXT,
+                              chat['type'], chat_id, r.data, seq=r.seq)
+                  for r in records]
+        through = records[-1].seq if records else after
+        frames.append(Packet.pack(PacketFlag.SYSTEM, MessageType.SYNC, chat['type'], chat_id,
+                                  SYNC_REPLY.pack(through, more)))
+        # страница — одним элементом очереди: не вытесняет живые сообщения
+        self.connections.by_conn[conn].outbound.put(b''.join(frames))
+
+    async def _load_chat(self, chat_id: int) -> dict | None:
+        # с Redis чаты живут только там (локально — в NearCache с TTL и
+        # инвалидацией), в storage не копируются; без Redis — в storage
+        if self.cache:
+            return await self.cache.get_chat(chat_id)
+        return self.storage.chats.get(chat_id)
+
+    async def _has_chat(self, chat_id: int) -> bool:
+        if self.cache:
+            return await self.cache.has_chat(chat_id)
+        return chat_id in self.storage.chats
+
+    def _save_chat(self, chat_id, chat: dict):
+        if self.cache:
+            self.cache.store_chat(chat_id, chat)
+        else:
+            self.storage.save_chat(chat_id, chat)
+
+    async def _join(self, chat_id: int, user_id: str, conn, index: FanoutIndex) -> bool:
+        chat = await self._load_chat(chat_id)
+        if chat is None:
+            return False
+        if self.cache:
+            self.cache.add_member(chat_id, user_id)
+        else:
+            self.storage.add_member(chat_id, user_id)
+        index.subscribe(chat_id, conn)
+        return True
+
+    def _tcp_queue(self, writer, user_id: str) -> OutboundQueue:
+        async def send(data: bytes):
+            writer.write(data)
+            await writer.drain()
+
+        return OutboundQueue(
+            send, writer.transport.abort,
+            high_water=self.send_queue_size, policy=self.overflow_policy,
+            combine=b''.join, name=user_id,  # кадры TCP самоограничены, склейка без потерь
+        )
+
+    def _ws_queue(self, websocket, user_id: str, packets: bool = False) -> OutboundQueue:
+        def close():
+            asyncio.create_task(websocket.close(code=1008, reason='slow consumer'))
+
+        if packets:
+            # кадры Packet самоограничены: накопленное за тик уходит одним
+            # WS-сообщением (один заголовок, один проход deflate)
+            return OutboundQueue(
+                websocket.send, close,
+                high_water=self.send_queue_size, policy=self.overflow_policy,
+                combine=b''.join, name=user_id,
+            )
+
+        async def send(data: bytes):
+            # JSON уже в UTF-8: текстовый кадр без повторного кодирования
+            await websocket.send(data, text=True)
+
+        return OutboundQueue(
+            send, close,
+            high_water=self.send_queue_size, policy=self.overflow_policy,
+            name=user_id,
+        )
+
+    def outbound_stats(self) -> dict:
+        """Суммарное состояние исходящих очередей (глубина, потери, вытеснения)."""
+        queues = [c.outbound for c in self.connections.by_conn.values()]
+        return {
+            'connections': len(queues),
+            'queued': sum(q.depth for q in queues),
+            'max_depth': max((q.depth for q in queues), default=0),
+            'sent': sum(q.sent for q in queues),
+            'dropped': sum(q.dropped for q in queues),
+            'coalesced': sum(q.coalesced for q in queues),
+            'evicted': sum(q.evicted for q in queues),
+        }
+
+    def _broadcast(self, chat_id: int, data: bytes, exclude=None):
+        self._m_fanout.observe(self._deliver_tcp(chat_id, data, exclude))
+        if self.router:
+            self.router.publish(chat_id, ClusterRouter.TCP, data)
+
+    @staticmethod
+    def _json_message(chat_id, from_user: str, text: str, seq: int | None) -> bytes:
+        msg = {'chat_id': chat_id, 'from': from_user, 'text': text}
+        if seq is not None:
+            msg['seq'] = seq
+        return json.dumps(msg, ensure_ascii=False).encode('utf-8')
+
+    def _broadcast_ws(self, chat_id: int, from_user: str, text: str, exclude=None,
+                      seq: int | None = None):
+        msg = self._json_message(chat_id, from_user, text, seq)
+        self._m_fanout.observe(self._deliver_ws(chat_id, msg, exclude))
+        if self.router:
+            self.router.publish(chat_id, ClusterRouter.WS, msg)
+
+    def _deliver_tcp(self, chat_id: int, data: bytes, exclude=None) -> int:
+        # только постановка в очереди: отправку ведут задачи-писатели
+        n = 0
+        by_conn = self.connections.by_conn
+        for writer in self.tcp_index.subscribers(chat_id):
+            if writer is not exclude:
+                by_conn[writer].outbound.put(data)
+                n += 1
+        self._m_tcp_out.inc(n)
+        self._m_tcp_bytes_out.inc(n * len(data))
+        return n
+
+    def _deliver_ws(self, chat_id: int, msg: bytes, exclude=None) -> int:
+        n = 0
+        by_conn = self.connections.by_conn
+        for ws in self.ws_index.subscribers(chat_id):
+            if ws is not exclude:
+                by_conn[ws].outbound.put(msg)
+                n += 1
+        self._m_ws_out.inc(n)
+        self._m_ws_bytes_out.inc(n * len(msg))
+        return n
+
+    def _deliver_remote(self, chat_id: int, kind: int, payload: memoryview):
+        # сообщение, опубликованное другим инстансом, — только локальным клиентам
+        if kind == ClusterRouter.TCP:
+            self._deliver_tcp(chat_id, payload)
+        elif kind == ClusterRouter.WS:
+            self._deliver_ws(chat_id, payload)
     
     def _cleanup(self, writer):
-        if writer in self.tcp_connections:
-            uid = self.tcp_connections.pop(writer)
-            del self.storage.users[writer]
+        if self._release(writer):
             writer.close()
 
+    def _release(self, conn) -> bool:
+        # всё состояние соединения уходит вместе с записью реестра, включая ключи
+        c = self.connections.remove(conn)
+        if c is None:
+            return False
+        self.tcp_index.unsubscribe_all(conn)
+        self.ws_index.unsubscribe_all(conn)
+        self.sessions.forget(conn)
+        c.outbound.close()
+        self.admission.disconnect(c.ip, conn)
+        return True
+
     async def websocket_handler(self, websocket):
-        user_id = f"ws_{id(websocket) % 10000}"
-        self.ws_connections[websocket] = user_id
-        self.storage.users[websocket] = {'user_id': user_id}
-        print(f"[WS+] {user_id} connected")
+        ip = websocket.remote_address[0] if websocket.remote_address else None
+        if not self.admission.connect(ip):
+            await websocket.close(code=1013, reason='try again later')
+            return
+        packets = websocket.subprotocol == self.WS_PACKET
+        c = self.connections.add(websocket, ConnectionRegistry.WS, ip)
+        user_id = c.user_id
+        c.outbound = self._ws_queue(websocket, user_id, packets)
+        print(f"[WS+] {user_id} connected ({websocket.subprotocol or 'json'})")
         try:
-            async for message in websocket:
-                try:
-                    data = json.loads(message)
-                except:
-                    continue
-                # administrative actions
-                if 'action' in data:
-                    action = data['action']
-                    if action == 'create':
-                        chat_id = data.get('chat_id')
-                        chat_type = data.get('type', ChatType.GROUP)
-                        name = data.get('name')
-                        if chat_id is not None:
-                            self.storage.chats[chat_id] = {
-                                'type': chat_type,
-                                'name': name or f"Chat_{chat_id}",
-                                'members': {user_id},
-                                'admin': user_id if chat_type == ChatType.CHANNEL else None,
-                                'messages': []
-                            }
-                            if self.cache:
-                                self.cache.store_chat(chat_id, self.storage.chats[chat_id])
-                    elif action == 'join':
-                        chat_id = data.get('chat_id')
-                        if chat_id in self.storage.chats:
-                            self.storage.chats[chat_id]['members'].add(user_id)
-                            if self.cache:
-                                self.cache.add_member(chat_id, user_id)
-                    continue
-                
-                # normal message
-                chat_id = data.get('chat_id')
-                text = data.get('text')
-                if chat_id is None or text is None:
-                    continue
-                # create chat on the fly if not exist
-                if chat_id not in self.storage.chats:
-                    self.storage.chats[chat_id] = {
-                        'type': ChatType.GROUP,
-                        'name': f"Chat_{chat_id}",
-                        'members': {user_id},
-                        'admin': None,
-                        'messages': []
-                    }
-                    if self.cache:
-                        self.cache.store_chat(chat_id, self.storage.chats[chat_id])
-                msg = {
-                    'from': user_id,
-                    'data': text.encode('utf-8'),
-                    'encrypted': False
-                }
-                self.storage.chats[chat_id]['messages'].append(msg)
-                if self.cache:
-                    self.cache.add_message(chat_id, msg)
-                await self._broadcast_ws(chat_id, user_id, text)
+            if packets:
+                self.rekey(websocket)
+                await self._ws_packets(websocket, user_id)
+            else:
+                await self._ws_json(websocket, user_id)
         except Exception as e:
+            self._m_ws_errors.inc()
             print(f"[WS-] {user_id} disconnect: {e}")
         finally:
-            self.ws_connections.pop(websocket, None)
-            self.storage.users.pop(websocket, None)
+            self._release(websocket)
             print(f"[WS-] {user_id} disconnected")
 
-    async def start(self):
+    async def _ws_packets(self, websocket, user_id: str):
+        # WS_PACKET: тот же поток кадров, что по TCP, в бинарных сообщениях;
+        # кадр может быть разрезан между сообщениями, как между read()
+        decoder = FrameDecoder(self.admission.max_frame)
+        async for message in websocket:
+            if isinstance(message, str):
+                continue
+            self._m_ws_bytes_in.inc(len(message))
+            frames = decoder.feed(message)
+            if not frames:
+                continue
+            self._m_ws_in.inc(len(frames))
+            await self._handle_frames(user_id, websocket, frames, self._m_ws_message)
+
+    async def _ws_json(self, websocket, user_id: str):
+        async for message in websocket:
+            start = time.perf_counter()
+            self._m_ws_in.inc()
+            self._m_ws_bytes_in.inc(len(message))
+            try:
+                data = json.loads(message)
+            except ValueError:
+                continue
+            if not isinstance(data, dict):
+                continue
+            # administrative actions
+            if 'action' in data:
+                if not self.admission.allow(websocket, user_id):
+                    continue
+                action = data['action']
+                if not self._valid_chat_id(data.get('chat_id')):
+                    continue
+                if action == 'create':
+                    chat_id = data.get('chat_id')
+                    chat_type = data.get('type', ChatType.GROUP)
+                    name = data.get('name')
+                    # поля от клиента: проверяем до записи в хранилище и Redis
+                    if (isinstance(chat_type, bool) or chat_type not in self.CHAT_TYPES
+                            or not isinstance(name, (str, type(None)))):
+                        continue
+                    if chat_id is not None:
+                        self._save_chat(chat_id, {
+                            'type': chat_type,
+                            'name': name or f"Chat_{chat_id}",
+                            'members': {user_id},
+                            'admin': user_id if chat_type == ChatType.CHANNEL else None
+                        })
+                        self.ws_index.subscribe(chat_id, websocket)
+                elif action == 'join':
+                    await self._join(data.get('chat_id'), user_id, websocket, self.ws_index)
+                elif action == 'sync':
+                    await self._sync_json(user_id, websocket, data)
+                continue
+                
+            # normal message
+            chat_id = data.get('chat_id')
+            text = data.get('text')
+            if chat_id is None or not isinstance(text, str) or not self._valid_chat_id(chat_id):
+                continue
+            if not self.admission.allow(websocket, user_id, chat_id):
+                continue
+            # create chat on the fly if not exist
+            if not await self._has_chat(chat_id):
+                self._save_chat(chat_id, {
+                    'type': ChatType.GROUP,
+                    'name': f"Chat_{chat_id}",
+                    'members': {user_id},
+                    'admin': None
+                })
+                self.ws_index.subscribe(chat_id, websocket)
+            seq = self._store_message(chat_id, user_id, text.encode('utf-8'), False)
+            # partial, а не lambda: переменные цикла к записи в Redis уже другие
+            self._when_stored(seq, functools.partial(
+                self._broadcast_ws, chat_id, user_id, text, websocket))
+            self._m_ws_message.since(start)
+
+    @staticmethod
+    def _valid_chat_id(chat_id) -> bool:
+        # из JSON: ключ словарей и имени ключа Redis — только int или str
+        return chat_id is None or (isinstance(chat_id, (int, str)) and not isinstance(chat_id, bool))
+
+    @staticmethod
+    def _valid_seq(value) -> bool:
+        # after/limit из JSON: то же, что влезает в SYNC_REQUEST двоичного клиента
+        return isinstance(value, int) and not isinstance(value, bool) and 0 <= value < 2 ** 64
+
+    async def _sync_json(self, user_id: str, websocket, data: dict):
+        # {'action': 'sync', 'chat_id', 'after', 'limit'}: сообщения страницы,
+        # затем {'action': 'sync', 'chat_id', 'through', 'more'}
+        if not self.admission.allow_sync():
+            return
+        chat_id = data.get('chat_id')
+        after = data.get('after') or 0
+        limit = data.get('limit') or self.SYNC_PAGE
+        if not (self._valid_seq(after) and self._valid_seq(limit)):
+            return
+        page = await self._sync_page(user_id, chat_id, after, limit)
+        if page is None:
+            return
+        _, records, more = page
+        queue = self.connections.by_conn[websocket].outbound
+        for r in records:
+            if r.encrypted:
+                continue  # шифротекст JSON-клиенту не показать (как и вживую)
+            queue.put(self._json_message(chat_id, r.sender, str(r.data, 'utf-8', 'replace'), r.seq))
+        through = records[-1].seq if records else after
+        queue.put(json.dumps({'action': 'sync', 'chat_id': chat_id,
+                              'through': through, 'more': more}).encode('utf-8'))
+
+    def _select_subprotocol(self, connection, subprotocols):
+        # первый поддерживаемый из предложенных клиентом; без подпротокола —
+        # прежний JSON (стандартный выбор websockets такого клиента отклонил бы)
+        for protocol in subprotocols:
+            if protocol in (self.WS_PACKET, self.WS_JSON):
+                return protocol
+        return None
+
+    def _ws_extensions(self) -> list:
+        if self.ws_compression is None:
+            return []
+        if self.ws_compression != 'deflate':
+            raise ValueError(f"неизвестное сжатие WS: {self.ws_compression}")
+        d = self.ws_deflate
+        return [ServerPerMessageDeflateFactory(
+            server_max_window_bits=d['window'], client_max_window_bits=d['window'],
+            compress_settings={'level': d['level'], 'memLevel': d['mem_level']},
+        )]
+
+    async def _housekeeping(self):
+        # TTL истории проверяется при записи; простаивающие чаты чистим периодически
+        while True:
+            await asyncio.sleep(self.HOUSEKEEPING_INTERVAL)
+            self.storage.history.trim_expired()
+
+    async def _heartbeat(self):
+        # один обход всех соединений за интервал вместо таймера на каждое:
+        # на 100k простаивающих соединений это единицы мс раз в интервал
+        loop = asyncio.get_running_loop()
+        ping = Packet.pack(PacketFlag.SYSTEM, MessageType.PING, 0, 0, b'')
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = loop.time()
+            for c in list(self.connections.by_conn.values()):
+                if c.transport != ConnectionRegistry.TCP:
+                    continue
+                idle = now - c.seen
+                if self.idle_timeout is not None and idle >= self.idle_timeout:
+                    print(f"[-] {c.user_id} молчит {idle:.0f} с, отключаем")
+                    c.conn.transport.abort()
+                elif idle >= self.heartbeat_interval:
+                    c.outbound.put(ping)
+
+    async def start(self, reuse_port: bool = False):
+        """Обслуживает TCP и WS до вызова stop().
+
+        reuse_port — SO_REUSEPORT: несколько процессов слушают одни порты,
+        ядро распределяет между ними входящие соединения (см. Supervisor).
+        """
+        if self.cache:
+            # локальный кэш чатов сбрасывается по событиям других серверов
+            self.cache.start_invalidation()
+        if self.router:
+            self.router.start()
+        self._housekeeper = asyncio.create_task(self._housekeeping())
+        self._heartbeats = asyncio.create_task(self._heartbeat()) if self.heartbeat_interval else None
+        self.keys.fill()
+        self.admission.watch_loop()
+        self.metrics.watch_loop()
+        if self.metrics_port:
+            await self.metrics.serve('127.0.0.1', self.metrics_port)
         # run both TCP and WS servers concurrently
-        tcp_server = await asyncio.start_server(self.handle_client, self.host, self.port)
-        ws_server = await websockets.serve(self.websocket_handler, self.host, self.ws_port)
+        self._tcp_server = await asyncio.start_server(
+            self.handle_client, self.host, self.port, reuse_port=reuse_port, backlog=self.BACKLOG
+        )
+        self._ws_server = await ws_serve(
+            self.websocket_handler, self.host, self.ws_port,
+            reuse_port=reuse_port, backlog=self.BACKLOG,
+            max_size=self.admission.max_frame + Packet.HEADER_SIZE,  # больше — закрытие 1009
+            ping_interval=self.heartbeat_interval, ping_timeout=self.heartbeat_interval,
+            subprotocols=[self.WS_PACKET, self.WS_JSON], select_subprotocol=self._select_subprotocol,
+            compression=None, extensions=self._ws_extensions(),
+        )
         print(f"TCP server on {self.host}:{self.port}, WS on {self.host}:{self.ws_port}")
-        async with tcp_server:
-            await asyncio.gather(tcp_server.serve_forever(), ws_server.wait_closed())
+        await asyncio.gather(self._tcp_server.wait_closed(), self._ws_server.wait_closed())
+
+    async def stop(self):
+        """Плавная остановка: новые соединения не принимаются, текущие
+        закрываются, отложенные записи Redis и диска сбрасываются."""
+        self._tcp_server.close()
+        self._ws_server.close()  # закрывает WS-соединения с кодом 1001
+        for c in list(self.connections.by_conn.values()):
+            if c.transport == ConnectionRegistry.TCP:
+                c.conn.close()
+        await self._ws_server.wait_closed()
+        await asyncio.sleep(0)  # обработчики TCP завершаются и чистят свои очереди
+        self._housekeeper.cancel()
+        if self._heartbeats:
+            self._heartbeats.cancel()
+        await self.metrics.close()
+        if self.router:
+            await self.router.close()
+        if self.cache:
+            await self.cache.close()
+        self.storage.close()
+        self.offload.close()
+        self.keys.close()
+        self.admission.close()
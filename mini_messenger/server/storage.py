@@ -1,19 +1,120 @@
 from collections import defaultdict
+import json
+import os
 import uuid
+from .history import HistoryStore
+from .disk_log import DiskHistoryStore
 
 class InMemoryStorage:
-    def __init__(self):
-        self.users = {}  # conn: {user_id, public_key, current_chat}
-        self.chats = {}  # chat_id: {type, name, members(set), messages[]}
-        self.user_keys = {}  # user_id: {private_key, public_key}
-    
+    def __init__(self, history_limit: int = 10_000, history_ttl: float = None):
+        self.chats = {}  # chat_id: {type, name, members(set), admin}
+        self.history = HistoryStore(history_limit, history_ttl)  # сообщения чатов
+
     def create_chat(self, chat_type: int, creator_id: str, name: str = None):
         chat_id = uuid.uuid4().int & 0xFFFFFFFF  # 4-байтный ID
-        self.chats[chat_id] = {
+        self.save_chat(chat_id, {
             'type': chat_type,
             'name': name or f"Chat_{chat_id}",
             'members': {creator_id},
             'admin': creator_id if chat_type == 3 else None,  # Только для каналов
-            'messages': []
-        }
+        })
         return chat_id
+
+    # изменения чатов идут через эти методы, чтобы наследник мог их сохранять
+    def save_chat(self, chat_id, chat: dict):
+        self.chats[chat_id] = chat
+
+    def add_member(self, chat_id, user_id: str):
+        self.chats[chat_id]['members'].add(user_id)
+
+    def close(self):
+        pass
+
+
+class DiskStorage(InMemoryStorage):
+    """InMemoryStorage, переживающий перезапуск процесса.
+
+    Сообщения пишутся в DiskHistoryStore (data_dir/messages). Чаты
+    по-прежнему в памяти, а их изменения дописываются JSON-строками в
+    журнал data_dir/chats.log. Каждые SNAPSHOT_EVERY записей журнал
+    сворачивается в снимок data_dir/chats.snapshot, поэтому при старте
+    читается снимок и только хвост журнала после него.
+    """
+
+    SNAPSHOT_EVERY = 10_000
+
+    def __init__(self, data_dir: str, history_limit: int = 10_000, history_ttl: float = None,
+                 fsync: str = 'batch'):
+        super().__init__(history_limit, history_ttl)
+        self.history = DiskHistoryStore(os.path.join(data_dir, 'messages'),
+                                        history_limit, history_ttl, fsync=fsync)
+        self.fsync = fsync
+        self._snapshot_path = os.path.join(data_dir, 'chats.snapshot')
+        self._journal_path = os.path.join(data_dir, 'chats.log')
+        self._journaled = self._load()
+        self._journal = open(self._journal_path, 'a', encoding='utf-8')
+
+    def _load(self) -> int:
+        try:
+            with open(self._snapshot_path, encoding='utf-8') as f:
+                for chat_id, chat in json.load(f):
+                    chat['members'] = set(chat['members'])
+                    self.chats[chat_id] = chat
+        except FileNotFoundError:
+            pass
+        replayed = 0
+        try:
+            with open(self._journal_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        op, chat_id, value = json.loads(line)
+                    except ValueError:
+                        break  # недописанная строка — конец журнала
+                    if op == 'chat':
+                        value['members'] = set(value['members'])
+                        self.chats[chat_id] = value
+                    elif op == 'member' and chat_id in self.chats:
+                        self.chats[chat_id]['members'].add(value)
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+        print(f"[disk] {len(self.chats)} чатов: снимок + {replayed} записей журнала")
+        return replayed
+
+    def _record(self, op: str, chat_id, value):
+        self._journal.write(json.dumps([op, chat_id, value]) + '\n')
+        self._journal.flush()
+        if self.fsync == 'always':
+            os.fsync(self._journal.fileno())
+        self._journaled += 1
+        if self._journaled >= self.SNAPSHOT_EVERY:
+            self.snapshot()
+
+    def save_chat(self, chat_id, chat: dict):
+        super().save_chat(chat_id, chat)
+        self._record('chat', chat_id, dict(chat, members=sorted(chat['members'])))
+
+    def add_member(self, chat_id, user_id: str):
+        if user_id not in self.chats[chat_id]['members']:
+            super().add_member(chat_id, user_id)
+            self._record('member', chat_id, user_id)
+
+    def snapshot(self):
+        """Сворачивает журнал: атомарно пишет снимок и начинает журнал заново."""
+        chats = [[chat_id, dict(chat, members=sorted(chat['members']))]
+                 for chat_id, chat in self.chats.items()]
+        tmp = self._snapshot_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(chats, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._snapshot_path)
+        # сбой между replace и усечением безопасен: журнал переигрывается поверх снимка
+        self._journal.close()
+        self._journal = open(self._journal_path, 'w', encoding='utf-8')
+        self._journaled = 0
+
+    def close(self):
+        self.snapshot()
+        self._journal.close()
+        self.history.close()
@@ -0,0 +1,123 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from multiprocessing.connection import wait
+
+from .server import MiniServer
+
+
+def _worker(index: int, server_kwargs: dict):
+    # процесс-воркер: свой цикл событий и свой MiniServer на общих портах
+    metrics_port = server_kwargs.get('metrics_port') or int(os.getenv('METRICS_PORT', 0))
+    if metrics_port:
+        # /metrics у каждого воркера свой: порт + номер воркера
+        server_kwargs = dict(server_kwargs, metrics_port=metrics_port + index)
+
+    async def main():
+        server = MiniServer(**server_kwargs)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, lambda: asyncio.ensure_future(server.stop()))
+        await server.start(reuse_port=True)
+
+    print(f"[worker {index}] pid {os.getpid()}")
+    asyncio.run(main())
+    print(f"[worker {index}] остановлен")
+
+
+class Supervisor:
+    """Многопроцессный режим: N воркеров MiniServer на одних портах.
+
+    Каждый воркер слушает TCP и WS с SO_REUSEPORT, и ядро само
+    распределяет соединения между процессами. Состояние чатов и
+    рассылка между воркерами идут через Redis — тот же RedisCache и
+    ClusterRouter, что и между серверами на разных машинах, поэтому
+    при нескольких воркерах Redis обязателен.
+
+    Метрики воркер index отдаёт на порту METRICS_PORT + index: порт
+    метрик слушает 127.0.0.1 без SO_REUSEPORT, чтобы каждый воркер
+    опрашивался отдельно.
+
+    Упавший воркер перезапускается; если он падает сразу после старта,
+    пауза перед перезапуском растёт вдвое (до RESTART_MAX). SIGTERM и
+    SIGINT останавливают всех: воркеры получают SIGTERM и закрываются
+    плавно, через STOP_TIMEOUT секунд оставшиеся убиваются.
+    """
+
+    RESTART_DELAY = 0.5
+    RESTART_MAX = 30.0
+    STABLE_AFTER = 10.0  # столько проработал — падение не считается циклом
+    STOP_TIMEOUT = 10.0
+
+    def __init__(self, workers: int | None = None, **server_kwargs):
+        self.workers = workers or os.cpu_count() or 1
+        if self.workers > 1 and not (server_kwargs.get('redis_url') or os.getenv('REDIS_URL')
+                                     or os.getenv('USE_REDIS')):
+            raise RuntimeError("several workers share state through Redis: set REDIS_URL")
+        if self.workers > 1 and (server_kwargs.get('data_dir') or os.getenv('DATA_DIR')):
+            # DiskStorage рассчитан на один процесс: общий лог и снимок чатов
+            # воркеры перезаписывали бы друг у друга
+            raise RuntimeError("DATA_DIR is single-process: run one worker or drop DATA_DIR")
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise RuntimeError("SO_REUSEPORT is not supported on this platform")
+        self.server_kwargs = server_kwargs
+        self._ctx = multiprocessing.get_context('spawn')
+        self._procs = {}    # index: Process
+        self._started = {}  # index: время запуска
+        self._delay = {}    # index: текущая пауза перед перезапуском
+        self._stopping = False
+        self.restarts = 0
+
+    def _spawn(self, index: int):
+        proc = self._ctx.Process(target=_worker, args=(index, self.server_kwargs),
+                                 name=f"mini-worker-{index}", daemon=False)
+        proc.start()
+        self._procs[index] = proc
+        self._started[index] = time.monotonic()
+
+    def _stop(self, *_):
+        self._stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for index in range(self.workers):
+            self._spawn(index)
+        print(f"[supervisor] {self.workers} воркеров, pid {os.getpid()}")
+
+        pending = {}  # index: момент перезапуска
+        while not self._stopping:
+            wait([p.sentinel for p in self._procs.values() if p.is_alive()], timeout=0.5)
+            now = time.monotonic()
+            for index, proc in self._procs.items():
+                if proc.is_alive() or index in pending:
+                    continue
+                lived = now - self._started[index]
+                delay = self.RESTART_DELAY if lived >= self.STABLE_AFTER else min(
+                    self.RESTART_MAX, self._delay.get(index, self.RESTART_DELAY / 2) * 2)
+                self._delay[index] = delay
+                pending[index] = now + delay
+                print(f"[supervisor] воркер {index} завершился с кодом {proc.exitcode}, "
+                      f"перезапуск через {delay:.1f} s")
+            for index, at in list(pending.items()):
+                if now >= at and not self._stopping:
+                    del pending[index]
+                    self.restarts += 1
+                    self._spawn(index)
+        self.shutdown()
+
+    def shutdown(self):
+        print("[supervisor] остановка воркеров")
+        for proc in self._procs.values():
+            if proc.is_alive():
+                proc.terminate()  # SIGTERM — плавная остановка в воркере
+        deadline = time.monotonic() + self.STOP_TIMEOUT
+        for proc in self._procs.values():
+            proc.join(max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                print(f"[supervisor] {proc.name} не остановился за {self.STOP_TIMEOUT} s")
+                proc.kill()
+                proc.join()
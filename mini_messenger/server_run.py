@@ -1,8 +1,15 @@
 import asyncio
+import os
 from mini_messenger.server.server import MiniServer
+from mini_messenger.server.supervisor import Supervisor
 
 if __name__ == "__main__":
-    server = MiniServer()
-    print(f"🚀 Сервер запущен. TCP:{server.host}:{server.port}, WS:{server.host}:{server.ws_port}")
-    print("   Поддержка: личные чаты (E2EE), группы, каналы")
-    asyncio.run(server.start())
+    # WORKERS=N — N процессов на общих портах (нужен Redis), WORKERS=0 — по числу ядер
+    workers = os.getenv('WORKERS')
+    if workers is not None and int(workers) != 1:
+        Supervisor(int(workers) or None).run()
+    else:
+        server = MiniServer()
+        print(f"🚀 Сервер запущен. TCP:{server.host}:{server.port}, WS:{server.host}:{server.ws_port}")
+        print("   Поддержка: личные чаты (E2EE), группы, каналы")
+        asyncio.run(server.start())
@@ -0,0 +1,80 @@
+import pytest
+
+from mini_messenger.server.admission import AdmissionControl, RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_burst_then_steady_rate():
+    clock = Clock()
+    limiter = RateLimiter(rate=10, burst=5, clock=clock)
+    assert [limiter.allow('a') for _ in range(6)] == [True] * 5 + [False]
+    assert limiter.allow('b')  # ведра ключей независимы
+    clock.now += 0.1           # за 1/rate — ровно один жетон
+    assert limiter.allow('a') and not limiter.allow('a')
+    clock.now += 0.5           # полное ведро, не больше burst
+    assert sum(limiter.allow('a') for _ in range(10)) == 5
+
+
+def test_cost_and_denied_request_does_not_spend():
+    clock = Clock()
+    limiter = RateLimiter(rate=10, burst=10, clock=clock)
+    assert limiter.allow('a', cost=8)
+    assert not limiter.allow('a', cost=3)
+    assert limiter.allow('a', cost=2)
+    assert not limiter.allow('a')
+
+
+def test_idle_buckets_are_forgotten_without_losing_debt():
+    clock = Clock()
+    limiter = RateLimiter(rate=2, burst=2, clock=clock)  # наполнение — 1 с, период — 1 с
+    assert limiter.allow('busy') and limiter.allow('busy') and limiter.allow('idle')
+    clock.now += 1.0
+    # смена поколения: ключ переезжает со своим TAT, а не обнуляется
+    assert limiter.allow('busy') and limiter.allow('busy') and not limiter.allow('busy')
+    clock.now += 2.0
+    limiter.allow('other')
+    assert len(limiter) == 1  # busy и idle простояли период и выброшены
+    limiter.forget('other')
+    assert len(limiter) == 0
+
+
+def test_rate_must_be_positive():
+    with pytest.raises(ValueError):
+        RateLimiter(0)
+
+
+def test_limits_per_conn_user_and_chat():
+    clock = Clock()
+    admission = AdmissionControl(user_rate=100, user_burst=3, chat_rate=100, chat_burst=2,
+                                 clock=clock)
+    assert admission.limits_frames
+    assert admission.allow('c1', 'alice', chat_id=1) and admission.allow('c1', 'alice', chat_id=1)
+    assert not admission.allow('c2', 'bob', chat_id=1)   # лимит чата
+    assert admission.allow('c2', 'bob')                  # служебный кадр: чат не считается
+    assert admission.allow('c1', 'alice', chat_id=2)
+    assert not admission.allow('c1', 'alice', chat_id=3)  # лимит пользователя
+    assert admission.rejected['chat'] == 1 and admission.rejected['user'] == 1
+    assert not AdmissionControl().limits_frames
+
+
+def test_per_ip_cap_and_shedding():
+    admission = AdmissionControl(max_conns_per_ip=2, shed_lag=0.1)
+    assert admission.connect('1.2.3.4') and admission.connect('1.2.3.4')
+    assert not admission.connect('1.2.3.4') and admission.connect('5.6.7.8')
+    admission.disconnect('1.2.3.4')
+    assert admission.connect('1.2.3.4')
+    assert admission.rejected['ip'] == 1
+
+    admission.lag = 0.5
+    assert admission.shedding
+    assert not admission.connect('9.9.9.9') and not admission.allow_sync()
+    assert admission.rejected['shed'] == 2
+    admission.lag = 0.0
+    assert admission.allow_sync()
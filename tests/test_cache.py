@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+
+from mini_messenger.server.cache import RedisCache
+
+
+def _cache(server, **kwargs):
+    return RedisCache(client=fakeredis.FakeAsyncRedis(server=server), **kwargs)
+
+
+def test_store_chat_without_members_keeps_membership():
+    async def run():
+        cache = _cache(fakeredis.FakeServer())
+        cache.store_chat(1, {'type': 2, 'name': 'a', 'members': {'alice', 'bob'}, 'admin': None})
+        assert (await cache.get_chat(1))['members'] == {'alice', 'bob'}
+        # правка метаданных без участников: множество в Redis не трогается
+        cache.store_chat(1, {'type': 2, 'name': 'b', 'admin': None})
+        chat = await cache.get_chat(1)
+        assert chat['name'] == 'b' and chat['members'] == {'alice', 'bob'}
+        await cache.close()
+
+    asyncio.run(run())
+
+
+def test_invalidation_between_instances():
+    async def run():
+        server = fakeredis.FakeServer()
+        a, b = _cache(server), _cache(server)
+        b.start_invalidation()
+        a.store_chat(1, {'type': 2, 'name': 'a', 'members': {'alice'}, 'admin': None})
+        await a.flush()
+        assert (await b.get_chat(1))['members'] == {'alice'}
+        await asyncio.sleep(0.05)  # подписка b готова
+        assert b.local.peek(1) is not None
+
+        a.add_member(1, 'bob')
+        await a.flush()
+        for _ in range(100):
+            if b.local.peek(1) is None:
+                break
+            await asyncio.sleep(0.01)
+        assert (await b.get_chat(1))['members'] == {'alice', 'bob'}
+        # свои события кэш не сбрасывают
+        assert a.local.peek(1)['members'] == {'alice', 'bob'}
+        await a.close()
+        await b.close()
+
+    asyncio.run(run())
+
+
+def test_message_seq_and_paging_like_history_store(monkeypatch):
+    from mini_messenger.server import cache as cache_module
+    from mini_messenger.server.history import HistoryStore
+
+    async def run():
+        cache = _cache(fakeredis.FakeServer(), history_limit=20)
+        memory = HistoryStore(max_messages=20)
+        # сообщения одного тика — одним вызовом скрипта, seq по порядку
+        futures = [cache.add_message(1, {'from': 'alice', 'data': b'%d' % i, 'encrypted': i == 3})
+                   for i in range(30)]
+        assert [await f for f in futures] == list(range(1, 31))
+        assert cache.round_trips == 1
+        for i in range(30):
+            memory.append(1, 'alice', b'%d' % i, i == 3)
+
+        for kwargs in ({'after': 0, 'limit': 5}, {'after': 25, 'limit': 10}, {'limit': 3},
+                       {'before': 15, 'limit': 4}, {'after': 12, 'before': 16},
+                       {'after': 30}, {'before': 5}):
+            records = await cache.get_page(1, **kwargs)
+            expected = memory.page(1, **kwargs)
+            assert [(r.seq, r.data, r.sender, r.encrypted) for r in records] == \
+                [(r.seq, r.data, r.sender, r.encrypted) for r in expected], kwargs
+        assert await cache.get_page(2, after=0) == []
+        await cache.close()
+
+    asyncio.run(run())
+
+
+def test_history_ttl_trims_head(monkeypatch):
+    from mini_messenger.server import cache as cache_module
+
+    async def run():
+        now = [1000.0]
+        monkeypatch.setattr(cache_module.time, 'time', lambda: now[0])
+        cache = _cache(fakeredis.FakeServer(), history_ttl=60)
+        for i in range(3):
+            cache.add_message(1, {'from': 'a', 'data': b'old', 'encrypted': False})
+        await cache.flush()
+        now[0] += 100
+        assert await cache.add_message(1, {'from': 'a', 'data': b'new', 'encrypted': False}) == 4
+        records = await cache.get_page(1, after=0)
+        assert [(r.seq, r.data, r.ts) for r in records] == [(4, b'new', 1100.0)]
+        await cache.close()
+
+    asyncio.run(run())
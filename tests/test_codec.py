@@ -0,0 +1,30 @@
+import pytest
+
+from mini_messenger.server.codec import BinaryCodec, JsonCodec, codec_for
+
+
+@pytest.mark.parametrize('codec', [BinaryCodec(), JsonCodec()])
+def test_roundtrip(codec):
+    body = codec.encode_message('alice', b'\x00\xffpayload', True)
+    assert codec_for(body[0]).decode_message(body) == ('alice', b'\x00\xffpayload', True)
+    chat = {'type': 3, 'name': 'Канал', 'admin': 'alice'}
+    fields = {k.encode(): v for k, v in codec.encode_chat(chat).items()}
+    assert codec_for(fields[b'v'][0]).decode_chat(fields) == chat
+
+
+@pytest.mark.parametrize('codec', [BinaryCodec(), JsonCodec()])
+@pytest.mark.parametrize('chat', [
+    {'type': 'group', 'name': 'x'},
+    {'type': 300, 'name': 'x'},
+    {'type': True, 'name': 'x'},
+    {'type': 2, 'name': 5},
+    {'type': 2, 'name': 'x', 'admin': ['alice']},
+])
+def test_rejects_bad_chat_fields(codec, chat):
+    with pytest.raises(ValueError):
+        codec.encode_chat(chat)
+
+
+def test_unknown_version():
+    with pytest.raises(ValueError):
+        codec_for(0xEE)
@@ -0,0 +1,22 @@
+from mini_messenger.server.connections import ConnectionRegistry
+
+
+def test_ids_do_not_repeat_across_restarts():
+    # перезапуск без Redis — новый реестр, счётчик снова с 1
+    first, second = ConnectionRegistry(), ConnectionRegistry()
+    a = first.add(object(), ConnectionRegistry.WS)
+    b = second.add(object(), ConnectionRegistry.WS)
+    assert a.user_id.startswith('ws_') and a.user_id != b.user_id
+
+
+def test_node_tag_and_indexes():
+    registry = ConnectionRegistry('abc123')
+    conn = object()
+    c = registry.add(conn, ConnectionRegistry.TCP, ip='127.0.0.1')
+    assert c.user_id == 'user_abc123_1'
+    assert registry.by_user[c.user_id] is registry.by_conn[conn] is c
+    assert registry.count(ConnectionRegistry.TCP) == 1
+    assert registry.remove(conn) is c
+    assert len(registry) == 0 and not registry.by_user
+    assert registry.count(ConnectionRegistry.TCP) == 0
+    assert registry.remove(conn) is None
@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+from mini_messenger.server.disk_log import DiskHistoryStore
+from mini_messenger.server.history import HistoryStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _seqs(records):
+    return [r.seq for r in records]
+
+
+@pytest.mark.parametrize('segment_size, index_interval', [
+    (64 * 1024 * 1024, 4096),  # один сегмент, одна точка индекса
+    (2048, 256),               # много сегментов и точек индекса
+])
+def test_page_skips_expired_prefix(tmp_path, segment_size, index_interval):
+    clock = Clock()
+    disk = DiskHistoryStore(str(tmp_path), max_age=50, fsync='never', clock=clock,
+                            segment_size=segment_size, index_interval=index_interval)
+    memory = HistoryStore(max_age=50, clock=clock)
+    for store in (disk, memory):
+        for i in range(300):
+            store.append(1, 'alice', b'old %d' % i)
+    clock.now += 100
+    for store in (disk, memory):
+        for i in range(5):
+            store.append(1, 'bob', b'new %d' % i)
+
+    assert _seqs(disk.page(1, after=0, limit=128)) == [301, 302, 303, 304, 305]
+    for kwargs in ({'after': 0, 'limit': 2}, {'after': 302, 'limit': 128},
+                   {'after': 0, 'before': 304, 'limit': 128}, {'limit': 3},
+                   {'before': 303, 'limit': 10}, {'after': 305, 'limit': 10}):
+        assert _seqs(disk.page(1, **kwargs)) == _seqs(memory.page(1, **kwargs)), kwargs
+    disk.close()
+
+
+def test_page_everything_expired(tmp_path):
+    clock = Clock()
+    disk = DiskHistoryStore(str(tmp_path), max_age=50, fsync='never', clock=clock)
+    for i in range(10):
+        disk.append(1, 'alice', b'x')
+    clock.now += 100
+    assert disk.page(1, after=0, limit=128) == []
+    assert disk.page(1, limit=128) == []
+    disk.close()
+
+
+def test_page_fills_limit_past_max_messages(tmp_path):
+    disk = DiskHistoryStore(str(tmp_path), max_messages=10, fsync='never')
+    memory = HistoryStore(max_messages=10)
+    for store in (disk, memory):
+        for i in range(25):
+            store.append(1, 'alice', b'%d' % i)
+    assert _seqs(disk.page(1, after=0, limit=4)) == _seqs(memory.page(1, after=0, limit=4)) \
+        == [16, 17, 18, 19]
+    disk.close()
+
+
+@pytest.mark.parametrize('cut', [1, 7, 30])
+def test_recover_torn_tail(tmp_path, cut):
+    disk = DiskHistoryStore(str(tmp_path), fsync='never')
+    for i in range(10):
+        disk.append(1, 'alice', b'message %d' % i)
+    disk.close()
+
+    # запись оборвана посередине: отрезаем часть последней
+    chat_dir = os.path.join(str(tmp_path), '1')
+    (segment,) = [n for n in os.listdir(chat_dir) if n.endswith('.log')]
+    path = os.path.join(chat_dir, segment)
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        f.truncate(size - cut)
+
+    disk = DiskHistoryStore(str(tmp_path), fsync='never')
+    assert disk.last_seq(1) == 9
+    records = disk.page(1, after=0, limit=128)
+    assert _seqs(records) == list(range(1, 10))
+    assert records[-1].data == b'message 8'
+    assert disk.append(1, 'bob', b'after crash') == 10
+    assert disk.page(1, after=9, limit=10)[0].data == b'after crash'
+    disk.close()
+
+    disk = DiskHistoryStore(str(tmp_path), fsync='never')
+    assert _seqs(disk.page(1, after=0, limit=128)) == list(range(1, 11))
+    disk.close()
+
+
+def test_recover_garbage_tail(tmp_path):
+    disk = DiskHistoryStore(str(tmp_path), fsync='never')
+    for i in range(5):
+        disk.append(1, 'alice', b'message %d' % i)
+    disk.close()
+
+    chat_dir = os.path.join(str(tmp_path), '1')
+    (segment,) = [n for n in os.listdir(chat_dir) if n.endswith('.log')]
+    with open(os.path.join(chat_dir, segment), 'ab') as f:
+        f.write(b'\x00\x00\x00\x40garbage that is not a record')
+
+    disk = DiskHistoryStore(str(tmp_path), fsync='never')
+    assert disk.last_seq(1) == 5
+    assert _seqs(disk.page(1, after=0, limit=128)) == [1, 2, 3, 4, 5]
+    disk.close()
@@ -0,0 +1,61 @@
+import pytest
+
+from mini_messenger.protocol.framing import FrameDecoder
+from mini_messenger.protocol.packet import _HEADER
+
+
+def _frame(n: int, size: int) -> bytes:
+    payload = bytes((n % 256,)) * size
+    return _HEADER.pack(1, 2, 0, n, len(payload)) + payload
+
+
+def _stream(count: int = 50) -> tuple:
+    frames = [_frame(i, i * 7 % 300) for i in range(count)]
+    return frames, b''.join(frames)
+
+
+def _feed(decoder, chunks) -> list:
+    out = []
+    for chunk in chunks:
+        out.extend(bytes(f) for f in decoder.feed(chunk))
+    return out
+
+
+@pytest.mark.parametrize('step', [1, 5, 11, 12, 13, 100, 4096])
+def test_split_anywhere(step):
+    frames, data = _stream()
+    decoder = FrameDecoder()
+    chunks = [data[i:i + step] for i in range(0, len(data), step)]
+    assert _feed(decoder, chunks) == frames
+    assert decoder.pending == 0
+    assert decoder.frames_decoded == len(frames)
+
+
+def test_copies_only_what_completes_the_frame():
+    # кадры по 132 байта, чтения по 4096: каждый кусок обрывает кадр посередине
+    frames = [_frame(i, 120) for i in range(2000)]
+    data = b''.join(frames)
+    decoder = FrameDecoder()
+    chunks = [data[i:i + 4096] for i in range(0, len(data), 4096)]
+    assert _feed(decoder, chunks) == frames
+    # в буфер попадает только дособираемый кадр: не больше 132 байт на кусок
+    assert decoder.bytes_copied <= 2 * 132 * len(chunks)
+    assert decoder.bytes_copied / len(frames) < 10
+
+
+def test_empty_payload_after_split_header():
+    frames = [_frame(1, 0), _frame(2, 0), _frame(3, 10)]
+    data = b''.join(frames)
+    decoder = FrameDecoder()
+    assert _feed(decoder, [data[:5], data[5:17], data[17:]]) == frames
+
+
+def test_frame_too_large():
+    decoder = FrameDecoder(max_payload=100)
+    frame = _frame(1, 101)
+    with pytest.raises(ValueError):
+        decoder.feed(frame)
+    decoder = FrameDecoder(max_payload=100)
+    decoder.feed(frame[:5])
+    with pytest.raises(ValueError):
+        decoder.feed(frame[5:])
@@ -0,0 +1,70 @@
+import pytest
+
+from mini_messenger.server.history import HistoryStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _seqs(records):
+    return [r.seq for r in records]
+
+
+def test_keeps_last_max_messages():
+    store = HistoryStore(max_messages=5)
+    for i in range(200):  # с обрезкой головы пачками (COMPACT_MIN)
+        assert store.append(1, f"user_{i % 3}", b'%d' % i) == i + 1
+    assert store.count(1) == 5 and store.last_seq(1) == 200
+    records = store.page(1, after=0)
+    assert _seqs(records) == [196, 197, 198, 199, 200]
+    assert [r.data for r in records] == [b'195', b'196', b'197', b'198', b'199']
+    assert records[0].sender == 'user_0' and records[1].sender == 'user_1'
+
+
+def test_max_age_trims_on_append_read_and_trim_expired():
+    clock = Clock()
+    store = HistoryStore(max_age=60, clock=clock)
+    store.append(1, 'a', b'old')
+    store.append(2, 'a', b'idle chat')
+    clock.now += 30
+    store.append(1, 'a', b'fresh')
+    clock.now += 40  # первое сообщение старше 60 с, второе — нет
+    assert _seqs(store.page(1)) == [2]
+    assert store.count(2) == 1  # простаивающий чат чистит только trim_expired
+    store.trim_expired()
+    assert store.count(2) == 0 and store.last_seq(2) == 1
+    # нумерация не сбрасывается после обрезки
+    assert store.append(2, 'a', b'again') == 2
+
+
+@pytest.mark.parametrize('kwargs, expected', [
+    ({'after': 3, 'limit': 2}, [4, 5]),
+    ({'after': 8, 'limit': 5}, [9, 10]),
+    ({'after': 10}, []),
+    ({'limit': 3}, [8, 9, 10]),
+    ({'before': 5, 'limit': 2}, [3, 4]),
+    ({'after': 2, 'before': 5}, [3, 4]),
+    ({'limit': 0}, []),
+])
+def test_page(kwargs, expected):
+    store = HistoryStore()
+    for i in range(10):
+        store.append(1, 'a', b'x')
+    assert _seqs(store.page(1, **kwargs)) == expected
+    assert store.page(2, after=0) == []
+
+
+def test_explicit_seq_and_flags():
+    store = HistoryStore()
+    assert store.append(1, 'a', b'x', seq=10) == 10
+    assert store.append(1, 'b', b'y', encrypted=True) == 11
+    with pytest.raises(ValueError):
+        store.append(1, 'a', b'z', seq=11)
+    assert [r.encrypted for r in store.page(1, after=0)] == [False, True]
+    store.drop(1)
+    assert store.last_seq(1) == 0 and store.page(1) == []
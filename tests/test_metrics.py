@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from mini_messenger.server import metrics
+from mini_messenger.server.metrics import Metrics
+
+
+async def _get(port: int, path: str) -> bytes:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f"GET {path} HTTP/1.0\r\n\r\n".encode())
+    body = await reader.read()
+    writer.close()
+    return body
+
+
+@pytest.mark.parametrize('interval, used', [('0', 0.001), ('-5', 0.001), ('inf', 1.0),
+                                            ('0.01', 0.01)])
+def test_profile_interval_is_clamped(monkeypatch, interval, used):
+    seen = []
+
+    class Profiler(metrics.SamplingProfiler):
+        def __init__(self, thread_id, interval):
+            seen.append(interval)
+            super().__init__(thread_id, interval)
+
+    monkeypatch.setattr(metrics, 'SamplingProfiler', Profiler)
+
+    async def run():
+        m = Metrics()
+        await m.serve('127.0.0.1', 0)
+        port = m._server.sockets[0].getsockname()[1]
+        response = await _get(port, f"/profile?seconds=0.02&interval={interval}")
+        await m.close()
+        return response
+
+    assert asyncio.run(run()).startswith(b'HTTP/1.0 200 OK')
+    assert seen == [used]
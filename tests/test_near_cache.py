@@ -0,0 +1,45 @@
+from mini_messenger.server.near_cache import NearCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_expires_entries():
+    clock = Clock()
+    cache = NearCache(ttl=30.0, clock=clock)
+    cache.put(1, 'a')
+    clock.now = 29.0
+    assert cache.get(1) == 'a' and cache.peek(1) == 'a'
+    clock.now = 31.0
+    assert cache.peek(1) is None and cache.get(1) is None
+    assert len(cache) == 0
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_lru_eviction_and_peek_does_not_refresh():
+    cache = NearCache(maxsize=2)
+    cache.put(1, 'a')
+    cache.put(2, 'b')
+    cache.peek(1)     # без продления LRU
+    cache.put(3, 'c')
+    assert cache.get(1) is None and cache.get(2) == 'b'
+    cache.get(2)      # get продлевает
+    cache.put(4, 'd')
+    assert cache.get(3) is None and cache.get(2) == 'b'
+    assert cache.evictions == 2
+
+
+def test_invalidate_and_clear():
+    cache = NearCache()
+    cache.put(1, 'a')
+    cache.put(2, 'b')
+    cache.invalidate(1)
+    cache.invalidate(1)  # отсутствующий ключ не считается
+    assert cache.get(1) is None and cache.invalidations == 1
+    cache.clear()
+    assert len(cache) == 0 and cache.invalidations == 2
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from mini_messenger.server.outbound import OutboundQueue
+
+
+class Peer:
+    """Получатель, который не читает, пока не открыт gate."""
+
+    def __init__(self, fail: bool = False):
+        self.gate = asyncio.Event()
+        self.fail = fail
+        self.received = []
+        self.closed = 0
+
+    async def send(self, item):
+        await self.gate.wait()
+        if self.fail:
+            raise ConnectionResetError("peer gone")
+        self.received.append(item)
+
+    def close(self):
+        self.closed += 1
+
+
+async def _drain():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_drop_oldest_keeps_newest():
+    async def run():
+        peer = Peer()
+        q = OutboundQueue(peer.send, peer.close, high_water=3)
+        for i in range(6):
+            assert q.put(i)
+        assert list(q._items) == [3, 4, 5] and q.dropped == 3
+        await _drain()  # писатель взял 3 и ждёт получателя
+        assert q.put(6) and q.depth == 3
+        peer.gate.set()
+        await _drain()
+        assert peer.received == [3, 4, 5, 6]
+        assert q.sent == 4 and q.dropped == 3 and not peer.closed
+        assert q._task is None  # пустая очередь не держит задачу
+
+    asyncio.run(run())
+
+
+def test_combine_sends_backlog_in_one_write():
+    async def run():
+        peer = Peer()
+        q = OutboundQueue(peer.send, peer.close, high_water=10, combine=b''.join)
+        q.put(b'a')
+        await _drain()
+        for item in (b'b', b'c', b'd'):
+            q.put(item)
+        peer.gate.set()
+        await _drain()
+        assert peer.received == [b'a', b'bcd'] and q.sent == 4
+
+    asyncio.run(run())
+
+
+def test_coalesce_merges_instead_of_dropping():
+    async def run():
+        peer = Peer()
+        q = OutboundQueue(peer.send, peer.close, high_water=2, policy=OutboundQueue.COALESCE,
+                          combine=b''.join)
+        for item in (b'1', b'2', b'3', b'4'):
+            assert q.put(item)
+        # 3 не влез: 1, 2, 3 склеены в одну запись, 4 встал за ней
+        assert list(q._items) == [b'123', b'4'] and q.coalesced == 2 and q.dropped == 0
+        peer.gate.set()
+        await _drain()
+        assert peer.received == [b'1234'] and not peer.closed
+
+    asyncio.run(run())
+
+
+def test_coalesce_over_max_bytes_evicts():
+    async def run():
+        peer = Peer()
+        q = OutboundQueue(peer.send, peer.close, high_water=2, policy=OutboundQueue.COALESCE,
+                          combine=b''.join, max_bytes=5)
+        assert q.put(b'123') and q.put(b'45')
+        assert not q.put(b'6')
+        assert q.evicted and q.closed and peer.closed == 1
+        assert not q.put(b'7')
+
+    asyncio.run(run())
+
+
+def test_disconnect_evicts_slow_consumer():
+    async def run():
+        peer = Peer()
+        q = OutboundQueue(peer.send, peer.close, high_water=2, policy=OutboundQueue.DISCONNECT)
+        assert q.put(1) and q.put(2)
+        assert not q.put(3)
+        assert q.evicted and peer.closed == 1 and q.dropped == 2 and q.depth == 0
+        q.evict()  # повторное вытеснение не закрывает дважды
+        assert peer.closed == 1
+        await _drain()
+        assert peer.received == []
+
+    asyncio.run(run())
+
+
+def test_send_error_closes_queue():
+    async def run():
+        peer = Peer(fail=True)
+        q = OutboundQueue(peer.send, peer.close)
+        q.put(b'x')
+        q.put(b'y')
+        peer.gate.set()
+        await _drain()
+        assert q.closed and not q.evicted and peer.closed == 1 and q.depth == 0
+        assert not q.put(b'z')
+
+    asyncio.run(run())
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        OutboundQueue(None, None, policy='block')
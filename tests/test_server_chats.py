@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+
+from mini_messenger.server.cache import RedisCache
+from mini_messenger.server.fanout import FanoutIndex
+from mini_messenger.server.server import MiniServer
+
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    import redis.asyncio as aioredis
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(aioredis, 'from_url',
+                        lambda url, **kw: fakeredis.FakeAsyncRedis(server=server, **kw))
+    return server
+
+
+def test_redis_chats_are_not_pinned_locally(redis_server):
+    async def run():
+        s = MiniServer(redis_url='redis://fake', metrics=False)
+        other = RedisCache(client=fakeredis.FakeAsyncRedis(server=redis_server))
+        other.store_chat(5, {'type': 2, 'name': 'old', 'members': {'alice'}, 'admin': None})
+        await other.flush()
+
+        chat = await s._load_chat(5)
+        assert chat['name'] == 'old'
+        assert await s._join(5, 'bob', object(), FanoutIndex())
+        await s.cache.flush()
+        assert s.storage.chats == {}
+        assert await other.r.smembers('chat:5:members') == {b'alice', b'bob'}
+
+        # правка с другого инстанса видна после инвалидации (или TTL) NearCache
+        other.store_chat(5, {'type': 2, 'name': 'new', 'admin': None})
+        await other.flush()
+        s.cache.local.invalidate(5)
+        assert (await s._load_chat(5))['name'] == 'new'
+        assert not await s._has_chat(6)
+        await other.close()
+        await s.cache.close()
+
+    asyncio.run(run())
+
+
+def test_local_chats_without_redis():
+    async def run():
+        s = MiniServer(metrics=False)
+        assert not await s._has_chat(5)
+        s._save_chat(5, {'type': 2, 'name': 'x', 'members': {'alice'}, 'admin': None})
+        assert await s._join(5, 'bob', object(), FanoutIndex())
+        assert s.storage.chats[5]['members'] == {'alice', 'bob'}
+
+    asyncio.run(run())
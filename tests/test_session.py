@@ -0,0 +1,40 @@
+from mini_messenger.client.session import Session
+from mini_messenger.crypto.keys import KeyManager
+
+
+def _session():
+    return Session(identity=KeyManager.generate_keypair())
+
+
+def test_live_messages_advance_last_seq():
+    s = _session()
+    assert s.seen(1, 1) and s.seen(1, 3)
+    assert s.last_seq == {1: 3}
+    assert s.seen(1, 2)  # вне догрузки не отбрасывается, last_seq не откатывается
+    assert s.last_seq == {1: 3}
+
+
+def test_sync_dedupes_live_and_history_copies():
+    s = _session()
+    s.seen(1, 5)
+    assert s.begin_sync(1) == 5
+    # вживую пришло 9, страница истории отдаёт 6..9
+    assert s.seen(1, 9)
+    assert s.last_seq[1] == 5  # до ответа SYNC в истории пробел 6..8
+    assert [s.seen(1, seq) for seq in (6, 7, 8, 9)] == [True, True, True, False]
+    assert s.synced(1, through=8, more=True)
+    assert s.last_seq[1] == 8
+    assert not s.seen(1, 9)  # дубль и на второй странице
+    assert not s.synced(1, through=9, more=False)
+    assert s.last_seq[1] == 9
+    # догрузка закончена: снова обычный режим
+    assert s.seen(1, 10) and s.last_seq[1] == 10
+
+
+def test_sync_end_takes_live_seq_past_through():
+    s = _session()
+    s.begin_sync(2)
+    s.seen(2, 4)  # пришло вживую, когда страница уже собрана
+    assert not s.synced(2, through=3, more=False)
+    assert s.last_seq[2] == 4
+    assert s.begin_sync(2) == 4
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+from mini_messenger.crypto.e2ee import E2EE
+from mini_messenger.crypto.keys import KeyManager
+from mini_messenger.protocol.framing import FrameDecoder
+from mini_messenger.protocol.packet import Packet, SYNC_REPLY, SYNC_REQUEST
+from mini_messenger.protocol.types import ChatType, MessageType, PacketFlag
+from mini_messenger.server.connections import ConnectionRegistry
+from mini_messenger.server.server import MiniServer
+
+
+class Outbound(list):
+    def put(self, data):
+        self.append(data)
+
+
+def _server(chat_type=ChatType.GROUP):
+    s = MiniServer(metrics=False)
+    conn = object()
+    c = s.connections.add(conn, ConnectionRegistry.TCP)
+    c.outbound = Outbound()
+    s._save_chat(7, {'type': chat_type, 'name': 'x', 'members': {c.user_id}, 'admin': None})
+    return s, conn, c
+
+
+def test_encrypted_group_message_replayed_as_encrypted():
+    async def run():
+        s, conn, c = _server()
+        ciphertext = b'\x8f\x00opaque ciphertext bytes \xff'
+        frame = Packet.pack(PacketFlag.ENCRYPTED, MessageType.TEXT, ChatType.GROUP, 7, ciphertext)
+        await s._handle_frame(c.user_id, conn, memoryview(frame), Packet.unpack(frame))
+        s.storage.history.append(7, c.user_id, 'открыто'.encode(), False)
+        assert [r.encrypted for r in s.storage.history.page(7, after=0)] == [True, False]
+
+        await s._sync(c.user_id, conn, 7, SYNC_REQUEST.pack(0, 10))
+        (page,) = c.outbound
+        secret, plain, reply = [Packet.unpack(f) for f in FrameDecoder().feed(page)]
+        assert secret[0] & PacketFlag.ENCRYPTED and bytes(secret[4]) == ciphertext
+        assert not plain[0] & PacketFlag.ENCRYPTED
+        assert bytes(plain[4]).decode() == 'открыто'
+        assert SYNC_REPLY.unpack(reply[4]) == (2, False)
+
+    asyncio.run(run())
+
+
+def test_private_message_stored_decrypted_and_unflagged():
+    async def run():
+        s, conn, c = _server(ChatType.PRIVATE)
+        c.private_key, c.public_key = KeyManager.generate_keypair()
+        client_private, c.peer_key = KeyManager.generate_keypair()
+        secret = KeyManager.derive_shared_secret(client_private, c.public_key)
+        frame = Packet.pack(PacketFlag.ENCRYPTED, MessageType.TEXT, ChatType.PRIVATE, 7,
+                            E2EE.encrypt('привет'.encode(), secret))
+        await s._handle_frame(c.user_id, conn, memoryview(frame), Packet.unpack(frame))
+        (r,) = s.storage.history.page(7, after=0)
+        assert r.data == 'привет'.encode() and not r.encrypted
+
+        await s._sync(c.user_id, conn, 7, SYNC_REQUEST.pack(0, 10))
+        flags, *_, payload = Packet.unpack(FrameDecoder().feed(c.outbound[0])[0])
+        assert not flags & PacketFlag.ENCRYPTED and bytes(payload) == 'привет'.encode()
+
+    asyncio.run(run())
+
+
+def test_json_sync_skips_ciphertext():
+    async def run():
+        s, conn, c = _server()
+        s.storage.history.append(7, 'user_x_1', b'\x8f\xffsecret', True)
+        s.storage.history.append(7, 'user_x_1', b'hello', False)
+        await s._sync_json(c.user_id, conn, {'action': 'sync', 'chat_id': 7, 'after': 0})
+        messages = [json.loads(m) for m in c.outbound]
+        assert [m.get('text') for m in messages] == ['hello', None]
+        assert messages[-1] == {'action': 'sync', 'chat_id': 7, 'through': 2, 'more': False}
+
+    asyncio.run(run())
+
+
+def test_json_sync_ignores_bad_after_and_limit():
+    async def run():
+        s, conn, c = _server()
+        s.storage.history.append(7, 'user_x_1', b'hello', False)
+        for bad in ({'after': '1'}, {'after': [1]}, {'after': -1}, {'after': True},
+                    {'limit': 'all'}, {'limit': 2.5}, {'limit': [5]}, {'after': 2 ** 64}):
+            await s._sync_json(c.user_id, conn, {'action': 'sync', 'chat_id': 7, **bad})
+        assert c.outbound == []
+        await s._sync_json(c.user_id, conn, {'action': 'sync', 'chat_id': 7, 'limit': 0})
+        assert len(c.outbound) == 2
+
+    asyncio.run(run())